@@ -20,9 +20,13 @@ os.makedirs(DATA_DIR, exist_ok=True)
 # Para prototipo, esto funciona bien.
 USUARIOS_FILE = os.path.join(DATA_DIR, "usuarios.json")
 ESTADOS_FILE = os.path.join(DATA_DIR, "estados.json")
+AJUSTES_FILE = os.path.join(DATA_DIR, "ajustes.json")
+
+# Parámetros del detector que se pueden afinar desde aquí (la Raspberry valida los rangos)
+AJUSTES_PERMITIDOS = ("skip_frames", "conf_threshold", "img_size", "cooldown", "check_server_every")
 
 # Crear archivos si no existen
-for f in [USUARIOS_FILE, ESTADOS_FILE]:
+for f in [USUARIOS_FILE, ESTADOS_FILE, AJUSTES_FILE]:
     if not os.path.exists(f):
         with open(f, "w") as file:
             json.dump({}, file)
@@ -226,9 +230,61 @@ def obtener_configuracion():
     else:
         modo = "detenido" # Si todos están en stop o no hay nadie
     
+    respuesta = {"mode": modo}
+
+    # Ajustes en caliente: los globales y encima los del sitio que consulta
+    ajustes = cargar_json(AJUSTES_FILE)
+    if ajustes.get("version"):
+        sitio = request.args.get("site")
+        params = dict(ajustes.get("global", {}))
+        if sitio:
+            params.update(ajustes.get("sitios", {}).get(sitio, {}))
+        respuesta["tuning"] = {"version": ajustes["version"], "params": params}
+
     # Log para debug en Railway
     app.logger.info(f"📡 Robot consulta config -> Modo: {modo}")
-    return jsonify({"mode": modo})
+    return jsonify(respuesta)
+
+@app.route("/config/tuning", methods=["GET", "POST"])
+def ajustar_detector():
+    """
+    Ver o cambiar los ajustes del detector. POST con
+    {"params": {"skip_frames": 3}, "site": "costa_norte"} (sin "site" = todos los sitios).
+    Un valor null quita el parámetro (la Raspberry vuelve a su valor por defecto).
+    """
+    if request.headers.get("X-ALERTA-KEY") != ALERTA_KEY:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    ajustes = cargar_json(AJUSTES_FILE)
+    if request.method == "GET":
+        return jsonify(ajustes), 200
+
+    try:
+        data = request.get_json(force=True)
+        params = data.get("params", {})
+        sitio = data.get("site")
+        if not isinstance(params, dict):
+            raise ValueError("params debe ser un objeto")
+    except:
+        return jsonify({"error": "bad request"}), 400
+
+    desconocidos = [k for k in params if k not in AJUSTES_PERMITIDOS]
+    if desconocidos:
+        return jsonify({"error": f"parámetros no permitidos: {desconocidos}"}), 400
+
+    destino = ajustes.setdefault("sitios", {}).setdefault(sitio, {}) if sitio else ajustes.setdefault("global", {})
+    for clave, valor in params.items():
+        if valor is None:
+            destino.pop(clave, None)
+        else:
+            destino[clave] = valor
+    # Cada cambio sube la versión: así la Raspberry sabe que tiene que aplicar
+    ajustes["version"] = int(ajustes.get("version", 0)) + 1
+    ajustes["fecha_cambio"] = datetime.now().isoformat()
+    guardar_json(AJUSTES_FILE, ajustes)
+
+    app.logger.info(f"🎛️ Ajustes v{ajustes['version']} ({sitio or 'global'}): {params}")
+    return jsonify({"status": "ok", "version": ajustes["version"]}), 200
 
 # -----------------------
 # Endpoint Alerta (Recibe de Raspberry)
@@ -248,16 +304,31 @@ def recibir_alerta():
         cantidad = data.get("cantidad", 1)
         imagen_url = data.get("imagen")
         mensaje_prefix = data.get("mensaje_prefix", "🔔 *DETECCIÓN CONFIRMADA*")
+        individuos = data.get("individuos")
+        tipo = data.get("tipo")
     except:
         return jsonify({"error": "bad request"}), 400
 
     usuarios = cargar_json(USUARIOS_FILE)
+    if tipo == "evidencia":
+        # Foto de una alerta urgente que ya salió solo con texto
+        if not imagen_url:
+            return jsonify({"error": "falta imagen"}), 400
+        hora = data.get("hora") or datetime.now().strftime('%H:%M:%S')
+        texto = f"{mensaje_prefix}\n📸 _Evidencia de la alerta de las {hora}_"
+        if data.get("clip"):
+            # El video queda en la SD de la unidad; aquí solo viaja la hoja de contactos
+            texto += f"\n🎞️ _Clip en la unidad: {os.path.basename(data['clip'])}_"
+        enviados = sum(1 for numero in usuarios.keys() if enviar_whatsapp(numero, texto, media_url=imagen_url))
+        return jsonify({"status": "ok", "enviados": enviados}), 200
+
     texto = (
         f"{mensaje_prefix}\n"
         "─────────────────────\n"
         f"📍 *Especie:* {especie.upper()}\n"
         f"🔢 *Cantidad:* {cantidad}\n"
-        f"🕐 *Hora:* {datetime.now().strftime('%H:%M:%S')}\n"
+        + (f"🆔 *Individuos distintos:* {individuos}\n" if individuos is not None else "")
+        + f"🕐 *Hora:* {datetime.now().strftime('%H:%M:%S')}\n"
         "─────────────────────"
     )
     if imagen_url: texto += "\n📸 _Evidencia adjunta:_"
@@ -0,0 +1,74 @@
+"""
+Ajustes en caliente desde el servidor - Ñawi Apu
+
+SKIP_FRAMES, CONF_THRESHOLD, IMG_SIZE, el cooldown y cada cuánto se consulta
+el servidor eran constantes: afinar un Pi instalado era SSH y reinicio. Ahora
+/config puede traer un bloque versionado de ajustes y el detector los aplica
+entre dos frames, sin cortar la captura ni recargar modelos.
+
+    GET /config?site=costa_norte ->
+        {"mode": "tortugas",
+         "tuning": {"version": 7, "params": {"skip_frames": 3, "conf_threshold": 0.55}}}
+
+Los parámetros que no vienen vuelven al valor de las constantes del detector.
+Los desconocidos o fuera de rango se ignoran (con aviso), nunca se aplican.
+"""
+from collections import namedtuple
+
+# Bloque ya validado. El poller lo publica dentro de su snapshot, así que es inmutable.
+Ajustes = namedtuple("Ajustes", ["version", "valores"])
+SIN_AJUSTES = Ajustes(0, ())
+
+# nombre -> (tipo, mínimo, máximo)
+PARAMETROS = {
+    "skip_frames": (int, 1, 60),
+    "conf_threshold": (float, 0.05, 0.99),
+    "img_size": (int, 160, 1280),
+    "cooldown": (float, 0.0, 3600.0),
+    "check_server_every": (float, 1.0, 300.0),
+}
+
+
+def validar(params):
+    """
+    Filtra y convierte los parámetros recibidos.
+
+    Returns:
+        tuple: Pares (nombre, valor) ordenados, solo con los válidos.
+    """
+    limpios = {}
+    for nombre, valor in (params or {}).items():
+        if nombre not in PARAMETROS:
+            print(f"⚠️ Ajuste desconocido ignorado: {nombre}")
+            continue
+        tipo, minimo, maximo = PARAMETROS[nombre]
+        try:
+            valor = tipo(valor)
+        except (TypeError, ValueError):
+            print(f"⚠️ Ajuste {nombre} con valor inválido ignorado: {valor!r}")
+            continue
+        if not minimo <= valor <= maximo:
+            print(f"⚠️ Ajuste {nombre}={valor} fuera de rango [{minimo}, {maximo}], ignorado")
+            continue
+        if nombre == "img_size":
+            valor = max(32, valor // 32 * 32)  # YOLO trabaja en múltiplos de 32
+        limpios[nombre] = valor
+    return tuple(sorted(limpios.items()))
+
+
+def leer_bloque(datos):
+    """
+    Extrae el bloque "tuning" de la respuesta de /config.
+
+    Returns:
+        Ajustes, o None si la respuesta no trae un bloque válido.
+    """
+    bloque = datos.get("tuning") if isinstance(datos, dict) else None
+    if not isinstance(bloque, dict):
+        return None
+    try:
+        version = int(bloque.get("version", 0))
+    except (TypeError, ValueError):
+        return None
+    params = bloque.get("params")
+    return Ajustes(version, validar(params if isinstance(params, dict) else {}))
@@ -0,0 +1,226 @@
+"""
+Backends de inferencia optimizados para CPU - Ñawi Apu
+
+PyTorch es la opción más lenta en ARM. Cada modelo de especie se exporta una
+sola vez a ONNX / OpenVINO / NCNN (el artefacto queda junto al .pt) y al
+arrancar se mide cuál runtime instalado es el más rápido.
+
+Todos los backends se cargan con ultralytics.YOLO, así que el letterbox y el
+NMS son exactamente los mismos que en el camino PyTorch; solo cambia el motor
+que ejecuta la red. La paridad de cajas se verifica con:
+
+    python -m src.backends --paridad
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+import importlib.util
+import numpy as np
+from ultralytics import YOLO
+
+# nombre -> (módulo python requerido, artefacto exportado a partir de "<especie>")
+BACKENDS = {
+    "pytorch": ("torch", "{especie}.pt"),
+    "onnx": ("onnxruntime", "{especie}.onnx"),
+    "openvino": ("openvino", "{especie}_openvino_model"),
+    "ncnn": ("ncnn", "{especie}_ncnn_model"),
+}
+
+# Exportamos con entrada dinámica donde el runtime lo soporta, para que el
+# planificador pueda seguir cambiando imgsz.
+EXPORT_DINAMICO = {"onnx", "openvino"}
+
+
+def disponible(backend):
+    """True si el runtime del backend está instalado."""
+    modulo, _ = BACKENDS[backend]
+    return importlib.util.find_spec(modulo) is not None
+
+
+def admite_imgsz_variable(backend):
+    return backend == "pytorch" or backend in EXPORT_DINAMICO
+
+
+def ruta_artefacto(ruta_pt, backend):
+    carpeta = os.path.dirname(ruta_pt)
+    especie = os.path.splitext(os.path.basename(ruta_pt))[0]
+    return os.path.join(carpeta, BACKENDS[backend][1].format(especie=especie))
+
+
+def exportar(ruta_pt, backend, imgsz=640):
+    """
+    Exporta el .pt al formato del backend si todavía no existe.
+
+    Returns:
+        str: Ruta del artefacto, o None si la exportación falló.
+    """
+    destino = ruta_artefacto(ruta_pt, backend)
+    if backend == "pytorch" or os.path.exists(destino):
+        return destino
+    print(f"🛠️ Exportando {os.path.basename(ruta_pt)} a {backend} (solo la primera vez)...")
+    try:
+        YOLO(ruta_pt).export(format=backend, imgsz=imgsz,
+                             dynamic=backend in EXPORT_DINAMICO, verbose=False)
+    except Exception as e:
+        print(f"❌ No se pudo exportar a {backend}: {e}")
+        return None
+    return destino if os.path.exists(destino) else None
+
+
+def cargar(ruta_pt, backend, imgsz=640):
+    """Carga el modelo con el backend pedido (exportando si hace falta)."""
+    ruta = exportar(ruta_pt, backend, imgsz)
+    if ruta is None:
+        return None
+    return YOLO(ruta, task="detect")
+
+
+def medir(modelo, imgsz=640, repeticiones=5, forma=(480, 640, 3)):
+    """Segundos promedio por predict() sobre un frame vacío (tras una pasada de calentamiento)."""
+    frame = np.zeros(forma, dtype=np.uint8)
+    modelo.predict(source=frame, imgsz=imgsz, device="cpu", verbose=False)
+    t0 = time.monotonic()
+    for _ in range(repeticiones):
+        modelo.predict(source=frame, imgsz=imgsz, device="cpu", verbose=False)
+    return (time.monotonic() - t0) / repeticiones
+
+
+def elegir_backend(ruta_pt, candidatos=("onnx", "openvino", "ncnn", "pytorch"), imgsz=640):
+    """
+    Carga cada backend disponible, mide su latencia y se queda con el más rápido.
+
+    Returns:
+        tuple: (nombre_backend, modelo, segundos_por_predict). Si ningún
+        backend optimizado funciona se usa PyTorch.
+    """
+    mejor = None
+    for backend in candidatos:
+        if not disponible(backend):
+            continue
+        try:
+            modelo = cargar(ruta_pt, backend, imgsz)
+            if modelo is None:
+                continue
+            segundos = medir(modelo, imgsz)
+        except Exception as e:
+            print(f"⚠️ Backend {backend} descartado: {e}")
+            continue
+        print(f"⏱️ {os.path.basename(ruta_pt)} en {backend}: {segundos * 1000:.0f} ms")
+        if mejor is None or segundos < mejor[2]:
+            mejor = (backend, modelo, segundos)
+
+    if mejor is None:
+        return "pytorch", YOLO(ruta_pt), None
+    return mejor
+
+
+# -----------------------
+# Verificación de paridad contra PyTorch
+# -----------------------
+def _cajas(modelo, imagen, imgsz, conf):
+    r = modelo.predict(source=imagen, imgsz=imgsz, conf=conf, device="cpu", verbose=False)[0]
+    return (r.boxes.xyxy.cpu().numpy(), r.boxes.conf.cpu().numpy(),
+            r.boxes.cls.cpu().numpy().astype(int))
+
+
+def _iou(a, b):
+    x1, y1 = np.maximum(a[:2], b[:2])
+    x2, y2 = np.minimum(a[2:], b[2:])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def comparar(referencia, candidato, iou_min=0.95, tolerancia_conf=0.05):
+    """True si cada caja de referencia tiene su par (misma clase, IoU y confianza parecidas)."""
+    cajas_r, conf_r, cls_r = referencia
+    cajas_c, conf_c, cls_c = candidato
+    if len(cajas_r) != len(cajas_c):
+        return False
+    usadas = set()
+    for i in range(len(cajas_r)):
+        par = None
+        for j in range(len(cajas_c)):
+            if j in usadas or cls_c[j] != cls_r[i]:
+                continue
+            if _iou(cajas_r[i], cajas_c[j]) >= iou_min and abs(conf_r[i] - conf_c[j]) <= tolerancia_conf:
+                par = j
+                break
+        if par is None:
+            return False
+        usadas.add(par)
+    return True
+
+
+def verificar_paridad(carpeta_modelos, carpetas_imagenes, imgsz=640, conf=0.25, limite=None):
+    """
+    Corre cada backend disponible contra PyTorch sobre las capturas guardadas.
+
+    Returns:
+        bool: True si todos los backends coinciden en todas las imágenes. False
+            también si no hubo nada que comparar (sin imágenes, sin modelos o sin
+            ningún backend además de PyTorch): una paridad no verificada no pasa.
+    """
+    import cv2
+
+    imagenes = []
+    for carpeta in carpetas_imagenes:
+        imagenes += sorted(glob.glob(os.path.join(carpeta, "*.jpg")))
+    imagenes = imagenes[:limite] if limite else imagenes
+    if not imagenes:
+        print("❌ No hay imágenes para comparar.")
+        return False
+    modelos = sorted(glob.glob(os.path.join(carpeta_modelos, "*.pt")))
+    if not modelos:
+        print(f"❌ No hay modelos .pt en {carpeta_modelos}.")
+        return False
+
+    todo_ok = True
+    comparados = 0
+    for ruta_pt in modelos:
+        referencia = YOLO(ruta_pt)
+        esperadas = [_cajas(referencia, cv2.imread(ruta), imgsz, conf) for ruta in imagenes]
+        for backend in BACKENDS:
+            if backend == "pytorch" or not disponible(backend):
+                continue
+            modelo = cargar(ruta_pt, backend, imgsz)
+            comparados += 1
+            if modelo is None:
+                todo_ok = False
+                continue
+            distintas = [ruta for ruta, esperado in zip(imagenes, esperadas)
+                         if not comparar(esperado, _cajas(modelo, cv2.imread(ruta), imgsz, conf))]
+            estado = "✅" if not distintas else "❌"
+            print(f"{estado} {os.path.basename(ruta_pt)} {backend}: "
+                  f"{len(imagenes) - len(distintas)}/{len(imagenes)} imágenes idénticas")
+            for ruta in distintas[:5]:
+                print(f"   ↳ difiere: {os.path.basename(ruta)}")
+            todo_ok = todo_ok and not distintas
+    if not comparados:
+        print("❌ No hay backends instalados además de PyTorch: nada que comparar.")
+        return False
+    return todo_ok
+
+
+if __name__ == "__main__":
+    PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    parser = argparse.ArgumentParser(description="Exportar modelos y verificar backends de inferencia")
+    parser.add_argument("--exportar", action="store_true", help="Exportar todos los modelos a los backends instalados")
+    parser.add_argument("--paridad", action="store_true", help="Comparar cajas de cada backend contra PyTorch")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--limite", type=int, default=None, help="Máximo de imágenes a comparar")
+    args = parser.parse_args()
+
+    carpeta_modelos = os.path.join(PROJECT_DIR, "modelos")
+    if args.exportar:
+        for ruta_pt in sorted(glob.glob(os.path.join(carpeta_modelos, "*.pt"))):
+            for backend in BACKENDS:
+                if backend != "pytorch" and disponible(backend):
+                    exportar(ruta_pt, backend, args.imgsz)
+    if args.paridad:
+        carpetas = [os.path.join(PROJECT_DIR, "images", "capturas"),
+                    os.path.join(PROJECT_DIR, "detecciones")]
+        ok = verificar_paridad(carpeta_modelos, carpetas, imgsz=args.imgsz, limite=args.limite)
+        sys.exit(0 if ok else 1)
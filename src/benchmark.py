@@ -0,0 +1,474 @@
+"""
+Benchmark de punta a punta del pipeline de detección - Ñawi Apu
+
+Reproduce las capturas archivadas (images/capturas y detecciones/) por las
+mismas piezas que usa el detector: carga del modelo, predict(), dibujo de
+cajas, codificación JPEG y envío de alerta. Railway y GitHub se reemplazan
+por un servidor HTTP local, así no se sube nada ni se manda ningún WhatsApp.
+
+Mide latencia p50/p95/p99 por etapa, frames por segundo, RSS pico y tiempo
+de CPU, para una matriz de IMG_SIZE x SKIP_FRAMES x CONF_THRESHOLD.
+
+    python -m src.benchmark --imgsz 320,640 --skip 1,4 --conf 0.6 --salida bench.json
+    python -m src.benchmark --guardar-base benchmarks/base.json
+    python -m src.benchmark --comparar benchmarks/base.json
+    python -m src.benchmark --asignaciones --limite 300
+    python -m src.benchmark --camino-alerta --limite 50 --latencia-red 80
+
+Cada configuración corre en un proceso aparte para que el RSS pico sea suyo.
+Con --asignaciones solo se mide la memoria reservada por frame en el camino
+de captura y vista (antes: arreglo nuevo + cvtColor; ahora: pool + copia a
+un buffer reutilizado), sin modelo ni red. Con --camino-alerta se mide la
+latencia de la alerta desde el frame anotado hasta la URL de GitHub (antes:
+imwrite a la SD + releer el archivo; ahora: imencode en memoria y archivo
+local en segundo plano), escribiendo en la misma tarjeta que images/capturas.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tracemalloc
+import tempfile
+import itertools
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
+MODELS_DIR = os.path.join(PROJECT_DIR, "modelos")
+CARPETAS_CAPTURAS = [os.path.join(PROJECT_DIR, "images", "capturas"),
+                     os.path.join(PROJECT_DIR, "detecciones")]
+
+ETAPAS = ("carga_modelo", "captura", "predict", "anotacion", "jpeg", "alerta")
+
+
+# -----------------------
+# Servidor local que imita a Railway y a la API de GitHub
+# -----------------------
+class _ManejadorSimulado(BaseHTTPRequestHandler):
+    # Conexiones persistentes, como Railway y GitHub (el transporte las reusa)
+    protocol_version = "HTTP/1.1"
+    latencia = 0.0
+    handshake = 0.0
+    modo = "tortugas"
+
+    def setup(self):
+        # Una instancia por conexión: el costo de TCP + TLS se paga solo al abrirla
+        super().setup()
+        time.sleep(self.handshake)
+
+    def _responder(self, codigo, datos):
+        cuerpo = json.dumps(datos).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _leer_cuerpo(self):
+        largo = int(self.headers.get("Content-Length", 0))
+        if largo:
+            self.rfile.read(largo)
+
+    def do_GET(self):
+        time.sleep(self.latencia)
+        if self.path.startswith("/config"):
+            self._responder(200, {"mode": self.modo})
+        else:
+            self._responder(200, {"sha": "0" * 40, "full_name": "local/simulado", "private": False})
+
+    def do_POST(self):
+        self._leer_cuerpo()
+        time.sleep(self.latencia)
+        self._responder(200, {"status": "ok", "enviados": 1})
+
+    def do_PUT(self):
+        self._leer_cuerpo()
+        time.sleep(self.latencia)
+        self._responder(201, {"content": {}})
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_servidor_simulado(latencia=0.0, modo="tortugas"):
+    """
+    Levanta el servidor local en un puerto libre.
+
+    Returns:
+        tuple: (servidor, url_base)
+    """
+    # TLS sobre TCP son ~2 idas y vueltas más antes de la primera solicitud
+    manejador = type("Manejador", (_ManejadorSimulado,),
+                     {"latencia": latencia, "handshake": 2 * latencia, "modo": modo})
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), manejador)
+    threading.Thread(target=servidor.serve_forever, name="servidor-simulado", daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+# -----------------------
+# Estadística
+# -----------------------
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    indice = min(len(valores_ordenados) - 1, max(0, int(round(p / 100 * len(valores_ordenados))) - 1))
+    return valores_ordenados[indice]
+
+
+def resumir(valores):
+    """p50/p95/p99/media en milisegundos."""
+    ordenados = sorted(valores)
+    return {
+        "n": len(ordenados),
+        "media_ms": round(sum(ordenados) / len(ordenados) * 1000, 2) if ordenados else 0.0,
+        "p50_ms": round(percentil(ordenados, 50) * 1000, 2),
+        "p95_ms": round(percentil(ordenados, 95) * 1000, 2),
+        "p99_ms": round(percentil(ordenados, 99) * 1000, 2),
+    }
+
+
+def rss_pico_mb():
+    # En Linux ru_maxrss viene en KB
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+# -----------------------
+# Una configuración
+# -----------------------
+def correr_config(especie, imgsz, skip, conf, backend="pytorch", carpetas=None,
+                  limite=None, latencia_red=0.0, enviar_alertas=True):
+    """
+    Reproduce las capturas con una configuración y devuelve las métricas.
+
+    Returns:
+        dict: Configuración, fps, percentiles por etapa, RSS pico y CPU.
+    """
+    servidor, url = iniciar_servidor_simulado(latencia_red, especie)
+    carpeta_tmp = tempfile.mkdtemp(prefix="nawi_bench_")
+    # Las variables deben existir antes de importar send_alert/github_upload
+    os.environ["RAILWAY_URL"] = url
+    os.environ["GITHUB_API_URL"] = url
+    os.environ.setdefault("GITHUB_TOKEN", "token-simulado")
+
+    import cv2
+    from src.modelos import RegistroModelos
+    from src.fuentes import FuenteDirectorio
+    from src.pipeline import FinDeFuente
+    from src.detecciones import predecir, dibujar
+    from utils import send_alert, github_upload
+    send_alert.IMAGES_DIR = carpeta_tmp  # No ensuciar images/capturas
+    # Si el módulo ya estaba importado (--sin-aislar) apuntamos al servidor nuevo
+    send_alert.RAILWAY_URL = url
+    github_upload.GITHUB_API_URL = url
+    github_upload.GITHUB_TOKEN = github_upload.GITHUB_TOKEN or "token-simulado"
+
+    tiempos = {etapa: [] for etapa in ETAPAS}
+    frames = analizados = con_detecciones = 0
+    cpu_inicio = time.process_time()
+    t_inicio = time.monotonic()
+
+    try:
+        t = time.monotonic()
+        modelo = RegistroModelos(MODELS_DIR, imgsz=imgsz, backend=backend).obtener(especie)
+        tiempos["carga_modelo"].append(time.monotonic() - t)
+        if modelo is None:
+            raise SystemExit(f"No hay modelo para '{especie}' en {MODELS_DIR}")
+
+        fuente = FuenteDirectorio(carpetas or CARPETAS_CAPTURAS, tiempo_real=False)
+        t_reproduccion = time.monotonic()
+        while limite is None or frames < limite:
+            t = time.monotonic()
+            try:
+                frame = fuente.capture_array()
+            except FinDeFuente:
+                break
+            tiempos["captura"].append(time.monotonic() - t)
+            frames += 1
+            if (frames - 1) % skip:
+                continue
+
+            analizados += 1
+            t = time.monotonic()
+            cajas, _ = predecir(modelo, frame, imgsz, conf)
+            tiempos["predict"].append(time.monotonic() - t)
+            if len(cajas) == 0:
+                continue
+            con_detecciones += 1
+
+            t = time.monotonic()
+            anotado = dibujar(frame, cajas, especie.upper(), (0, 255, 0))
+            tiempos["anotacion"].append(time.monotonic() - t)
+
+            t = time.monotonic()
+            cv2.imencode(".jpg", anotado)
+            tiempos["jpeg"].append(time.monotonic() - t)
+
+            if enviar_alertas:
+                t = time.monotonic()
+                send_alert.enviar_alerta(especie, len(cajas), anotado,
+                                         es_amenaza=(especie == "invasores"))
+                tiempos["alerta"].append(time.monotonic() - t)
+        duracion = time.monotonic() - t_reproduccion
+    finally:
+        servidor.shutdown()
+        send_alert.ARCHIVO.vaciar(timeout=10)  # Que el archivo local termine antes de borrar
+        shutil.rmtree(carpeta_tmp, ignore_errors=True)
+
+    return {
+        "config": {"especie": especie, "imgsz": imgsz, "skip": skip, "conf": conf,
+                   "backend": backend, "latencia_red_ms": latencia_red * 1000},
+        "frames": frames,
+        "analizados": analizados,
+        "con_detecciones": con_detecciones,
+        "fps": round(frames / duracion, 2) if duracion > 0 else 0.0,
+        "fps_inferencia": round(analizados / duracion, 2) if duracion > 0 else 0.0,
+        "etapas": {etapa: resumir(v) for etapa, v in tiempos.items()},
+        "rss_pico_mb": rss_pico_mb(),
+        "cpu_s": round(time.process_time() - cpu_inicio, 2),
+        "duracion_s": round(time.monotonic() - t_inicio, 2),
+    }
+
+
+def medir_asignaciones(frames=300, tamano=(640, 480)):
+    """
+    Bytes reservados por frame en captura + vista, camino viejo contra el nuevo.
+
+    Usa la fuente sintética (sin disco ni cámara) y tracemalloc, que también
+    ve las reservas de numpy. Por frame se toma el pico sobre la memoria viva
+    al empezar: es lo que el frame pidió aunque lo haya liberado enseguida.
+
+    Returns:
+        dict: {"antes": bytes/frame, "ahora": bytes/frame, "frames": n}
+    """
+    import cv2
+    import numpy as np
+    from src.fuentes import FuenteSintetica
+    from src.pipeline import PoolFrames
+
+    def camino_viejo(fuente, estado):
+        # capture_array() reserva el frame y cvtColor otro para la vista
+        frame = fuente.capture_array()
+        return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+
+    def camino_nuevo(fuente, estado):
+        if "pool" not in estado:
+            estado["pool"] = PoolFrames(4)
+            estado["pool"].ajustar((tamano[1], tamano[0], 3))
+            estado["vista"] = np.empty((tamano[1], tamano[0], 3), dtype=np.uint8)
+        frame = fuente.capturar_en(estado["pool"].tomar())
+        np.copyto(estado["vista"], frame)
+        estado["pool"].liberar(frame)
+        return estado["vista"]
+
+    resultado = {"frames": frames}
+    for nombre, camino in (("antes", camino_viejo), ("ahora", camino_nuevo)):
+        fuente = FuenteSintetica(tamano=tamano, tiempo_real=False)
+        estado = {}
+        camino(fuente, estado)  # Calentamiento: reservas únicas de la primera vuelta
+        tracemalloc.start()
+        total = 0
+        for _ in range(frames):
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            camino(fuente, estado)
+            total += tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.stop()
+        resultado[nombre] = round(total / frames)
+    return resultado
+
+
+def medir_camino_alerta(frames=50, latencia_red=0.0, carpeta=None, tamano=(640, 480)):
+    """
+    Latencia frame -> URL subida, camino viejo (disco) contra el nuevo (memoria).
+
+    Args:
+        carpeta (str, optional): Dónde escribir los JPEG del camino viejo y del
+            archivo local. Por defecto una subcarpeta de images/capturas, que en
+            el Pi está en la SD.
+        latencia_red (float): Segundos de latencia simulada del servidor.
+
+    Returns:
+        dict: {"antes": resumen, "ahora": resumen, "frames": n, "carpeta": ruta}
+    """
+    import cv2
+    from src.fuentes import FuenteSintetica
+    servidor, url = iniciar_servidor_simulado(latencia_red)
+    os.environ["GITHUB_API_URL"] = url
+    os.environ.setdefault("GITHUB_TOKEN", "token-simulado")
+    from utils import send_alert, github_upload
+    github_upload.GITHUB_API_URL = url
+    github_upload.GITHUB_TOKEN = github_upload.GITHUB_TOKEN or "token-simulado"
+
+    carpeta = carpeta or os.path.join(CARPETAS_CAPTURAS[0], ".benchmark")
+    os.makedirs(carpeta, exist_ok=True)
+    send_alert.IMAGES_DIR = carpeta
+    fuente = FuenteSintetica(tamano=tamano, tiempo_real=False)
+
+    def camino_viejo(frame, i):
+        ruta = os.path.join(carpeta, f"antes_{i}.jpg")
+        cv2.imwrite(ruta, frame)
+        return github_upload.subir_a_github(ruta)
+
+    def camino_nuevo(frame, i):
+        jpeg = send_alert.codificar_jpeg(frame)
+        send_alert.ARCHIVO.archivar(f"ahora_{i}.jpg", jpeg)
+        return github_upload.subir_a_github(jpeg, f"ahora_{i}.jpg")
+
+    resultado = {"frames": frames, "carpeta": carpeta}
+    try:
+        for nombre, camino in (("antes", camino_viejo), ("ahora", camino_nuevo)):
+            tiempos = []
+            for i in range(frames):
+                frame = fuente.capture_array()
+                t = time.monotonic()
+                if camino(frame, i) is None:
+                    raise RuntimeError(f"Falló la subida simulada ({nombre})")
+                tiempos.append(time.monotonic() - t)
+            resultado[nombre] = resumir(tiempos)
+    finally:
+        servidor.shutdown()
+        send_alert.ARCHIVO.vaciar(timeout=10)  # Que el archivo local termine antes de borrar
+        shutil.rmtree(carpeta, ignore_errors=True)
+    return resultado
+
+
+def correr_aislado(config):
+    """
+    Corre una configuración en un proceso hijo y devuelve su JSON. El hijo lo
+    escribe en un archivo aparte: por stdout pueden salir prints de otros hilos
+    (archivo local, alertas) después del resultado.
+    """
+    descriptor, ruta_resultado = tempfile.mkstemp(prefix="nawi_bench_", suffix=".json")
+    os.close(descriptor)
+    try:
+        proceso = subprocess.run(
+            [sys.executable, "-m", "src.benchmark", "--una", json.dumps(config),
+             "--resultado", ruta_resultado],
+            cwd=PROJECT_DIR, capture_output=True, text=True
+        )
+        if proceso.returncode != 0:
+            print(proceso.stdout + proceso.stderr, file=sys.stderr)
+            raise RuntimeError(f"Falló la configuración {config}")
+        with open(ruta_resultado) as f:
+            return json.load(f)
+    finally:
+        os.remove(ruta_resultado)
+
+
+# -----------------------
+# Comparación contra una base guardada
+# -----------------------
+def _clave(resultado):
+    c = resultado["config"]
+    return (c["especie"], c["imgsz"], c["skip"], c["conf"], c["backend"])
+
+
+def comparar(resultados, base, tolerancia=0.10):
+    """
+    Imprime las diferencias contra la base.
+
+    Returns:
+        bool: False si alguna configuración empeoró más que la tolerancia.
+    """
+    previos = {_clave(r): r for r in base}
+    sin_regresion = True
+    for r in resultados:
+        previo = previos.get(_clave(r))
+        if previo is None:
+            print(f"   {_clave(r)}: sin base para comparar")
+            continue
+        delta_fps = (r["fps"] - previo["fps"]) / previo["fps"] if previo["fps"] else 0.0
+        p95 = r["etapas"]["predict"]["p95_ms"]
+        p95_previo = previo["etapas"]["predict"]["p95_ms"]
+        delta_p95 = (p95 - p95_previo) / p95_previo if p95_previo else 0.0
+        peor = delta_fps < -tolerancia or delta_p95 > tolerancia
+        sin_regresion = sin_regresion and not peor
+        print(f"{'❌' if peor else '✅'} {_clave(r)}: fps {previo['fps']} -> {r['fps']} ({delta_fps:+.0%}) | "
+              f"predict p95 {p95_previo} -> {p95} ms ({delta_p95:+.0%}) | "
+              f"RSS {previo['rss_pico_mb']} -> {r['rss_pico_mb']} MB")
+    return sin_regresion
+
+
+def _lista(tipo):
+    return lambda texto: [tipo(x) for x in texto.split(",") if x]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de detección")
+    parser.add_argument("--especie", default="tortugas")
+    parser.add_argument("--imgsz", type=_lista(int), default=[320, 640])
+    parser.add_argument("--skip", type=_lista(int), default=[1, 4])
+    parser.add_argument("--conf", type=_lista(float), default=[0.60])
+    parser.add_argument("--backend", default="pytorch", help="pytorch | onnx | openvino | ncnn | auto")
+    parser.add_argument("--carpetas", default=None, help="Carpetas de imágenes separadas por coma")
+    parser.add_argument("--limite", type=int, default=None, help="Máximo de frames por configuración")
+    parser.add_argument("--latencia-red", type=float, default=0.0, help="Latencia simulada de red (ms)")
+    parser.add_argument("--sin-alertas", action="store_true", help="No medir el envío de alertas")
+    parser.add_argument("--sin-aislar", action="store_true", help="Correr todo en este proceso")
+    parser.add_argument("--salida", default=None, help="Guardar resultados JSON en este archivo")
+    parser.add_argument("--guardar-base", default=None, help="Guardar resultados como base de comparación")
+    parser.add_argument("--comparar", default=None, help="Comparar contra una base guardada")
+    parser.add_argument("--tolerancia", type=float, default=0.10, help="Regresión tolerada (0.10 = 10%%)")
+    parser.add_argument("--asignaciones", action="store_true",
+                        help="Medir bytes reservados por frame en captura/vista (antes vs ahora)")
+    parser.add_argument("--camino-alerta", action="store_true",
+                        help="Medir la latencia de la alerta: JPEG por disco (antes) vs en memoria (ahora)")
+    parser.add_argument("--carpeta-sd", default=None,
+                        help="Carpeta en la SD para --camino-alerta (por defecto images/capturas/.benchmark)")
+    parser.add_argument("--una", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--resultado", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.asignaciones:
+        r = medir_asignaciones(frames=args.limite or 300)
+        print(json.dumps(r))
+        print(f"🧮 Bytes por frame: antes {r['antes']:,} -> ahora {r['ahora']:,}", file=sys.stderr)
+        sys.exit(0)
+
+    if args.camino_alerta:
+        r = medir_camino_alerta(frames=args.limite or 50, latencia_red=args.latencia_red / 1000,
+                                carpeta=args.carpeta_sd)
+        print(json.dumps(r))
+        print(f"✉️ Camino de alerta p50/p95: antes {r['antes']['p50_ms']}/{r['antes']['p95_ms']} ms -> "
+              f"ahora {r['ahora']['p50_ms']}/{r['ahora']['p95_ms']} ms", file=sys.stderr)
+        sys.exit(0)
+
+    if args.una:
+        resultado = correr_config(**json.loads(args.una))
+        if args.resultado:
+            with open(args.resultado, "w") as f:
+                json.dump(resultado, f)
+        else:
+            print(json.dumps(resultado))
+        sys.exit(0)
+
+    carpetas = args.carpetas.split(",") if args.carpetas else None
+    resultados = []
+    for imgsz, skip, conf in itertools.product(args.imgsz, args.skip, args.conf):
+        config = {"especie": args.especie, "imgsz": imgsz, "skip": skip, "conf": conf,
+                  "backend": args.backend, "carpetas": carpetas, "limite": args.limite,
+                  "latencia_red": args.latencia_red / 1000, "enviar_alertas": not args.sin_alertas}
+        print(f"⏱️ imgsz={imgsz} skip={skip} conf={conf}...", file=sys.stderr)
+        resultado = correr_config(**config) if args.sin_aislar else correr_aislado(config)
+        resultados.append(resultado)
+        print(f"   {resultado['fps']} fps | predict p95 {resultado['etapas']['predict']['p95_ms']} ms | "
+              f"RSS {resultado['rss_pico_mb']} MB", file=sys.stderr)
+
+    texto = json.dumps(resultados, indent=2)
+    print(texto)
+    for destino in (args.salida, args.guardar_base):
+        if destino:
+            os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+            with open(destino, "w") as f:
+                f.write(texto)
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            base = json.load(f)
+        print("\n📊 Comparación contra la base:", file=sys.stderr)
+        sys.exit(0 if comparar(resultados, base, args.tolerancia) else 1)
@@ -0,0 +1,312 @@
+"""
+Varias cámaras en un mismo detector - Ñawi Apu
+
+Algunas playas tienen dos o tres cámaras en un solo Pi (o en una mini PC
+x86). Cada cámara tiene su captura, sus buffers y su propio estado de
+decisión (modo, ROIs, cooldown, movimiento, tracker), pero la inferencia es
+compartida: en cada ronda se toma el frame más nuevo de cada cámara lista y
+todos los que usan el mismo modelo van juntos en un solo predict().
+
+Formato de data/camaras.json:
+
+    {
+        "norte": {"fuente": "picamera:0"},
+        "sur":   {"fuente": "picamera:1", "modo": "tortugas", "cooldown": 30}
+    }
+
+"modo" fija la especie de esa cámara; sin él la cámara sigue el modo que
+publica el servidor. El modo "detenido" del servidor apaga todas.
+"""
+import os
+import json
+import time
+import threading
+from utils.perf_metrics import METRICAS
+from src.pipeline import BufferUltimoFrame
+
+
+class Camara:
+    def __init__(self, id, fuente="picamera", modo=None, cooldown=15):
+        """
+        Estado de una cámara. El detector completa los componentes opcionales
+        (captura, planificador, movimiento, tracker, confirmación, evidencia) al arrancar.
+
+        Args:
+            id (str): Nombre de la cámara (ROIs, ventanas, métricas y alertas).
+            fuente (str): Spec para src.fuentes.crear_fuente.
+            modo (str, optional): Especie fija; None = seguir el modo del servidor.
+            cooldown (float): Mínimo entre alertas de la misma especie en esta cámara.
+        """
+        self.id = id
+        self.fuente = fuente
+        self.modo = modo
+        self.cooldown = cooldown
+        # Cooldown fijado en camaras.json: los ajustes del servidor no lo pisan
+        self.cooldown_propio = False
+
+        self.picam = None
+        self.pool = None
+        self.captura = None
+        self.buffer_frames = BufferUltimoFrame("captura")
+        self.buffer_vista = None
+        self.buffer_resultados = BufferUltimoFrame("resultados")
+        self.rois = {}
+        self.planificador = None
+        self.movimiento = None
+        self.tracker = None
+        self.confirmacion = None
+        self.anillo = None
+        self.grabador = None
+
+        # Estado de decisión (lo tocan solo los hilos de inferencia, con su candado)
+        self.ultimo_envio = {}
+        self.ultimo_analizado = float("-inf")
+        self.ultimo_aplicado = -1
+        self.especie_seguida = None
+        self.nuevos_sin_alertar = 0
+        self.modelo_fijo = None
+        self.version_modelo = None
+        self.turno = 0
+
+        # Estado del hilo principal (pantalla y cambios de modo)
+        self.especie_vista = None
+        self.vista = None
+
+        # Métricas
+        self.procesados = 0
+        self.ultima_latencia = 0.0
+        self.latencia_max = 0.0
+
+    def especie(self, estado):
+        """Especie que mira esta cámara según el snapshot del poller."""
+        return self.modo if self.modo is not None else estado.especie
+
+    def anotar_resultado(self, frame):
+        """Latencia captura -> caja producida del último resultado de esta cámara."""
+        self.procesados += 1
+        self.ultima_latencia = time.monotonic() - frame.t_captura
+        self.latencia_max = max(self.latencia_max, self.ultima_latencia)
+        METRICAS.registrar(f"latencia_{self.id}", self.ultima_latencia)
+
+    def metricas(self, segundos=None):
+        m = {
+            "procesados": self.procesados,
+            "latencia_ms": round(self.ultima_latencia * 1000, 1),
+            "latencia_max_ms": round(self.latencia_max * 1000, 1),
+        }
+        if segundos:
+            m["fps_captura"] = round(self.captura.frames / segundos, 2) if self.captura else 0.0
+            m["fps_inferencia"] = round(self.procesados / segundos, 2)
+        return m
+
+
+def _parsear_spec(spec, indice):
+    """'norte=picamera:0' -> ('norte', 'picamera:0'); sin nombre -> ('cam<indice>', spec)."""
+    if "=" in spec and "://" not in spec.split("=", 1)[0]:
+        id_camara, fuente = spec.split("=", 1)
+        return id_camara.strip(), fuente.strip()
+    return f"cam{indice}", spec.strip()
+
+
+def cargar_camaras(ruta=None, especificaciones=None, fuente="picamera", id_unica="principal",
+                   cooldown=15):
+    """
+    Arma la lista de cámaras. Prioridad: especificaciones de la línea de
+    comandos, luego el archivo JSON, y si no hay nada una sola cámara.
+
+    Args:
+        ruta (str, optional): data/camaras.json (ver docstring del módulo).
+        especificaciones (list, optional): Textos "id=fuente" (--camara).
+        fuente (str): Fuente de la cámara única por defecto.
+        id_unica (str): Id de la cámara única (el de siempre en rois.json).
+        cooldown (float): Cooldown por defecto.
+
+    Returns:
+        list: Objetos Camara.
+    """
+    if especificaciones:
+        camaras = [Camara(*_parsear_spec(spec, i), cooldown=cooldown)
+                   for i, spec in enumerate(especificaciones)]
+    elif ruta and os.path.exists(ruta):
+        try:
+            with open(ruta, "r") as f:
+                datos = json.load(f)
+        except Exception as e:
+            print(f"⚠️ Error leyendo cámaras {ruta}: {e}")
+            datos = {}
+        camaras = []
+        for id_camara, conf in datos.items():
+            if isinstance(conf, str):
+                conf = {"fuente": conf}
+            camara = Camara(id_camara, conf.get("fuente", "picamera"), modo=conf.get("modo"),
+                            cooldown=conf.get("cooldown", cooldown))
+            camara.cooldown_propio = "cooldown" in conf
+            camaras.append(camara)
+    else:
+        camaras = []
+
+    if not camaras:
+        return [Camara(id_unica, fuente, cooldown=cooldown)]
+
+    ids = [c.id for c in camaras]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Ids de cámara repetidos: {ids}")
+    print("📷 Cámaras: " + ", ".join(f"{c.id} ({c.fuente}{', ' + c.modo if c.modo else ''})"
+                                      for c in camaras))
+    return camaras
+
+
+class HiloLotes(threading.Thread):
+    def __init__(self, grupo, nombre="inferencia"):
+        super().__init__(name=nombre, daemon=True)
+        self.grupo = grupo
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.is_set():
+            # Se limpia antes de mirar: un frame que llegue durante la ronda no se pierde
+            self.grupo.aviso.clear()
+            if not self.grupo.ronda():
+                self.grupo.aviso.wait(0.5)
+
+    def detener(self):
+        self._detener.set()
+        self.grupo.aviso.set()
+
+
+class InferenciaCamaras:
+    def __init__(self, camaras, planear, inferir, registrar, hilos=1, max_camaras=None):
+        """
+        Inferencia compartida por todas las cámaras, por rondas. Se maneja como
+        un hilo (start/detener/join) y expone procesados y metricas() para el reporte.
+
+        En cada ronda se atienden primero las cámaras servidas hace más tiempo
+        (como máximo `max_camaras`), se planea cada frame y los planes con la
+        misma especie e imgsz van en un solo lote.
+
+        Args:
+            camaras (list): Objetos Camara.
+            planear (callable): (camara, frame) -> (especie, modelo, imgsz, recortes) o None.
+            inferir (callable): (especie, modelo, imgsz, [(imagen, recortes)]) ->
+                [(Detecciones, velocidad)] en el mismo orden.
+            registrar (callable): (camara, frame, especie, cajas, velocidad, segundos) ->
+                resultado a publicar en camara.buffer_resultados (o None).
+            hilos (int): Hilos de inferencia (uno por proceso de src.procesos).
+            max_camaras (int, optional): Cámaras por ronda; None = todas las que tengan frame.
+        """
+        self.camaras = camaras
+        self.planear = planear
+        self.inferir = inferir
+        self.registrar = registrar
+        self.max_camaras = max_camaras
+        self.aviso = threading.Event()
+        for camara in camaras:
+            camara.buffer_frames.aviso = self.aviso
+
+        # Planear y registrar tocan el estado de las cámaras: se serializan aquí
+        self._candado = threading.Lock()
+        self._turnos = 0
+        self.errores = 0
+        self.lotes = 0
+        self.imagenes = 0
+        self.hilos = [HiloLotes(self, nombre="inferencia" if hilos == 1 else f"inferencia-{i}")
+                      for i in range(max(1, int(hilos)))]
+
+    def ronda(self):
+        """Atiende una ronda de cámaras. Devuelve False si no había frames."""
+        obtenidos = []
+        try:
+            return self._ronda(obtenidos)
+        finally:
+            # Los frames vuelven al pool de su cámara (las alertas ya copiaron lo suyo)
+            for frame in obtenidos:
+                frame.liberar()
+
+    def _ronda(self, obtenidos):
+        with self._candado:
+            listas = sorted((c for c in self.camaras if c.buffer_frames.profundidad()),
+                            key=lambda c: c.turno)
+            if self.max_camaras:
+                listas = listas[:self.max_camaras]
+            lotes = {}
+            for camara in listas:
+                frame = camara.buffer_frames.obtener(timeout=0)
+                if frame is None:
+                    continue
+                obtenidos.append(frame)
+                self._turnos += 1
+                camara.turno = self._turnos
+                try:
+                    plan = self.planear(camara, frame)
+                except Exception as e:
+                    self.errores += 1
+                    print(f"❌ Error planeando ({camara.id}): {e}")
+                    continue
+                if plan is None:
+                    continue
+                especie, modelo, imgsz, recortes = plan
+                lotes.setdefault((especie, imgsz), (modelo, []))[1].append((camara, frame, recortes))
+        if not listas:
+            return False
+
+        for (especie, imgsz), (modelo, items) in lotes.items():
+            t_predict = time.monotonic()
+            try:
+                salidas = self.inferir(especie, modelo, imgsz, [(f.imagen, r) for _, f, r in items])
+            except Exception as e:
+                self.errores += 1
+                print(f"❌ Error en inferencia: {e}")
+                continue
+            # El planificador de cada cámara ve el costo del lote completo: es lo que ocupa la CPU
+            segundos = time.monotonic() - t_predict
+            self.lotes += 1
+            self.imagenes += len(items)
+            METRICAS.registrar("lote", segundos)
+
+            with self._candado:
+                for (camara, frame, _), (cajas, velocidad) in zip(items, salidas):
+                    # Otro hilo pudo terminar un frame más nuevo antes: el tracker no retrocede
+                    if frame.numero < camara.ultimo_aplicado:
+                        METRICAS.contar("resultados_fuera_de_orden")
+                        continue
+                    camara.ultimo_aplicado = frame.numero
+                    try:
+                        resultado = self.registrar(camara, frame, especie, cajas, velocidad, segundos)
+                    except Exception as e:
+                        self.errores += 1
+                        print(f"❌ Error registrando ({camara.id}): {e}")
+                        continue
+                    if resultado is None:
+                        continue
+                    camara.anotar_resultado(frame)
+                    camara.buffer_resultados.publicar(resultado)
+        return True
+
+    @property
+    def procesados(self):
+        return sum(c.procesados for c in self.camaras)
+
+    def start(self):
+        for hilo in self.hilos:
+            hilo.start()
+
+    def detener(self):
+        for hilo in self.hilos:
+            hilo.detener()
+
+    def join(self, timeout=None):
+        for hilo in self.hilos:
+            hilo.join(timeout)
+
+    def is_alive(self):
+        return any(h.is_alive() for h in self.hilos)
+
+    def metricas(self):
+        return {
+            "procesados": self.procesados,
+            "errores": self.errores,
+            "lotes": self.lotes,
+            "imagenes_por_lote": round(self.imagenes / self.lotes, 2) if self.lotes else 0.0,
+            "latencia_ms": round(max(c.ultima_latencia for c in self.camaras) * 1000, 1),
+            "latencia_max_ms": round(max(c.latencia_max for c in self.camaras) * 1000, 1),
+        }
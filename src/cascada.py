@@ -0,0 +1,157 @@
+"""
+Cascada de dos etapas - Ñawi Apu
+
+La mayoría de los frames analizados no tienen nada. En vez de correr cada
+uno a IMG_SIZE=640, primero se criba el frame completo a 320 (o con un
+modelo chico `modelos/<especie>_cribado.pt`) con un umbral bajo, y solo las
+zonas candidatas se recortan y se vuelven a correr a resolución completa.
+Un animal chico dentro del recorte se ve más grande después del letterbox,
+así que la confirmación conserva la precisión de 640 pagando casi lo de 320.
+
+Umbrales por especie (la clave "*" aplica al resto):
+
+    cribado -> confianza mínima de la etapa uno para que una caja sea candidata
+    aceptar -> desde esta confianza la caja de la etapa uno se acepta sin
+               confirmar (None = confirmar siempre)
+"""
+import threading
+from src.detecciones import Detecciones
+
+UMBRALES_POR_DEFECTO = {"*": {"cribado": 0.20, "aceptar": None}}
+
+
+class Cascada:
+    def __init__(self, imgsz_cribado=320, umbrales=None, margen=0.3, lado_min=96,
+                 max_recortes=4, fraccion_completo=0.6):
+        """
+        Args:
+            imgsz_cribado (int): Resolución de la etapa uno.
+            umbrales (dict, optional): especie -> {"cribado", "aceptar"} (ver docstring del módulo).
+            margen (float): Margen relativo alrededor de cada candidata al recortar.
+            lado_min (int): Lado mínimo del recorte en pixeles (contexto para animales chicos).
+            max_recortes (int): Con más zonas que esto se confirma sobre la unión de todas.
+            fraccion_completo (float): Si los recortes cubren más que esta fracción del
+                frame se confirma sobre el frame completo.
+        """
+        self.imgsz_cribado = imgsz_cribado
+        self.umbrales = dict(UMBRALES_POR_DEFECTO)
+        self.umbrales.update(umbrales or {})
+        self.margen = margen
+        self.lado_min = lado_min
+        self.max_recortes = max(1, int(max_recortes))
+        self.fraccion_completo = fraccion_completo
+
+        # Métricas (pueden sumar varios hilos de inferencia)
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.etapa_dos = 0
+        self.recortes = 0
+        self.frames_completos = 0
+        self.aceptadas = 0
+        self.confirmadas = 0
+        self.rechazados = 0
+
+    def umbral(self, especie, clave):
+        propios = self.umbrales.get(especie, {})
+        return propios.get(clave, self.umbrales["*"].get(clave))
+
+    def regiones(self, cajas, ancho, alto):
+        """
+        Zonas a confirmar: cada candidata con margen, unidas si se solapan.
+
+        Returns:
+            list: [(x1, y1, x2, y2)] en pixeles, o None para usar el frame completo.
+        """
+        zonas = []
+        for x1, y1, x2, y2 in cajas.xyxy:
+            w, h = x2 - x1, y2 - y1
+            lado_w = max(w * (1 + 2 * self.margen), self.lado_min)
+            lado_h = max(h * (1 + 2 * self.margen), self.lado_min)
+            cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+            zonas.append([max(0, int(cx - lado_w / 2)), max(0, int(cy - lado_h / 2)),
+                          min(ancho, int(cx + lado_w / 2)), min(alto, int(cy + lado_h / 2))])
+
+        # Unir zonas que se tocan hasta que no quede ninguna solapada
+        unidas = True
+        while unidas and len(zonas) > 1:
+            unidas = False
+            for i in range(len(zonas)):
+                for j in range(i + 1, len(zonas)):
+                    a, b = zonas[i], zonas[j]
+                    if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                        zonas[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                        del zonas[j]
+                        unidas = True
+                        break
+                if unidas:
+                    break
+
+        if len(zonas) > self.max_recortes:
+            zonas = [[min(z[0] for z in zonas), min(z[1] for z in zonas),
+                      max(z[2] for z in zonas), max(z[3] for z in zonas)]]
+        area = sum((z[2] - z[0]) * (z[3] - z[1]) for z in zonas)
+        if area > self.fraccion_completo * ancho * alto:
+            return None
+        return [tuple(z) for z in zonas]
+
+    def correr(self, especie, entradas, imgsz, cribar, confirmar, conf):
+        """
+        Corre las dos etapas sobre un lote de entradas (imagen, recortes).
+
+        Args:
+            cribar (callable): (entradas, imgsz, conf) -> [(Detecciones, velocidad)]
+                con el modelo de cribado.
+            confirmar (callable): Igual, con el modelo de la especie.
+            imgsz (int): Resolución de la etapa dos.
+            conf (float): Confianza de la etapa dos (la misma que sin cascada).
+
+        Returns:
+            list: [(Detecciones, velocidad)] en el mismo orden que `entradas`.
+        """
+        cribado = cribar(entradas, self.imgsz_cribado, self.umbral(especie, "cribado"))
+        aceptar = self.umbral(especie, "aceptar")
+
+        salidas = [None] * len(entradas)
+        pendientes, indices = [], []
+        for i, ((imagen, _), (candidatas, velocidad)) in enumerate(zip(entradas, cribado)):
+            directas = candidatas.filtrar(candidatas.conf >= aceptar) if aceptar is not None else Detecciones()
+            dudosas = candidatas.filtrar(candidatas.conf < aceptar) if aceptar is not None else candidatas
+            salidas[i] = ([directas], velocidad)
+            with self._lock:
+                self.frames += 1
+                self.aceptadas += len(directas)
+            if not len(dudosas):
+                continue
+            alto, ancho = imagen.shape[:2]
+            zonas = self.regiones(dudosas, ancho, alto)
+            recortes = None if zonas is None else [(imagen[y1:y2, x1:x2], (x1, y1)) for x1, y1, x2, y2 in zonas]
+            pendientes.append((imagen, recortes))
+            indices.append(i)
+            with self._lock:
+                self.etapa_dos += 1
+                self.recortes += len(recortes) if recortes else 0
+                self.frames_completos += 1 if recortes is None else 0
+
+        if pendientes:
+            for i, (confirmadas, velocidad) in zip(indices, confirmar(pendientes, imgsz, conf)):
+                partes, velocidad_cribado = salidas[i]
+                partes.append(confirmadas)
+                for etapa, ms in velocidad.items():
+                    velocidad_cribado[etapa] = velocidad_cribado.get(etapa, 0.0) + (ms or 0.0)
+                with self._lock:
+                    self.confirmadas += len(confirmadas)
+                    self.rechazados += 0 if len(confirmadas) else 1
+
+        return [(Detecciones.concatenar(partes), velocidad) for partes, velocidad in salidas]
+
+    def metricas(self):
+        return {
+            "frames": self.frames,
+            "etapa_dos": self.etapa_dos,
+            "ratio_etapa_dos": round(self.etapa_dos / self.frames, 3) if self.frames else 0.0,
+            "recortes": self.recortes,
+            "frames_completos": self.frames_completos,
+            "aceptadas": self.aceptadas,
+            "confirmadas": self.confirmadas,
+            "rechazados": self.rechazados,
+        }
@@ -0,0 +1,115 @@
+"""
+Confirmación temporal N de M - Ñawi Apu
+
+Un solo frame con una caja sobre CONF_THRESHOLD (un reflejo, la espuma de
+una ola) dispara todo el camino caro de la alerta: dibujo, JPEG, commit a
+GitHub, POST a Railway y un WhatsApp a cada usuario. Antes de alertar
+pedimos K inferencias positivas en los últimos M frames analizados, y
+opcionalmente que las cajas se solapen entre sí (el mismo objeto, no brillos
+sueltos en distintos lugares) durante un tiempo mínimo.
+
+Los episodios que nunca llegan a confirmarse quedan como "suprimidos" para
+registrarlos en InfluxDB y poder afinar K/M con datos.
+"""
+import threading
+from collections import deque
+from src.detecciones import iou_matriz
+
+
+class ConfirmacionTemporal:
+    def __init__(self, k=3, m=5, iou_min=None, persistencia_s=0.0, max_suprimidos=100):
+        """
+        Args:
+            k (int): Frames positivos necesarios...
+            m (int): ...dentro de los últimos M analizados.
+            iou_min (float, optional): Si se da, un frame solo apoya al actual si
+                alguna de sus cajas se solapa (IoU >= iou_min) con alguna caja actual.
+            persistencia_s (float): Segundos mínimos entre el primer apoyo y el actual.
+            max_suprimidos (int): Episodios suprimidos retenidos hasta que se registran.
+        """
+        self.k = max(1, int(k))
+        self.m = max(self.k, int(m))
+        self.iou_min = iou_min
+        self.persistencia_s = persistencia_s
+        self._ventana = deque(maxlen=self.m)   # (t, xyxy) de cada frame analizado
+        self._episodio = None
+        self._suprimidos = deque(maxlen=max_suprimidos)
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.positivos = 0
+        self.confirmados = 0
+        self.episodios = 0
+        self.suprimidos = 0
+
+    def reiniciar(self):
+        """Olvida la ventana (cambio de especie); un episodio abierto se cierra sin alerta."""
+        self._cerrar_episodio()
+        self._ventana.clear()
+
+    def registrar(self, detecciones, t, especie=None):
+        """
+        Agrega un frame analizado.
+
+        Args:
+            detecciones (Detecciones): Cajas sobre el umbral de alerta en este frame.
+            t (float): Instante de captura.
+            especie (str, optional): Para el registro de suprimidos.
+
+        Returns:
+            bool: True si el frame actual está confirmado (puede alertar).
+        """
+        xyxy = detecciones.xyxy
+        self._ventana.append((t, xyxy))
+        if len(detecciones) == 0:
+            # Sin positivos en toda la ventana el episodio terminó
+            if self._episodio is not None and not any(len(c) for _, c in self._ventana):
+                self._cerrar_episodio()
+            return False
+
+        self.positivos += 1
+        if self._episodio is None:
+            self.episodios += 1
+            self._episodio = {"especie": especie, "t_inicio": t, "t_fin": t, "positivos": 0,
+                              "cantidad": 0, "confianza": 0.0, "confirmado": False}
+        episodio = self._episodio
+        episodio["t_fin"] = t
+        episodio["positivos"] += 1
+        episodio["cantidad"] = max(episodio["cantidad"], len(detecciones))
+        episodio["confianza"] = max(episodio["confianza"], detecciones.confianza_max())
+
+        apoyos = [tf for tf, cajas in self._ventana if len(cajas) and self._apoya(xyxy, cajas)]
+        confirmado = len(apoyos) >= self.k and t - min(apoyos) >= self.persistencia_s
+        if confirmado:
+            self.confirmados += 1
+            episodio["confirmado"] = True
+        return confirmado
+
+    def _apoya(self, actuales, cajas):
+        if self.iou_min is None or cajas is actuales:
+            return True
+        return bool((iou_matriz(actuales, cajas) >= self.iou_min).any())
+
+    def _cerrar_episodio(self):
+        episodio, self._episodio = self._episodio, None
+        if episodio is None or episodio["confirmado"]:
+            return
+        self.suprimidos += 1
+        episodio["duracion_s"] = round(episodio["t_fin"] - episodio["t_inicio"], 2)
+        with self._lock:
+            self._suprimidos.append(episodio)
+
+    def extraer_suprimidos(self):
+        """Episodios suprimidos desde la última llamada (para InfluxDB, desde otro hilo)."""
+        with self._lock:
+            episodios = list(self._suprimidos)
+            self._suprimidos.clear()
+        return episodios
+
+    def metricas(self):
+        return {
+            "positivos": self.positivos,
+            "confirmados": self.confirmados,
+            "episodios": self.episodios,
+            "suprimidos": self.suprimidos,
+        }
@@ -0,0 +1,153 @@
+"""
+Detecciones compactas - Ñawi Apu
+
+En vez de pasar los Results de ultralytics por todo el pipeline usamos
+arreglos numpy simples (cajas xyxy, confianza y clase) en coordenadas del
+frame completo. Así se pueden juntar cajas de varios recortes, dibujarlas
+sin plot() y mandarlas entre hilos o procesos sin arrastrar tensores.
+"""
+import cv2
+import numpy as np
+
+
+class Detecciones:
+    __slots__ = ("xyxy", "conf", "cls", "nombres", "ids")
+
+    def __init__(self, xyxy=None, conf=None, cls=None, nombres=None, ids=None):
+        self.xyxy = np.zeros((0, 4), np.float32) if xyxy is None else np.asarray(xyxy, np.float32).reshape(-1, 4)
+        self.conf = np.zeros(0, np.float32) if conf is None else np.asarray(conf, np.float32).reshape(-1)
+        self.cls = np.zeros(0, np.int32) if cls is None else np.asarray(cls, np.int32).reshape(-1)
+        self.nombres = nombres or {}
+        # IDs de pista (los asigna src.tracker); None si no hay seguimiento
+        self.ids = ids
+
+    @classmethod
+    def desde_resultado(cls_, resultado, dx=0, dy=0):
+        """Convierte un Results de ultralytics, desplazando las cajas si vino de un recorte."""
+        cajas = resultado.boxes
+        xyxy = cajas.xyxy.cpu().numpy().astype(np.float32)
+        if dx or dy:
+            xyxy += np.array([dx, dy, dx, dy], dtype=np.float32)
+        return cls_(xyxy, cajas.conf.cpu().numpy(), cajas.cls.cpu().numpy(), resultado.names)
+
+    @classmethod
+    def concatenar(cls_, lista, iou_nms=0.5):
+        """Une detecciones de varios recortes y quita duplicados donde se solapan."""
+        lista = [d for d in lista if len(d)]
+        if not lista:
+            return cls_()
+        if len(lista) == 1:
+            return lista[0]
+        unidas = cls_(np.concatenate([d.xyxy for d in lista]),
+                      np.concatenate([d.conf for d in lista]),
+                      np.concatenate([d.cls for d in lista]),
+                      lista[0].nombres)
+        return unidas.filtrar(nms(unidas.xyxy, unidas.conf, unidas.cls, iou_nms))
+
+    def __len__(self):
+        return len(self.conf)
+
+    def filtrar(self, indices):
+        ids = self.ids[indices] if self.ids is not None else None
+        return Detecciones(self.xyxy[indices], self.conf[indices], self.cls[indices], self.nombres, ids)
+
+    def confianza_max(self):
+        return float(self.conf.max()) if len(self) else 0.0
+
+
+def iou_matriz(a, b):
+    """IoU entre cada caja de `a` (N,4) y cada caja de `b` (M,4)."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0).astype(np.float32)
+
+
+def nms(xyxy, conf, cls, iou_max=0.5):
+    """NMS por clase. Devuelve los índices que se conservan (mayor confianza primero)."""
+    orden = np.argsort(-conf)
+    conservar = []
+    while len(orden):
+        i = orden[0]
+        conservar.append(i)
+        resto = orden[1:]
+        ious = iou_matriz(xyxy[i:i + 1], xyxy[resto])[0]
+        orden = resto[(ious <= iou_max) | (cls[resto] != cls[i])]
+    return np.array(conservar, dtype=np.int64)
+
+
+def predecir(modelo, imagen, imgsz, conf, recortes=None, por_imagen=False):
+    """
+    Corre el modelo sobre el frame completo o sobre recortes (en un solo batch).
+
+    Args:
+        recortes (list, optional): Lista de (imagen_recortada, (x0, y0)) de src.roi.
+        por_imagen (bool): Ver predecir_lote().
+
+    Returns:
+        tuple: (Detecciones en coordenadas del frame, velocidad en ms por etapa)
+    """
+    if not recortes:
+        resultado = modelo.predict(source=imagen, conf=conf, imgsz=imgsz,
+                                   device="cpu", verbose=False)[0]
+        return Detecciones.desde_resultado(resultado), dict(resultado.speed)
+
+    return predecir_lote(modelo, [(imagen, recortes)], imgsz, conf, por_imagen)[0]
+
+
+def predecir_lote(modelo, entradas, imgsz, conf, por_imagen=False):
+    """
+    Un solo predict() para varios frames (p.ej. de distintas cámaras) y sus recortes.
+
+    Args:
+        entradas (list): Lista de (imagen, recortes o None), como en predecir().
+        por_imagen (bool): Un predict() por imagen, para modelos exportados con
+            entrada fija (NCNN): corren con batch 1 y devuelven menos resultados.
+
+    Returns:
+        list: (Detecciones, velocidad en ms por etapa) de cada entrada, en el mismo orden.
+
+    Raises:
+        RuntimeError: Si el modelo no devolvió un resultado por imagen.
+    """
+    fuentes, origenes = [], []
+    for i, (imagen, recortes) in enumerate(entradas):
+        for recorte, (x0, y0) in (recortes or [(imagen, (0, 0))]):
+            fuentes.append(recorte)
+            origenes.append((i, x0, y0))
+
+    if por_imagen:
+        resultados = [r for fuente in fuentes
+                      for r in modelo.predict(source=fuente, conf=conf, imgsz=imgsz, device="cpu", verbose=False)]
+    else:
+        resultados = modelo.predict(source=fuentes, conf=conf, imgsz=imgsz, device="cpu", verbose=False)
+    if len(resultados) != len(fuentes):
+        # Con zip se perderían cámaras o recortes sin aviso
+        raise RuntimeError(f"el modelo devolvió {len(resultados)} resultados para {len(fuentes)} imágenes")
+    partes = [[] for _ in entradas]
+    velocidades = [{} for _ in entradas]
+    for res, (i, x0, y0) in zip(resultados, origenes):
+        partes[i].append(Detecciones.desde_resultado(res, x0, y0))
+        # ultralytics informa la velocidad por imagen; sumamos para tener el costo de cada entrada
+        for etapa, ms in res.speed.items():
+            velocidades[i][etapa] = velocidades[i].get(etapa, 0.0) + (ms or 0.0)
+    return [(Detecciones.concatenar(p), v) for p, v in zip(partes, velocidades)]
+
+
+def dibujar(imagen, detecciones, etiqueta, color, copiar=True):
+    """Dibuja las cajas con OpenCV (mucho más barato que Results.plot())."""
+    salida = imagen.copy() if copiar else imagen
+    ids = detecciones.ids if detecciones.ids is not None else [None] * len(detecciones)
+    for (x1, y1, x2, y2), conf, id_pista in zip(detecciones.xyxy.astype(int), detecciones.conf, ids):
+        texto = f"{etiqueta} #{id_pista}" if id_pista is not None else f"{etiqueta} {conf:.2f}"
+        cv2.rectangle(salida, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(salida, texto, (x1, max(0, y1 - 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    return salida
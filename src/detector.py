@@ -1,13 +1,31 @@
 import os
+import sys
 import time
+import argparse
 import cv2
-import requests
 import numpy as np
-from ultralytics import YOLO
 from utils.influx_logger import InfluxLogger 
-from utils.send_alert import enviar_alerta
+from utils.alert_queue import DespachadorAlertas
+from utils.send_alert import AgrupadorAlertas
+from utils.bandeja_salida import BandejaSalida, DrenadorBandeja
+from utils.transporte import TRANSPORTE
+from utils.perf_metrics import METRICAS, ReportePeriodico
+from src.modelos import RegistroModelos
+from src.modo_poller import PollerModo
+from src.movimiento import DetectorMovimiento
+from src.planificador import PlanificadorAdaptativo
+from src.tracker import TrackerAnimales
+from src.confirmacion import ConfirmacionTemporal
+from src.evidencia import AnilloFrames, GrabadorEvidencia
+from src.reposo import ControlReposo
+from src.detecciones import predecir_lote, dibujar
+from src.roi import cargar_rois, rois_del_modo, recortar
+from src.pipeline import BufferUltimoFrame, PoolFrames, HiloCaptura, resumen_metricas
+from src.camaras import cargar_camaras, InferenciaCamaras
+from src.cascada import Cascada
+from src.procesos import ServidorInferencia, fijar_nucleos
+from src.fuentes import crear_fuente
 from dotenv import load_dotenv
-from picamera2 import Picamera2
 
 # -----------------------
 # CONFIGURACIÓN
@@ -22,180 +40,678 @@ RAILWAY_URL = os.environ.get("RAILWAY_URL")
 ALERTA_KEY = os.environ.get("ALERTA_KEY", "clave")
 
 # --- AJUSTES DE VELOCIDAD ---
-SKIP_FRAMES = 4    # Analizar solo 1 de cada 4 frames (Sube esto si sigue lento)
+SKIP_FRAMES = 4    # Valor inicial: el planificador lo ajusta solo según la latencia medida
 CONF_THRESHOLD = 0.60
-IMG_SIZE = 640     # Bajar a 320 aumenta mucho la velocidad (vs 640)
+IMG_SIZE = 640     # Resolución inicial (y máxima) de inferencia
 MOSTRAR_EN_PANTALLA = False
 
+# --- PLANIFICADOR ADAPTATIVO ---
+PLANIFICADOR_ACTIVO = True
+OBJETIVO_FPS_REPOSO = 1.0       # Inferencias/s con la escena tranquila
+OBJETIVO_FPS_ALERTA = 5.0       # Inferencias/s después de una detección
+PRESUPUESTO_CPU = 0.6           # Fracción del tiempo que puede ocupar predict()
+AJUSTAR_RESOLUCION = True       # Bajar/subir imgsz si no se llega al objetivo
+RESOLUCIONES = (320, 480, 640)
+
+# --- COMPUERTA DE MOVIMIENTO (no correr YOLO si la escena está quieta) ---
+MOVIMIENTO_ACTIVO = True
+MOVIMIENTO_UMBRAL = 25          # Diferencia de gris por pixel (más bajo = más sensible)
+MOVIMIENTO_AREA_MIN = 0.002     # Fracción de la zona que debe cambiar
+MOVIMIENTO_FORZAR_CADA = 10.0   # Inferir igual cada X segundos aunque no haya movimiento
+MOVIMIENTO_MASCARA = None       # Polígonos normalizados a vigilar, ej: [[(0,0.5),(1,0.5),(1,1),(0,1)]]
+
+# --- CASCADA (cribado barato del frame completo + confirmación a IMG_SIZE en recortes) ---
+CASCADA_ACTIVA = False
+CASCADA_IMGSZ = 320             # Resolución de la etapa uno
+CASCADA_SUFIJO_CRIBADO = "_cribado"  # modelos/<especie>_cribado.pt: modelo chico opcional para la etapa uno
+# El modelo chico va a la misma caché que los de especie y cuenta para MEMORIA_MODELOS_MB:
+# si el límite es justo, puede desalojar de la caché al modelo de la especie (se sigue usando,
+# pero al volver a pedirlo se carga de nuevo). Subir el límite si se usa cascada con modelo chico.
+CASCADA_UMBRALES = {            # cribado: candidata desde esta conf | aceptar: sin confirmar desde esta conf
+    "*": {"cribado": 0.20, "aceptar": None},
+    "invasores": {"cribado": 0.15, "aceptar": None},  # Mejor confirmar de más que perder una persona
+    "tortugas": {"cribado": 0.25, "aceptar": 0.85},
+}
+CASCADA_MARGEN = 0.3            # Margen relativo alrededor de cada candidata
+CASCADA_MAX_RECORTES = 4        # Más zonas que esto -> se confirma sobre su unión
+
+# --- CÁMARAS (varias en un mismo proceso; ver src/camaras.py) ---
+CAMARA_ID = "principal"         # Id de la cámara única (cuando no hay data/camaras.json)
+CAMARAS_ARCHIVO = os.path.join(PROJECT_DIR, "data", "camaras.json")
+CAMARAS_POR_RONDA = None        # Máximo de cámaras por lote de inferencia (None = todas)
+
+# --- REGIONES DE INTERÉS (solo inferir sobre las zonas de nidos) ---
+ROIS_ARCHIVO = os.path.join(PROJECT_DIR, "data", "rois.json")
+ROIS_POR_MODO = {}              # Alternativa sin archivo, ej: {"tortugas": [(0.05, 0.55, 0.45, 1.0)]}
+ROI_MARGEN = 0.05               # Margen relativo alrededor de cada ROI
+
+# --- SEGUIMIENTO (una alerta por animal nuevo, no por cooldown) ---
+TRACKER_ACTIVO = True
+TRACKER_CONF_BAJA = 0.30        # Cajas débiles: solo mantienen pistas ya existentes
+TRACKER_MIN_ACIERTOS = 2        # Detecciones para confirmar un animal nuevo
+TRACKER_MAX_PERDIDA = 5.0       # Segundos sin verlo antes de darlo por ido
+COOLDOWN_ALERTAS = 15           # Mínimo entre alertas de la misma especie
+
+# --- CONFIRMACIÓN TEMPORAL (no alertar por un reflejo de un solo frame) ---
+CONFIRMACION_ACTIVA = True
+CONFIRMACION_K = 3              # Frames analizados con cajas sobre CONF_THRESHOLD...
+CONFIRMACION_M = 5              # ...dentro de los últimos M
+CONFIRMACION_IOU = 0.1          # Las cajas deben solaparse entre esos frames (None = no exigir)
+CONFIRMACION_PERSISTENCIA = 0.0 # Segundos mínimos entre el primer apoyo y la alerta
+
+# --- CLIPS DE EVIDENCIA (pre-roll / post-roll alrededor de cada alerta) ---
+EVIDENCIA_ACTIVA = True
+EVIDENCIA_PRE = 4.0             # Segundos antes de la alerta
+EVIDENCIA_POST = 4.0            # Segundos después de la alerta
+EVIDENCIA_FPS = 8.0             # Frames por segundo guardados en el anillo
+EVIDENCIA_TAMANO = (480, 360)   # Tamaño de almacenamiento (None = tamaño de la cámara)
+EVIDENCIA_CODEC = "MJPG"        # MJPG (.avi, siempre disponible) | avc1 (.mp4, H.264 si OpenCV lo trae)
+EVIDENCIA_DIR = os.path.join(PROJECT_DIR, "images", "evidencias")
+EVIDENCIA_SUBIR_HOJA = True     # Enviar la hoja de contactos (con la ruta del clip) a los operadores
+
+# --- MODELOS ---
+PRECARGAR_MODELOS = True        # Cargar y calentar todos los modelos/*.pt al arrancar
+MEMORIA_MODELOS_MB = 400        # Memoria máxima para modelos en caché (LRU)
+BACKEND_INFERENCIA = "auto"     # pytorch | onnx | openvino | ncnn | auto (el más rápido instalado)
+
+# --- PROCESOS DE INFERENCIA (YOLO fuera del GIL) ---
+PROCESOS_INFERENCIA = 0         # 0 = YOLO en un hilo de este proceso; en Pi 5 probar 2
+NUCLEOS_PRINCIPAL = None        # ej. (0, 1): captura, poller y subidas HTTP
+NUCLEOS_INFERENCIA = None       # ej. [(2,), (3,)]: núcleos de cada proceso de inferencia
+
+# --- CAPTURA ---
+FRAMES_EN_POOL = 6              # Arreglos de frame reutilizados por la captura (sin reservar por frame)
+
+# --- MÉTRICAS DE RENDIMIENTO (InfluxDB: pipeline_perf) ---
+INTERVALO_METRICAS = 60.0       # Segundos entre envíos de métricas a InfluxDB
+
+# --- COLA DE ALERTAS ---
+ALERTAS_EN_COLA = 8                 # Máximo de alertas esperando subida/envío
+POLITICA_COLA_ALERTAS = "coalescer" # descartar_nuevo | descartar_viejo | coalescer
+# La primera alerta de la especie y cámara sale al momento; las que siguen dentro de la
+# ventana (s) salen como un solo resumen con el mejor frame. 0 = sin agrupar; invasores nunca se agrupa.
+VENTANAS_ALERTAS = {"gaviotines": 120, "tortugas": 60}
+# Las amenazas tienen carril propio; con esto además salen sin foto y la foto va en un segundo mensaje
+ALERTAS_TEXTO_PRIMERO = True
+
+# --- BANDEJA DE SALIDA (alertas e InfluxDB que esperan conexión, en la SD) ---
+BANDEJA_ACTIVA = True
+BANDEJA_ARCHIVO = os.path.join(PROJECT_DIR, "data", "bandeja_salida.sqlite3")
+BANDEJA_PRESUPUESTO_MB = 200        # Al pasarse se descarta lo más viejo (alertas al final)
+BANDEJA_ALERTAS_POR_MINUTO = 6      # Ritmo de reenvío tras un corte (no inundar WhatsApp)
+BANDEJA_LOTE_INFLUX = 500           # Registros atrasados por escritura a InfluxDB
+
+# --- REPOSO (modo "detenido", unidades a batería/solar) ---
+REPOSO_CAMARA = "detener"       # detener (stream apagado) | lento (1 frame cada REPOSO_INTERVALO s)
+REPOSO_INTERVALO = 1.0
+REPOSO_DESCARGAR_MODELOS = False  # Liberar la RAM de los modelos (la reanudación tarda la carga)
+
+# --- CONSULTA DE MODO (hilo aparte) ---
+INTERVALO_MODO = 3.0      # Segundos entre consultas a /config (con ±20% de jitter)
+
+# --- AJUSTES EN CALIENTE (bloque "tuning" de /config, ver src/ajustes.py) ---
+# skip_frames, conf_threshold, img_size, cooldown y check_server_every pisan a
+# SKIP_FRAMES, CONF_THRESHOLD, IMG_SIZE, COOLDOWN_ALERTAS e INTERVALO_MODO.
+SITIO = os.environ.get("SITIO", "costa_norte")
+BACKOFF_MODO_MAX = 60.0   # Espera máxima entre reintentos si no hay internet
+
 # -----------------------
 # Funciones
 # -----------------------
-def get_mode():
+def iniciar_camara_global(fuente="picamera", tiempo_real=True, bucle=False):
     try:
-        r = requests.get(f"{RAILWAY_URL}/config", timeout=0.5) # Timeout ultra corto
-        if r.status_code == 200:
-            return r.json().get("mode", "detenido")
-    except:
-        pass
-    return None
-
-def cargar_modelo(especie):
-    modelo_path = os.path.join(MODELS_DIR, f"{especie}.pt")
-    if not os.path.exists(modelo_path):
-        print(f"❌ Modelo no encontrado: {modelo_path}")
-        return None
-    print(f"📦 Cargando IA: {especie}...")
-    return YOLO(modelo_path)
-
-def iniciar_camara_global():
-    try:
-        picam = Picamera2()
-        # Resolución nativa baja para ganar velocidad
-        config = picam.create_video_configuration(main={"size": (640, 480), "format": "RGB888"})
-        picam.configure(config)
-        picam.start()
-        print("📹 Cámara iniciada (Modo Rendimiento).")
-        return picam
+        camara = crear_fuente(fuente, tiempo_real=tiempo_real, bucle=bucle)
+        if fuente.startswith("picamera"):
+            print(f"📹 Cámara iniciada: {fuente} (Modo Rendimiento).")
+        else:
+            ritmo = "tiempo real" if tiempo_real else "máxima velocidad"
+            print(f"📹 Fuente iniciada: {fuente} ({ritmo}).")
+        return camara
     except Exception as e:
-        print(f"❌ Error cámara: {e}")
-        exit(1)
+        print(f"❌ Error cámara {fuente}: {e}")
+        sys.exit(1)
+
+def color_especie(especie):
+    # Rojo si es invasor, verde para fauna (BGR, como todo el pipeline)
+    return (0, 0, 255) if especie == "invasores" else (0, 255, 0)
 
 # -----------------------
 # MAIN LOOP
 # -----------------------
-def main():
+def main(fuente="picamera", tiempo_real=True, bucle=False, camaras_cli=None):
     print("🚀 ÑAWI APU: Iniciando motor de visión optimizado...")
+    # Los hilos que se creen desde aquí heredan estos núcleos
+    fijar_nucleos(NUCLEOS_PRINCIPAL)
     
-    influx = InfluxLogger()
-    picam = iniciar_camara_global()
+    bandeja = None
+    if BANDEJA_ACTIVA:
+        os.makedirs(os.path.dirname(BANDEJA_ARCHIVO), exist_ok=True)
+        bandeja = BandejaSalida(BANDEJA_ARCHIVO, presupuesto_mb=BANDEJA_PRESUPUESTO_MB)
+    influx = InfluxLogger(bandeja=bandeja)
+    camaras = cargar_camaras(CAMARAS_ARCHIVO, camaras_cli, fuente=fuente, id_unica=CAMARA_ID,
+                             cooldown=COOLDOWN_ALERTAS)
+    varias = len(camaras) > 1
+    for cam in camaras:
+        cam.picam = iniciar_camara_global(cam.fuente, tiempo_real=tiempo_real, bucle=bucle)
+    alertas = DespachadorAlertas(capacidad=ALERTAS_EN_COLA, politica=POLITICA_COLA_ALERTAS,
+                                 influx=influx, bandeja=bandeja,
+                                 agrupador=AgrupadorAlertas(VENTANAS_ALERTAS) if VENTANAS_ALERTAS else None,
+                                 texto_primero=ALERTAS_TEXTO_PRIMERO)
+    drenador = None
+    if bandeja is not None:
+        drenador = DrenadorBandeja(bandeja, {
+            "alerta": (alertas.reintentar, BANDEJA_ALERTAS_POR_MINUTO, BANDEJA_ALERTAS_POR_MINUTO),
+            "influx": (influx.reintentar, BANDEJA_LOTE_INFLUX, None),
+        })
 
-    especie_actual = None
-    modelo_actual = None
-    modo_sistema = "detenido"
-    
-    frame_count = 0
-    check_server_every = 60 # Revisar servidor menos frecuente para no frenar
-    ultimo_envio = {}
-    cooldown = 15
-    
-    # Variables para recordar la última detección (Anti-Flicker)
-    ultimas_cajas = [] 
-    ultimo_annotated = None
+    # Caché de modelos: cambiar de modo no vuelve a leer el .pt del disco.
+    # Con procesos de inferencia cada proceso tiene su caché y `modelos` es el servidor.
+    servidor = None
+    if PROCESOS_INFERENCIA > 0:
+        servidor = ServidorInferencia(MODELS_DIR, trabajadores=PROCESOS_INFERENCIA,
+                                      nucleos=NUCLEOS_INFERENCIA, memoria_max_mb=MEMORIA_MODELOS_MB,
+                                      backend=BACKEND_INFERENCIA, imgsz=IMG_SIZE,
+                                      precargar=PRECARGAR_MODELOS)
+        modelos = servidor
+    else:
+        modelos = RegistroModelos(MODELS_DIR, memoria_max_mb=MEMORIA_MODELOS_MB, imgsz=IMG_SIZE,
+                                  backend=BACKEND_INFERENCIA)
+        if PRECARGAR_MODELOS:
+            modelos.precargar_en_segundo_plano()
+
+    # El poller es dueño del modo y del modelo; los demás hilos solo leen su snapshot
+    poller = PollerModo(RAILWAY_URL, modelos.obtener, intervalo=INTERVALO_MODO,
+                        backoff_max=BACKOFF_MODO_MAX,
+                        liberar_modelos=modelos.descargar if REPOSO_DESCARGAR_MODELOS else None,
+                        sitio=SITIO)
+
+    # Valores vigentes de los parámetros afinables; el servidor puede pisarlos en caliente
+    defectos = {"skip_frames": SKIP_FRAMES, "conf_threshold": CONF_THRESHOLD, "img_size": IMG_SIZE,
+                "cooldown": COOLDOWN_ALERTAS, "check_server_every": INTERVALO_MODO}
+    ajustes = dict(defectos)
+    version_ajustes = [0]
+
+    def conf_predict():
+        # Con tracker se infiere más bajo: las cajas débiles mantienen pistas existentes
+        conf = ajustes["conf_threshold"]
+        return min(conf, TRACKER_CONF_BAJA) if TRACKER_ACTIVO else conf
+
+    def publicar_evidencia(especie, ruta_clip, ruta_hoja, camara):
+        # Va por la bandeja de salida como cualquier alerta: se reintenta sin red
+        if EVIDENCIA_SUBIR_HOJA:
+            titulo = f"🎞️ *EVIDENCIA {especie.upper()}*" + (f" - cámara {camara}" if varias else "")
+            alertas.publicar_evidencia(especie, ruta_clip, ruta_hoja,
+                                       es_amenaza=(especie == "invasores"), mensaje_prefix=titulo)
+
+    # --- PIPELINE por cámara: captura -> inferencia compartida (el frame más nuevo gana) ---
+    for cam in camaras:
+        # Con tracker: se alerta solo cuando aparece un animal nuevo
+        cam.tracker = TrackerAnimales(conf_alta=CONF_THRESHOLD, min_aciertos=TRACKER_MIN_ACIERTOS,
+                                      max_perdida_s=TRACKER_MAX_PERDIDA) if TRACKER_ACTIVO else None
+        # Con confirmación: K de M frames positivos antes de alertar
+        cam.confirmacion = ConfirmacionTemporal(k=CONFIRMACION_K, m=CONFIRMACION_M, iou_min=CONFIRMACION_IOU,
+                                                persistencia_s=CONFIRMACION_PERSISTENCIA
+                                                ) if CONFIRMACION_ACTIVA else None
+        cam.planificador = PlanificadorAdaptativo(
+            skip_inicial=SKIP_FRAMES, imgsz_inicial=IMG_SIZE,
+            objetivo_reposo=OBJETIVO_FPS_REPOSO, objetivo_alerta=OBJETIVO_FPS_ALERTA,
+            presupuesto_cpu=PRESUPUESTO_CPU, ajustar_resolucion=AJUSTAR_RESOLUCION,
+            resoluciones=tuple(r for r in RESOLUCIONES if r <= IMG_SIZE) or (IMG_SIZE,)
+        ) if PLANIFICADOR_ACTIVO else None
+        cam.movimiento = DetectorMovimiento(umbral=MOVIMIENTO_UMBRAL, area_minima=MOVIMIENTO_AREA_MIN,
+                                            forzar_cada=MOVIMIENTO_FORZAR_CADA,
+                                            mascara=MOVIMIENTO_MASCARA) if MOVIMIENTO_ACTIVO else None
+        cam.rois = cargar_rois(ROIS_ARCHIVO, cam.id, por_defecto=ROIS_POR_MODO)
+
+        # Anillo con los últimos segundos de video; el clip se arma fuera del hilo de visión
+        if EVIDENCIA_ACTIVA:
+            cam.anillo = AnilloFrames(segundos=EVIDENCIA_PRE + EVIDENCIA_POST + 2.0, fps=EVIDENCIA_FPS,
+                                      tamano=EVIDENCIA_TAMANO)
+            cam.grabador = GrabadorEvidencia(cam.anillo,
+                                             os.path.join(EVIDENCIA_DIR, cam.id) if varias else EVIDENCIA_DIR,
+                                             pre=EVIDENCIA_PRE, post=EVIDENCIA_POST,
+                                             codec=EVIDENCIA_CODEC,
+                                             al_terminar=lambda e, c, h, camara=cam.id: publicar_evidencia(e, c, h, camara))
+
+        cam.buffer_vista = BufferUltimoFrame("vista") if MOSTRAR_EN_PANTALLA else None
+        cam.pool = PoolFrames(FRAMES_EN_POOL)
+        cam.captura = HiloCaptura(cam.picam, [cam.buffer_frames, cam.buffer_vista, cam.anillo],
+                                  pool=cam.pool)
+        if varias:
+            cam.captura.name = f"captura-{cam.id}"
+
+    # Planear y registrar corren bajo el candado de InferenciaCamaras: lo que va antes
+    # y después de predict() (skip, movimiento, tracker, alertas) se serializa ahí
+    def aplicar_ajustes(bloque):
+        """Aplica un bloque de ajustes nuevo. Corre bajo el candado de inferencia, entre dos frames."""
+        version_ajustes[0] = bloque.version
+        nuevos = dict(defectos)
+        nuevos.update(bloque.valores)
+        cambios = {k: v for k, v in nuevos.items() if ajustes[k] != v}
+        ajustes.update(nuevos)
+        if not cambios:
+            return
+        for cam in camaras:
+            if "cooldown" in cambios and not cam.cooldown_propio:
+                cam.cooldown = ajustes["cooldown"]
+            if "conf_threshold" in cambios and cam.tracker is not None:
+                cam.tracker.conf_alta = ajustes["conf_threshold"]
+            if cam.planificador is not None:
+                cam.planificador.limitar(
+                    skip=cambios.get("skip_frames"), imgsz_max=cambios.get("img_size"),
+                    resoluciones=RESOLUCIONES)
+        # Ni los modelos ni la captura se tocan: el próximo frame ya usa los valores nuevos
+        print(f"🎛️ Ajustes v{bloque.version} aplicados: {cambios}")
+
+    def planear(cam, frame):
+        estado = poller.snapshot()
+        if estado.ajustes.version != version_ajustes[0]:
+            aplicar_ajustes(estado.ajustes)
+        if estado.modo == "detenido":
+            return None
+        if cam.modo is None:
+            especie_actual, modelo_actual = estado.especie, estado.modelo
+        else:
+            # Modo fijo: se vuelve a pedir el modelo cuando el poller publica (pudo descargarse)
+            if cam.version_modelo != estado.version:
+                cam.version_modelo = estado.version
+                cam.modelo_fijo = modelos.obtener(cam.modo)
+            especie_actual, modelo_actual = cam.modo, cam.modelo_fijo
+        if modelo_actual is None:
+            return None
+
+        # INFERENCIA IA (como máximo 1 de cada X frames capturados)
+        skip, imgsz = ajustes["skip_frames"], ajustes["img_size"]
+        if cam.planificador is not None:
+            cam.planificador.registrar_frame(frame.numero, frame.t_captura)
+            skip, imgsz = cam.planificador.skip, cam.planificador.imgsz
+        if not modelos.imgsz_variable(especie_actual):
+            imgsz = IMG_SIZE  # Modelo exportado con entrada fija (ni el planificador ni img_size lo cambian)
+        if frame.numero - cam.ultimo_analizado < skip:
+            return None
+        cam.ultimo_analizado = frame.numero
+
+        # Escena quieta -> no gastamos un predict()
+        if cam.movimiento is not None and not cam.movimiento.debe_inferir(frame.imagen):
+            return None
+
+        # Con ROIs se infiere solo sobre los recortes (en un batch), sino sobre el frame
+        recortes = recortar(frame.imagen, rois_del_modo(cam.rois, especie_actual), ROI_MARGEN)
+        return especie_actual, modelo_actual, imgsz, recortes
+
+    def predecir_entradas(especie, modelo, imgsz, conf, entradas):
+        if servidor is not None:
+            # Cada proceso recibe un frame por ranura de memoria compartida: sin lote entre cámaras
+            return [servidor.predecir(especie, imagen, imgsz, conf, recortes)
+                    for imagen, recortes in entradas]
+        # Todas las cámaras con el mismo modelo en un solo predict() (si el modelo admite lotes)
+        return predecir_lote(modelo, entradas, imgsz, conf, por_imagen=not modelos.imgsz_variable(especie))
+
+    cascada = Cascada(imgsz_cribado=CASCADA_IMGSZ, umbrales=CASCADA_UMBRALES, margen=CASCADA_MARGEN,
+                      max_recortes=CASCADA_MAX_RECORTES) if CASCADA_ACTIVA else None
+    cribadores = {}  # especie -> (versión del poller, clave, modelo) de la etapa uno
+
+    def modelo_cribado(especie):
+        """Modelo de la etapa uno: el chico si existe, si no el mismo a CASCADA_IMGSZ (None = sin cascada)."""
+        version = poller.snapshot().version
+        guardado = cribadores.get(especie)
+        if guardado is not None and guardado[0] == version:
+            return guardado[1:]
+        clave, modelo = None, None
+        chico = especie + CASCADA_SUFIJO_CRIBADO
+        if os.path.exists(os.path.join(MODELS_DIR, chico + ".pt")):
+            modelo = modelos.obtener(chico)
+            if modelo is not None and modelos.imgsz_variable(chico):
+                clave = chico
+            else:
+                modelo = None  # Exportado con entrada fija: no corre a CASCADA_IMGSZ
+        if modelo is None and modelos.imgsz_variable(especie):
+            clave, modelo = especie, modelos.obtener(especie)
+        # Si no, entrada fija y sin modelo chico utilizable: no se puede cribar a CASCADA_IMGSZ
+        cribadores[especie] = (version, clave, modelo)
+        return clave, modelo
+
+    def inferir(especie_actual, modelo_actual, imgsz, entradas):
+        if cascada is not None and imgsz > CASCADA_IMGSZ:
+            clave, cribador = modelo_cribado(especie_actual)
+            if cribador is not None:
+                return cascada.correr(
+                    especie_actual, entradas, imgsz,
+                    cribar=lambda e, sz, conf: predecir_entradas(clave, cribador, sz, conf, e),
+                    confirmar=lambda e, sz, conf: predecir_entradas(especie_actual, modelo_actual, sz, conf, e),
+                    conf=conf_predict())
+        return predecir_entradas(especie_actual, modelo_actual, imgsz, conf_predict(), entradas)
+
+    def registrar(cam, frame, especie_actual, cajas, velocidad, segundos):
+        # Las pistas se reinician aquí, bajo el candado (nadie más toca el tracker)
+        tracker, confirmacion = cam.tracker, cam.confirmacion
+        if especie_actual != cam.especie_seguida:
+            cam.especie_seguida = especie_actual
+            cam.nuevos_sin_alertar = 0
+            if tracker is not None:
+                tracker.reiniciar()
+            if confirmacion is not None:
+                confirmacion.reiniciar()
+
+        # La confirmación mira las cajas crudas sobre el umbral de alerta (antes del tracker)
+        confirmado = True
+        if confirmacion is not None:
+            confirmado = confirmacion.registrar(cajas.filtrar(cajas.conf >= ajustes["conf_threshold"]),
+                                                frame.t_captura, especie_actual)
+
+        nuevos = []
+        if tracker is not None:
+            cajas, nuevos = tracker.actualizar(cajas, frame.t_captura)
+            cam.nuevos_sin_alertar += len(nuevos)
+        
+        # Contamos detecciones REALES ahora (ya en coordenadas del frame completo)
+        detecciones = len(cajas)
+        if cam.planificador is not None:
+            cam.planificador.registrar_inferencia(segundos, detecciones > 0)
+
+        # Tiempos internos de ultralytics (ms): letterbox, red y NMS
+        METRICAS.registrar("preprocesado", velocidad.get("preprocess", 0.0) / 1000)
+        METRICAS.registrar("inferencia", velocidad.get("inference", 0.0) / 1000)
+        METRICAS.registrar("postprocesado", velocidad.get("postprocess", 0.0) / 1000)
+        METRICAS.contar("inferencias")
+
+        # --- ALERTA ---
+        if detecciones > 0:
+            if cam.movimiento is not None:
+                cam.movimiento.marcar_deteccion()
+            ahora = time.time()
+            ultimo = cam.ultimo_envio.get(especie_actual, 0)
+            # Con tracker, un animal que sigue en cuadro no vuelve a alertar
+            hay_nuevos = tracker is None or cam.nuevos_sin_alertar > 0
+            # Los animales nuevos quedan pendientes hasta que la confirmación pase
+            if confirmado and hay_nuevos and ahora - ultimo >= cam.cooldown:
+                print(f"🔔 ¡ALERTA! {detecciones} {especie_actual}" + (f" (cámara {cam.id})" if varias else ""))
+                
+                titulo = "🔔 DETECCIÓN"
+                if especie_actual == "invasores": titulo = "🚨 *ALERTA DE SEGURIDAD*"
+                elif especie_actual == "gaviotines": titulo = "🐦 *ACTIVIDAD GAVIOTINES*"
+                elif especie_actual == "tortugas": titulo = "🐢 *MONITOREO TORTUGAS*"
+                if varias:
+                    titulo += f" - cámara {cam.id}"
+
+                # El frame especial para la foto de WhatsApp (Alta calidad) se dibuja
+                # en el worker de alertas, no en el hilo de visión. Es la única copia
+                # del frame: el original vuelve al pool de la captura al terminar la ronda.
+                def frame_alerta(imagen=frame.imagen.copy(), cajas=cajas, especie=especie_actual):
+                    with METRICAS.medir("anotacion"):
+                        return dibujar(imagen, cajas, especie.upper(), color_especie(especie), copiar=False)
+
+                # Solo encolamos: subida, Railway e InfluxDB van en segundo plano
+                alertas.encolar(
+                    especie=especie_actual,
+                    cantidad=detecciones,
+                    frame=frame_alerta,
+                    es_amenaza=(especie_actual == "invasores"),
+                    mensaje_prefix=titulo,
+                    confianza=cajas.confianza_max(),
+                    unicos=tracker.individuos_unicos if tracker is not None else None,
+                    camara=cam.id,
+                    t_origen=frame.t_captura
+                )
+                cam.ultimo_envio[especie_actual] = ahora
+                cam.nuevos_sin_alertar = 0
+                if cam.grabador is not None:
+                    cam.grabador.solicitar(frame.t_captura, especie_actual)
+
+        return (especie_actual, cajas)
+
+    inferencia = InferenciaCamaras(camaras, planear, inferir, registrar,
+                                   hilos=max(1, PROCESOS_INFERENCIA), max_camaras=CAMARAS_POR_RONDA)
+
+    def volcar_suprimidos(influx):
+        # Episodios que no pasaron la confirmación: se registran desde el hilo de reporte
+        for cam in camaras:
+            if cam.confirmacion is None:
+                continue
+            for e in cam.confirmacion.extraer_suprimidos():
+                influx.log_suppressed(e["especie"], e["cantidad"], e["confianza"], e["positivos"],
+                                      e["duracion_s"], camera=cam.id)
+
+    reporte = ReportePeriodico(influx, intervalo=INTERVALO_METRICAS, extras=[volcar_suprimidos])
+
+    def al_reanudar():
+        # Al volver del reposo el fondo de la compuerta de movimiento ya no sirve
+        for cam in camaras:
+            if cam.movimiento is not None:
+                cam.movimiento.reiniciar()
+
+    reposo = ControlReposo([cam.captura for cam in camaras], camara=REPOSO_CAMARA,
+                           intervalo_lento=REPOSO_INTERVALO, al_reanudar=al_reanudar)
+
+    def reportar(estado, segundos):
+        """Imprime el estado de cada etapa y lo deja como medidores para InfluxDB."""
+        m = inferencia.metricas()
+        print(f"📊 Inferencia: {m['procesados'] / segundos if segundos > 0 else 0.0:.1f} fps "
+              f"lotes={m['lotes']} ({m['imagenes_por_lote']} img/lote) errores={m['errores']}"
+              + f" | modo {estado.modo} ({'online' if poller.en_linea else 'offline'})")
+        METRICAS.fijar_varios("inferencia", m)
+        METRICAS.fijar_varios("poller", poller.metricas())
+
+        m = reposo.metricas()
+        print(f"💤 Reposo: {m['segundos_reposo']} s cpu={m['cpu_reposo_pct']}% "
+              f"(activo {m['cpu_activo_pct']}%) reanudación={m['reanudacion_ms']} ms "
+              f"(max {m['reanudacion_max_ms']})")
+        METRICAS.fijar_varios("reposo", m)
+
+        m = modelos.metricas()
+        print(f"📦 Modelos: {m['en_cache']} {m['memoria_mb']} MB "
+              f"aciertos={m['aciertos']} fallos={m['fallos']} carga={m['carga_s']} "
+              f"backends={m['backends']}"
+              + (f" procesos={m['procesos_vivos']} espera={m['espera_ms']} ms reemplazos={m['reemplazos']}" if servidor is not None else ""))
+        METRICAS.fijar_varios("modelos", m)
+
+        if cascada is not None:
+            m = cascada.metricas()
+            print(f"🔎 Cascada: etapa dos en {m['etapa_dos']}/{m['frames']} ({m['ratio_etapa_dos']:.0%}) "
+                  f"recortes={m['recortes']} completos={m['frames_completos']} "
+                  f"aceptadas={m['aceptadas']} confirmadas={m['confirmadas']} rechazados={m['rechazados']}")
+            METRICAS.fijar_varios("cascada", m)
+
+        for cam in camaras:
+            # Con una sola cámara los medidores conservan sus nombres de siempre
+            sufijo = f"_{cam.id}" if varias else ""
+            etiqueta = f"[{cam.id}] " if varias else ""
+            print(f"📷 {etiqueta}" + resumen_metricas(cam.captura, [cam.buffer_frames, cam.buffer_vista],
+                                                       cam, segundos))
+            METRICAS.fijar_varios(f"camara{sufijo}", cam.metricas(segundos))
+            METRICAS.fijar_varios(f"buffer_captura{sufijo}", cam.buffer_frames.metricas())
+            METRICAS.fijar(f"fps_captura{sufijo}", cam.captura.frames / segundos if segundos > 0 else 0.0)
+            METRICAS.fijar_varios(f"pool_frames{sufijo}", cam.pool.metricas())
+
+            if cam.planificador is not None:
+                d = cam.planificador.decision()
+                print(f"⚙️ {etiqueta}Planificador: skip={d['skip']} imgsz={d['imgsz']} ({d['estado']}) "
+                      f"predict={d['latencia_ms']} ms cámara={d['fps_captura']} fps")
+                METRICAS.fijar_varios(f"planificador{sufijo}", d)
+
+            if cam.movimiento is not None:
+                m = cam.movimiento.metricas()
+                print(f"🌊 {etiqueta}Movimiento: saltados {m['saltados']}/{m['evaluados']} "
+                      f"({m['ratio_salto']:.0%}) forzados={m['forzados']}")
+                METRICAS.fijar_varios(f"movimiento{sufijo}", m)
+
+            if cam.tracker is not None:
+                m = cam.tracker.metricas()
+                print(f"🆔 {etiqueta}Tracker: activas={m['activas']} pistas={m['pistas']} "
+                      f"individuos={m['individuos_unicos']}")
+                METRICAS.fijar_varios(f"tracker{sufijo}", m)
+
+            if cam.confirmacion is not None:
+                m = cam.confirmacion.metricas()
+                print(f"✅ {etiqueta}Confirmación {CONFIRMACION_K}/{CONFIRMACION_M}: "
+                      f"positivos={m['positivos']} confirmados={m['confirmados']} "
+                      f"episodios={m['episodios']} suprimidos={m['suprimidos']}")
+                METRICAS.fijar_varios(f"confirmacion{sufijo}", m)
+
+            if cam.grabador is not None:
+                m = cam.grabador.metricas()
+                print(f"🎬 {etiqueta}Evidencia: clips={m['clips']} fallidos={m['fallidos']} "
+                      f"solapados={m['solapados']} perdidos={m['frames_perdidos']} "
+                      f"último={m['ultima_duracion_s']} s")
+                METRICAS.fijar_varios(f"evidencia{sufijo}", m)
+                METRICAS.fijar_varios(f"anillo{sufijo}", cam.anillo.metricas())
+
+        m = alertas.metricas()
+        print(f"📨 Alertas: cola={m['profundidad']} enviadas={m['enviadas']} "
+              f"fallidas={m['fallidas']} descartadas={m['descartadas']} "
+              f"coalescidas={m['coalescidas']} agrupadas={m['agrupadas']} "
+              f"espera={m['latencia_cola_ms']} ms "
+              f"(p95 {m['latencia_cola_p95_ms']})")
+        print(f"   Punta a punta: amenazas={m['latencia_amenaza_ms']} ms (p95 {m['latencia_amenaza_p95_ms']}) "
+              f"fauna={m['latencia_fauna_ms']} ms (p95 {m['latencia_fauna_p95_ms']}) "
+              f"fotos de seguimiento={m['fotos_seguimiento']}")
+        METRICAS.fijar_varios("alertas", m)
+
+        m = TRANSPORTE.totales()
+        print(f"🌐 HTTP: solicitudes={m['solicitudes']} errores={m['errores']} reintentos={m['reintentos']} "
+              f"enviado={m['bytes_enviados'] / 1024:.0f} KB recibido={m['bytes_recibidos'] / 1024:.0f} KB")
+        METRICAS.fijar_varios("http", TRANSPORTE.metricas())
+
+        if bandeja is not None:
+            m = bandeja.metricas()
+            print(f"📮 Bandeja: pendientes={m['pendientes']} (alertas={m['alertas_pendientes']} "
+                  f"influx={m['influx_pendientes']}, {m['mb']} MB) entregados={m['entregados']} "
+                  f"reintentos={m['reintentos']} descartados={m['descartados']}")
+            METRICAS.fijar_varios("bandeja", m)
+
+    def mostrar(cam, estado, timeout):
+        """Dibuja el último frame de la cámara con sus cajas. False si no había frame."""
+        item = cam.buffer_vista.obtener(timeout=timeout)
+        if item is None:
+            return False
+        # Dibujamos sobre una copia reutilizada y el frame vuelve enseguida al pool
+        if cam.vista is None or cam.vista.shape != item.imagen.shape:
+            cam.vista = np.empty_like(item.imagen)
+        np.copyto(cam.vista, item.imagen)
+        item.liberar()
+        frame_bgr = cam.vista
+        ventana = f"Nawi Apu - {cam.id}" if varias else "Nawi Apu"
+
+        # 3. MODO STANDBY (Solo mostrar video limpio)
+        if estado.modo == "detenido" or cam.especie(estado) is None:
+            cv2.putText(frame_bgr, "STANDBY - AHORRO DE ENERGIA", (50, 50), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+            cv2.imshow(ventana, frame_bgr)
+            return True
+
+        # 4. DIBUJAR (Visualización Rápida con OpenCV)
+        # En lugar de usar plot() que es lento, dibujamos manualmente los cuadros guardados
+        # sobre el frame actual. Así el video se ve fluido.
+        ultimo_resultado = cam.buffer_resultados.ultimo()
+        if ultimo_resultado is not None:
+            especie_cajas, ultimas_cajas = ultimo_resultado
+            # Dibujamos las cajas "recordadas"
+            dibujar(frame_bgr, ultimas_cajas, especie_cajas.upper(),
+                    color_especie(especie_cajas), copiar=False)
+
+        cv2.imshow(ventana, frame_bgr)
+        return True
+
+    poller.start()
+    for cam in camaras:
+        cam.captura.start()
+        if cam.grabador is not None:
+            cam.grabador.start()
+    inferencia.start()
+    reporte.start()
+    if drenador is not None:
+        drenador.start()
+
+    t_inicio = time.monotonic()
+    ultimo_reporte = t_inicio
+    version_vista = 0
 
     try:
         while True:
-            # 1. Captura (SIEMPRE RÁPIDA)
-            try:
-                frame = picam.capture_array()
-            except:
+            # Fin de video / carpeta en todas las cámaras: no hay más nada que analizar
+            if not any(cam.captura.is_alive() for cam in camaras):
+                break
+
+            # 1. Cambios de modo publicados por el poller (lectura sin bloqueo)
+            estado = poller.snapshot()
+            if estado.version != version_vista:
+                version_vista = estado.version
+                for cam in camaras:
+                    if cam.especie(estado) != cam.especie_vista:
+                        cam.especie_vista = cam.especie(estado)
+                        cam.buffer_resultados.limpiar() # Limpiar cajas viejas
+                        if cam.movimiento is not None:
+                            cam.movimiento.reiniciar()
+
+            # Standby real: cámaras apagadas (o lentas) y sin inferencias
+            if estado.modo == "detenido":
+                reposo.entrar()
+            else:
+                reposo.salir(inferencia.procesados)
+                reposo.verificar_reanudacion(inferencia.procesados)
+
+            # 2. Métricas del pipeline (cada 30 s)
+            ahora = time.monotonic()
+            if ahora - ultimo_reporte >= 30:
+                ultimo_reporte = ahora
+                reportar(estado, ahora - t_inicio)
+
+            if reposo.en_reposo:
+                # Dormimos hasta que el poller publique otro modo (o toque reportar)
+                poller.esperar_cambio(version_vista, timeout=max(0.1, 30 - (time.monotonic() - ultimo_reporte)))
                 continue
 
-            # 2. Lógica de Servidor (Solo a veces)
-            if frame_count % check_server_every == 0:
-                nuevo_modo = get_mode()
-                if nuevo_modo and nuevo_modo != modo_sistema:
-                    print(f"🔄 Cambio de modo: {nuevo_modo}")
-                    modo_sistema = nuevo_modo
-                    if modo_sistema not in ["detenido", None] and modo_sistema != especie_actual:
-                        modelo_actual = cargar_modelo(modo_sistema)
-                        especie_actual = modo_sistema
-                        ultimas_cajas = [] # Limpiar cajas viejas
-
-            # 3. MODO STANDBY (Solo mostrar video limpio)
-            if modo_sistema == "detenido" or modelo_actual is None:
-                if MOSTRAR_EN_PANTALLA:
-                    frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-                    cv2.putText(frame_bgr, "STANDBY - AHORRO DE ENERGIA", (50, 50), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                    cv2.imshow("Nawi Apu", frame_bgr)
-                    if cv2.waitKey(1) & 0xFF == ord("q"): break
+            if not MOSTRAR_EN_PANTALLA:
                 time.sleep(0.05)
                 continue
 
-            # 4. INFERENCIA IA (Solo 1 de cada X frames)
-            if frame_count % SKIP_FRAMES == 0:
-                # Corremos YOLO
-                results = modelo_actual.predict(
-                    source=frame,
-                    conf=CONF_THRESHOLD,
-                    imgsz=IMG_SIZE, # Usamos tamaño reducido
-                    device="cpu",
-                    verbose=False
-                )
-                
-                # Guardamos las cajas para dibujarlas en los frames que saltamos
-                ultimas_cajas = results[0].boxes
-                
-                # Contamos detecciones REALES ahora
-                detecciones = len(ultimas_cajas)
-
-                # --- ALERTA ---
-                if detecciones > 0:
-                    ahora = time.time()
-                    ultimo = ultimo_envio.get(especie_actual, 0)
-                    if ahora - ultimo >= cooldown:
-                        print(f"🔔 ¡ALERTA! {detecciones} {especie_actual}")
-                        
-                        titulo = "🔔 DETECCIÓN"
-                        if especie_actual == "invasores": titulo = "🚨 *ALERTA DE SEGURIDAD*"
-                        elif especie_actual == "gaviotines": titulo = "🐦 *ACTIVIDAD GAVIOTINES*"
-                        elif especie_actual == "tortugas": titulo = "🐢 *MONITOREO TORTUGAS*"
-
-                        # Dibujamos frame especial para la foto de WhatsApp (Alta calidad)
-                        frame_alerta = results[0].plot()
-                        frame_alerta = cv2.cvtColor(frame_alerta, cv2.COLOR_RGB2BGR)
-
-                        enviar_alerta(
-                            especie=especie_actual,
-                            cantidad=detecciones,
-                            frame=frame_alerta,
-                            es_amenaza=(especie_actual == "invasores"),
-                            mensaje_prefix=titulo
-                        )
-                        ultimo_envio[especie_actual] = ahora
-
-                        #registrar en influxdb
-                        influx.log_detection(
-                            species=especie_actual,
-                            count=detecciones,
-                            confidence=0.75,  # Si no tienes confianza calculada, puedes poner un valor fijo
-                            image_path=None
-                        )
-
-            # 5. DIBUJAR (Visualización Rápida con OpenCV)
-            # En lugar de usar plot() que es lento, dibujamos manualmente los cuadros guardados
-            # sobre el frame actual. Así el video se ve fluido.
-            
-            if MOSTRAR_EN_PANTALLA:
-                frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-                
-                # Dibujamos las cajas "recordadas"
-                for box in ultimas_cajas:
-                    x1, y1, x2, y2 = box.xyxy[0].int().tolist()
-                    # Color verde (0, 255, 0) o Rojo si es invasor
-                    color = (0, 0, 255) if especie_actual == "invasores" else (0, 255, 0)
-                    cv2.rectangle(frame_bgr, (x1, y1), (x2, y2), color, 2)
-                    # Etiqueta
-                    cv2.putText(frame_bgr, especie_actual.upper(), (x1, y1 - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-
-                cv2.imshow("Nawi Apu", frame_bgr)
-                if cv2.waitKey(1) & 0xFF == ord("q"):
-                    break
-
-            frame_count += 1
+            # Una ventana por cámara; la espera total se reparte entre todas
+            mostrados = [mostrar(cam, estado, 0.5 / len(camaras)) for cam in camaras]
+            if any(mostrados) and cv2.waitKey(1) & 0xFF == ord("q"):
+                break
 
     except KeyboardInterrupt:
         pass
     finally:
-        picam.stop()
+        reporte.detener()
+        poller.detener()
+        for cam in camaras:
+            cam.captura.detener()
+        inferencia.detener()
+        for cam in camaras:
+            cam.captura.join(timeout=2)
+        inferencia.join(timeout=5)
+        for cam in camaras:
+            if cam.grabador is not None:
+                cam.grabador.detener()
+                cam.grabador.join(timeout=5)
+        if drenador is not None:
+            drenador.detener()
+            drenador.join(timeout=15)
+        alertas.detener()
+        if bandeja is not None:
+            # Un envío que venció los joins todavía puede confirmar o fallar su fila
+            if (drenador is not None and drenador.is_alive()) or alertas.vivo():
+                print("⚠️ Quedan envíos en curso: la bandeja se cierra con el proceso.")
+            else:
+                bandeja.cerrar()
+        TRANSPORTE.cerrar()
+        if servidor is not None:
+            servidor.detener()
+        for cam in camaras:
+            cam.picam.stop()
         cv2.destroyAllWindows()
         print("Apagado.")
 
 if __name__ == "__main__":
-    main()
-
-
-
-
-
+    parser = argparse.ArgumentParser(description="Ñawi Apu - motor de visión")
+    parser.add_argument("--fuente", default="picamera",
+                        help="picamera[:N] | sintetica | carpeta(s) separadas por coma | video | rtsp://...")
+    parser.add_argument("--camara", action="append", metavar="ID=FUENTE",
+                        help="Agregar una cámara (repetible), ej: --camara norte=picamera:0 "
+                             "--camara sur=picamera:1. Reemplaza a --fuente y a data/camaras.json")
+    parser.add_argument("--rapido", action="store_true",
+                        help="Entregar frames lo más rápido posible (sin respetar el fps de la fuente)")
+    parser.add_argument("--bucle", action="store_true", help="Repetir videos/carpetas al terminar")
+    args = parser.parse_args()
+    main(fuente=args.fuente, tiempo_real=not args.rapido, bucle=args.bucle, camaras_cli=args.camara)
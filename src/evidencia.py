@@ -0,0 +1,329 @@
+"""
+Clips de evidencia - Ñawi Apu
+
+Una foto sola no dice si la tortuga entraba o salía del nido. El anillo
+guarda los últimos segundos de video en arreglos reservados UNA sola vez (la
+captura solo copia píxeles a la ranura que toca, sin crear arreglos nuevos) y,
+cuando hay alerta, un hilo aparte arma un clip con pre-roll y post-roll más
+una hoja de contactos con fotogramas clave.
+
+El anillo se engancha a la captura como un buffer más del pipeline:
+
+    anillo = AnilloFrames(segundos=10, fps=8)
+    captura = HiloCaptura(picam, [buffer_frames, anillo])
+    grabador = GrabadorEvidencia(anillo, "images/evidencias")
+    grabador.solicitar(frame.t_captura, "tortugas")
+"""
+import os
+import time
+import datetime
+import threading
+from collections import deque
+import cv2
+import numpy as np
+from utils.perf_metrics import METRICAS
+
+# Códec -> extensión del contenedor. MJPG funciona con cualquier build de OpenCV;
+# avc1/H264 depende de que OpenCV tenga un encoder H.264 disponible.
+CODECS = {"MJPG": ".avi", "XVID": ".avi", "mp4v": ".mp4", "avc1": ".mp4", "H264": ".mp4"}
+
+
+class AnilloFrames:
+    def __init__(self, segundos=10.0, fps=8.0, tamano=None):
+        """
+        Anillo de frames preasignado.
+
+        Args:
+            segundos (float): Historia que se conserva (debe cubrir pre-roll + post-roll).
+            fps (float): Frames por segundo guardados (la cámara puede ir más rápido).
+            tamano (tuple, optional): (ancho, alto) de almacenamiento. None = tamaño
+                de la cámara; algo más chico ahorra memoria en la Raspberry.
+        """
+        self.fps = float(fps)
+        self.capacidad = max(2, int(round(segundos * self.fps)))
+        self.tamano = tamano
+        self._intervalo = 1.0 / self.fps
+        # Se reserva con el primer frame, cuando ya sabemos alto/ancho/canales
+        self._frames = None
+        self._tiempos = np.zeros(self.capacidad, dtype=np.float64)
+        self._secuencias = np.full(self.capacidad, -1, dtype=np.int64)
+        self._siguiente = 0
+        self._t_ultimo = None
+        self._cond = threading.Condition()
+        self.escritos = 0
+        self.omitidos = 0
+
+    def _reservar(self, imagen):
+        alto, ancho = imagen.shape[:2] if self.tamano is None else (self.tamano[1], self.tamano[0])
+        canales = imagen.shape[2] if imagen.ndim == 3 else 1
+        self._frames = np.empty((self.capacidad, alto, ancho, canales), dtype=np.uint8)
+        mb = self._frames.nbytes / (1024 * 1024)
+        print(f"🎞️ Anillo de evidencia: {self.capacidad} frames {ancho}x{alto} ({mb:.0f} MB)")
+
+    def publicar(self, frame):
+        """Interfaz de buffer del pipeline: copia el FrameCapturado a su ranura."""
+        if self._t_ultimo is not None and frame.t_captura - self._t_ultimo < self._intervalo * 0.9:
+            self.omitidos += 1
+            return
+        imagen = frame.imagen
+        if self._frames is None:
+            self._reservar(imagen)
+
+        ranura = self._siguiente % self.capacidad
+        destino = self._frames[ranura]
+        if imagen.shape[-1] != destino.shape[-1]:
+            self.omitidos += 1
+            return
+        # Ranura "en escritura": un lector que la esté copiando sabrá que fue pisada
+        self._secuencias[ranura] = -1
+        if imagen.shape == destino.shape:
+            np.copyto(destino, imagen)
+        else:
+            cv2.resize(imagen, (destino.shape[1], destino.shape[0]), dst=destino,
+                       interpolation=cv2.INTER_AREA)
+
+        with self._cond:
+            self._tiempos[ranura] = frame.t_captura
+            self._secuencias[ranura] = self._siguiente
+            self._siguiente += 1
+            self.escritos += 1
+            self._cond.notify_all()
+        self._t_ultimo = frame.t_captura
+
+    def forma(self):
+        """(alto, ancho, canales) de cada frame guardado, o None si todavía no llegó ninguno."""
+        return None if self._frames is None else self._frames.shape[1:]
+
+    def buscar(self, t):
+        """Secuencia del frame más viejo todavía guardado con t_captura >= t."""
+        with self._cond:
+            primero = max(0, self._siguiente - self.capacidad)
+            for secuencia in range(primero, self._siguiente):
+                ranura = secuencia % self.capacidad
+                if self._secuencias[ranura] == secuencia and self._tiempos[ranura] >= t:
+                    return secuencia
+            return self._siguiente
+
+    def esperar(self, secuencia, timeout):
+        """Bloquea hasta que exista el frame `secuencia`. Devuelve False si venció el timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._siguiente > secuencia, timeout)
+
+    def copiar(self, secuencia, destino, conversion=None):
+        """
+        Copia un frame guardado a `destino` (arreglo del lector, reutilizable).
+
+        Args:
+            conversion (int, optional): Código cv2.COLOR_* a aplicar en la misma pasada.
+
+        Returns:
+            float: t_captura del frame, o None si la captura ya lo pisó.
+        """
+        ranura = secuencia % self.capacidad
+        if self._secuencias[ranura] != secuencia:
+            return None
+        t = float(self._tiempos[ranura])
+        if conversion is None:
+            np.copyto(destino, self._frames[ranura])
+        else:
+            cv2.cvtColor(self._frames[ranura], conversion, dst=destino)
+        # Si la captura la reescribió mientras copiábamos, el frame puede estar mezclado
+        if self._secuencias[ranura] != secuencia:
+            return None
+        return t
+
+    def metricas(self):
+        return {
+            "capacidad": self.capacidad,
+            "escritos": self.escritos,
+            "omitidos": self.omitidos,
+            "memoria_mb": round(self._frames.nbytes / (1024 * 1024), 1) if self._frames is not None else 0.0,
+        }
+
+
+class PedidoClip:
+    __slots__ = ("t_alerta", "etiqueta", "t_pedido")
+
+    def __init__(self, t_alerta, etiqueta):
+        self.t_alerta = t_alerta
+        self.etiqueta = etiqueta
+        self.t_pedido = time.monotonic()
+
+
+class GrabadorEvidencia(threading.Thread):
+    def __init__(self, anillo, carpeta, pre=4.0, post=4.0, codec="MJPG", miniaturas=6,
+                 al_terminar=None, max_pendientes=2, max_archivos=60):
+        """
+        Hilo que arma clips pre/post alerta leyendo del anillo.
+
+        Args:
+            anillo (AnilloFrames): Fuente de frames.
+            carpeta (str): Dónde se guardan clips y hojas de contactos.
+            pre (float): Segundos antes de la alerta.
+            post (float): Segundos después de la alerta.
+            codec (str): FourCC de OpenCV (ver CODECS). Si no abre se usa MJPG.
+            miniaturas (int): Fotogramas clave en la hoja de contactos.
+            al_terminar (callable, optional): f(etiqueta, ruta_clip, ruta_hoja).
+            max_pendientes (int): Pedidos en espera; los demás se descartan.
+            max_archivos (int): Clips conservados en disco (se borran los más viejos).
+        """
+        super().__init__(name="evidencia", daemon=True)
+        self.anillo = anillo
+        self.carpeta = carpeta
+        self.pre = pre
+        self.post = post
+        self.codec = codec
+        self.miniaturas = max(1, int(miniaturas))
+        self.al_terminar = al_terminar
+        self.max_archivos = max_archivos
+        self._pedidos = deque(maxlen=max(1, int(max_pendientes)))
+        self._cond = threading.Condition()
+        self._detener = threading.Event()
+        # Fin del clip en curso: alertas dentro de esa ventana ya quedan grabadas
+        self._cubierto_hasta = {}
+        self.clips = 0
+        self.fallidos = 0
+        self.solapados = 0
+        self.frames_perdidos = 0
+        self.ultima_duracion = 0.0
+        os.makedirs(carpeta, exist_ok=True)
+
+    def solicitar(self, t_alerta, etiqueta):
+        """Pide un clip alrededor de t_alerta (monotonic, como FrameCapturado.t_captura)."""
+        with self._cond:
+            if t_alerta <= self._cubierto_hasta.get(etiqueta, float("-inf")):
+                self.solapados += 1
+                return False
+            self._cubierto_hasta[etiqueta] = t_alerta + self.post
+            self._pedidos.append(PedidoClip(t_alerta, etiqueta))
+            self._cond.notify()
+            return True
+
+    def run(self):
+        while not self._detener.is_set():
+            with self._cond:
+                self._cond.wait_for(lambda: self._pedidos or self._detener.is_set(), timeout=1.0)
+                if not self._pedidos:
+                    continue
+                pedido = self._pedidos.popleft()
+            inicio = time.monotonic()
+            try:
+                rutas = self._grabar(pedido)
+            except Exception as e:
+                rutas = None
+                print(f"❌ Error armando clip de evidencia: {e}")
+            if rutas is None:
+                self.fallidos += 1
+                continue
+            self.clips += 1
+            self.ultima_duracion = time.monotonic() - inicio
+            METRICAS.registrar("evidencia", self.ultima_duracion)
+            self._limpiar_viejos()
+            if self.al_terminar is not None:
+                try:
+                    self.al_terminar(pedido.etiqueta, *rutas)
+                except Exception as e:
+                    print(f"⚠️ Error publicando evidencia: {e}")
+
+    def _abrir(self, base, ancho, alto):
+        for codec in dict.fromkeys((self.codec, "MJPG")):
+            ruta = base + CODECS.get(codec, ".avi")
+            escritor = cv2.VideoWriter(ruta, cv2.VideoWriter_fourcc(*codec), self.anillo.fps, (ancho, alto))
+            if escritor.isOpened():
+                return escritor, ruta
+            escritor.release()
+        return None, None
+
+    def _grabar(self, pedido):
+        forma = self.anillo.forma()
+        if forma is None:
+            return None
+        alto, ancho, canales = forma
+        # Los frames ya son BGR; solo una cámara con canal alfa necesita conversión
+        conversion = cv2.COLOR_BGRA2BGR if canales == 4 else None
+
+        fecha = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        base = os.path.join(self.carpeta, f"evidencia_{fecha}_{pedido.etiqueta}")
+        escritor, ruta_clip = self._abrir(base, ancho, alto)
+        if escritor is None:
+            print("❌ OpenCV no pudo abrir ningún códec de video")
+            return None
+
+        # Un solo buffer de trabajo por clip: el anillo copia ahí y VideoWriter lee de ahí
+        trabajo = np.empty((alto, ancho, 3), dtype=np.uint8)
+        esperados = max(1, int(round((self.pre + self.post) * self.anillo.fps)))
+        claves = set(np.linspace(0, esperados - 1, self.miniaturas).round().astype(int).tolist())
+        hojas = []
+
+        t_fin = pedido.t_alerta + self.post
+        secuencia = self.anillo.buscar(pedido.t_alerta - self.pre)
+        escritos = 0
+        try:
+            while not self._detener.is_set():
+                # Post-roll: esperamos los frames que todavía no se capturaron
+                if not self.anillo.esperar(secuencia, timeout=max(1.0, self.post)):
+                    break
+                t = self.anillo.copiar(secuencia, trabajo, conversion)
+                secuencia += 1
+                if t is None:
+                    self.frames_perdidos += 1
+                    continue
+                if t > t_fin:
+                    break
+                escritor.write(trabajo)
+                if escritos in claves:
+                    hojas.append((t - pedido.t_alerta, cv2.resize(trabajo, (ancho // 3, alto // 3),
+                                                                  interpolation=cv2.INTER_AREA)))
+                escritos += 1
+        finally:
+            escritor.release()
+
+        if escritos == 0:
+            os.remove(ruta_clip)
+            return None
+        ruta_hoja = base + "_hoja.jpg"
+        cv2.imwrite(ruta_hoja, hoja_de_contactos(hojas))
+        print(f"🎬 Evidencia: {os.path.basename(ruta_clip)} ({escritos} frames, "
+              f"-{self.pre:.0f}s/+{self.post:.0f}s)")
+        return ruta_clip, ruta_hoja
+
+    def _limpiar_viejos(self):
+        archivos = sorted(
+            (os.path.join(self.carpeta, f) for f in os.listdir(self.carpeta) if f.startswith("evidencia_")),
+            key=os.path.getmtime
+        )
+        clips = [a for a in archivos if not a.endswith("_hoja.jpg")]
+        for ruta in clips[:max(0, len(clips) - self.max_archivos)]:
+            for archivo in (ruta, os.path.splitext(ruta)[0] + "_hoja.jpg"):
+                try:
+                    os.remove(archivo)
+                except OSError:
+                    pass
+
+    def detener(self):
+        self._detener.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def metricas(self):
+        return {
+            "clips": self.clips,
+            "fallidos": self.fallidos,
+            "solapados": self.solapados,
+            "pendientes": len(self._pedidos),
+            "frames_perdidos": self.frames_perdidos,
+            "ultima_duracion_s": round(self.ultima_duracion, 2),
+        }
+
+
+def hoja_de_contactos(miniaturas, columnas=3):
+    """Une [(segundos_desde_alerta, imagen_bgr), ...] en una grilla con la hora relativa."""
+    alto, ancho = miniaturas[0][1].shape[:2]
+    filas = (len(miniaturas) + columnas - 1) // columnas
+    hoja = np.zeros((filas * alto, columnas * ancho, 3), dtype=np.uint8)
+    for i, (dt, imagen) in enumerate(miniaturas):
+        y, x = (i // columnas) * alto, (i % columnas) * ancho
+        hoja[y:y + alto, x:x + ancho] = imagen
+        color = (0, 0, 255) if dt >= 0 else (255, 255, 255)
+        cv2.putText(hoja, f"{dt:+.1f}s", (x + 5, y + 18), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    return hoja
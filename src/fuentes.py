@@ -0,0 +1,239 @@
+"""
+Fuentes de frames intercambiables - Ñawi Apu
+
+El detector ya no depende de estar en la Raspberry: cualquier fuente que
+tenga capture_array() y stop() (la misma interfaz que Picamera2) sirve.
+
+    picamera                     -> cámara del Pi
+    picamera:1                   -> otra cámara del Pi (Pi 5 / CM4 con dos CSI)
+    video.mp4 / rtsp://...       -> archivo de video o stream (OpenCV)
+    images/capturas,detecciones  -> una o varias carpetas de imágenes (jpg/png)
+    sintetica                    -> frames generados con un "animal" en movimiento
+
+Todas entregan frames BGR, el mismo orden que la cámara del Pi (el formato
+"RGB888" de Picamera2 guarda los bytes como B, G, R) y que OpenCV/ultralytics,
+y pueden ir a ritmo real o lo más rápido posible. Las que pueden escribir
+sobre un arreglo ya reservado implementan capturar_en(destino), que usa
+HiloCaptura con un PoolFrames para no reservar memoria por frame.
+"""
+import os
+import glob
+import time
+import cv2
+import numpy as np
+from src.pipeline import FinDeFuente
+
+
+class FuenteFrames:
+    def __init__(self, fps=None, tiempo_real=True):
+        """
+        Args:
+            fps (float, optional): Ritmo nominal de la fuente.
+            tiempo_real (bool): Si True se respeta `fps`; si False se entrega
+                lo más rápido posible (para benchmarks).
+        """
+        self.fps = fps
+        self.tiempo_real = tiempo_real
+        self.frames_entregados = 0
+        self._proximo = None
+
+    def _leer(self, destino=None):
+        """Lee un frame; si `destino` no es None se intenta escribir ahí."""
+        raise NotImplementedError
+
+    def _esperar_turno(self):
+        if not (self.tiempo_real and self.fps):
+            return
+        ahora = time.monotonic()
+        if self._proximo is None:
+            self._proximo = ahora
+        elif self._proximo > ahora:
+            time.sleep(self._proximo - ahora)
+        else:
+            # Si nos atrasamos no intentamos "recuperar" frames
+            self._proximo = ahora
+        self._proximo += 1.0 / self.fps
+
+    def capture_array(self):
+        self._esperar_turno()
+        frame = self._leer()
+        self.frames_entregados += 1
+        return frame
+
+    def capturar_en(self, destino):
+        """Como capture_array(), pero reutilizando `destino`. Devuelve el arreglo con el frame."""
+        self._esperar_turno()
+        frame = self._leer(destino)
+        self.frames_entregados += 1
+        return frame
+
+    def pausar(self):
+        """Reposo: las fuentes de archivo no tienen nada que apagar."""
+
+    def reanudar(self):
+        # Sin esto, al volver intentaría "recuperar" el tiempo en reposo
+        self._proximo = None
+
+    def stop(self):
+        pass
+
+
+class FuentePicamera2(FuenteFrames):
+    def __init__(self, tamano=(640, 480), numero=0):
+        super().__init__(fps=None, tiempo_real=False)  # La cámara marca su propio ritmo
+        from picamera2 import Picamera2
+        self.picam = Picamera2(camera_num=numero)
+        # Resolución nativa baja para ganar velocidad
+        config = self.picam.create_video_configuration(main={"size": tamano, "format": "RGB888"})
+        self.picam.configure(config)
+        self.picam.start()
+
+    def _leer(self, destino=None):
+        if destino is None:
+            return self.picam.capture_array()
+        from picamera2 import MappedArray
+        # Copiamos directo desde el buffer DMA de la cámara al arreglo del pool
+        request = self.picam.capture_request()
+        try:
+            with MappedArray(request, "main") as m:
+                alto, ancho = destino.shape[:2]
+                np.copyto(destino, m.array[:alto, :ancho, :destino.shape[2]])
+        finally:
+            request.release()
+        return destino
+
+    def pausar(self):
+        # Detener el stream apaga el sensor y el ISP: es lo que más consume en reposo
+        self.picam.stop()
+
+    def reanudar(self):
+        self.picam.start()
+
+    def stop(self):
+        self.picam.stop()
+
+
+class FuenteVideo(FuenteFrames):
+    def __init__(self, origen, tiempo_real=True, bucle=False):
+        """
+        Args:
+            origen (str): Ruta de video o URL (rtsp://, http://).
+            bucle (bool): Volver al inicio al terminar (solo archivos).
+        """
+        self.origen = origen
+        self.es_stream = "://" in origen
+        self.cap = cv2.VideoCapture(origen)
+        if not self.cap.isOpened():
+            raise IOError(f"No se pudo abrir la fuente de video: {origen}")
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+        # Un stream ya llega a ritmo real: no hay que frenarlo
+        super().__init__(fps=fps, tiempo_real=tiempo_real and not self.es_stream)
+        self.bucle = bucle and not self.es_stream
+
+    def _leer(self, destino=None):
+        # VideoCapture.read() decodifica sobre `destino` si la forma coincide
+        ok, frame = self.cap.read(destino)
+        if not ok and self.bucle:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read(destino)
+        if not ok:
+            if self.es_stream:
+                raise IOError(f"Stream sin frames: {self.origen}")
+            raise FinDeFuente(self.origen)
+        return frame
+
+    def stop(self):
+        self.cap.release()
+
+
+class FuenteDirectorio(FuenteFrames):
+    EXTENSIONES = ("*.jpg", "*.jpeg", "*.png")
+
+    def __init__(self, carpetas, fps=10.0, tiempo_real=True, bucle=False, tamano=None):
+        """
+        Args:
+            carpetas (list|str): Una o varias carpetas con imágenes (orden alfabético).
+            tamano (tuple, optional): (ancho, alto) para redimensionar como la cámara.
+        """
+        super().__init__(fps=fps, tiempo_real=tiempo_real)
+        if isinstance(carpetas, str):
+            carpetas = [carpetas]
+        self.rutas = []
+        for carpeta in carpetas:
+            for patron in self.EXTENSIONES:
+                self.rutas += glob.glob(os.path.join(carpeta, patron))
+        self.rutas.sort()
+        if not self.rutas:
+            raise IOError(f"No hay imágenes en: {', '.join(carpetas)}")
+        self.bucle = bucle
+        self.tamano = tamano
+        self._indice = 0
+
+    def _leer(self, destino=None):
+        # imread siempre decodifica a un arreglo nuevo: `destino` no se usa
+        if self._indice >= len(self.rutas):
+            if not self.bucle:
+                raise FinDeFuente("fin de carpeta")
+            self._indice = 0
+        ruta = self.rutas[self._indice]
+        self._indice += 1
+        frame = cv2.imread(ruta)
+        if frame is None:
+            raise IOError(f"Imagen ilegible: {ruta}")
+        if self.tamano and (frame.shape[1], frame.shape[0]) != tuple(self.tamano):
+            frame = cv2.resize(frame, tuple(self.tamano), interpolation=cv2.INTER_AREA)
+        return frame
+
+
+class FuenteSintetica(FuenteFrames):
+    def __init__(self, tamano=(640, 480), fps=30.0, tiempo_real=True, total=None, semilla=0):
+        """
+        Escena de arena con ruido leve y un "animal" (elipse oscura) que cruza
+        el cuadro. No dispara YOLO con sentido, pero ejercita todo el pipeline.
+
+        Args:
+            total (int, optional): Cantidad de frames antes de terminar (None = infinito).
+        """
+        super().__init__(fps=fps, tiempo_real=tiempo_real)
+        self.ancho, self.alto = tamano
+        self.total = total
+        rng = np.random.default_rng(semilla)
+        self._fondo = np.full((self.alto, self.ancho, 3), (128, 178, 194), dtype=np.uint8)  # arena (BGR)
+        # Unos pocos patrones de ruido precalculados: generar ruido nuevo cada frame
+        # reservaría memoria y ensuciaría la medición de asignaciones
+        self._ruidos = [rng.integers(0, 6, size=(self.alto, self.ancho, 1), dtype=np.uint8).repeat(3, axis=2)
+                        for _ in range(4)]
+
+    def _leer(self, destino=None):
+        if self.total is not None and self.frames_entregados >= self.total:
+            raise FinDeFuente("fin de secuencia sintética")
+        if destino is None or destino.shape != self._fondo.shape:
+            destino = np.empty_like(self._fondo)
+        ruido = self._ruidos[self.frames_entregados % len(self._ruidos)]
+        cv2.add(self._fondo, ruido, dst=destino)
+        x = int((self.frames_entregados * 4) % (self.ancho + 80)) - 40
+        cv2.ellipse(destino, (x, self.alto * 2 // 3), (35, 20), 0, 0, 360, (40, 50, 60), -1)
+        return destino
+
+
+def crear_fuente(spec="picamera", tiempo_real=True, bucle=False, fps=None):
+    """
+    Crea una fuente a partir de un texto (ver docstring del módulo).
+
+    Args:
+        spec (str): "picamera[:N]", "sintetica", carpeta(s) separadas por coma,
+            ruta de video o URL.
+        tiempo_real (bool): Respetar el fps de la fuente.
+        bucle (bool): Repetir al terminar (videos y carpetas).
+        fps (float, optional): Ritmo para carpetas y fuente sintética.
+    """
+    if spec in (None, "", "picamera"):
+        return FuentePicamera2()
+    if spec.startswith("picamera:"):
+        return FuentePicamera2(numero=int(spec.split(":", 1)[1]))
+    if spec == "sintetica":
+        return FuenteSintetica(fps=fps or 30.0, tiempo_real=tiempo_real)
+    carpetas = [c.strip() for c in spec.split(",")]
+    if all(os.path.isdir(c) for c in carpetas):
+        return FuenteDirectorio(carpetas, fps=fps or 10.0, tiempo_real=tiempo_real, bucle=bucle)
+    return FuenteVideo(spec, tiempo_real=tiempo_real, bucle=bucle)
@@ -0,0 +1,195 @@
+"""
+Registro de modelos con caché LRU - Ñawi Apu
+
+Cambiar de modo por WhatsApp (tortugas, gaviotines, invasores) ya no
+construye un YOLO nuevo desde disco cada vez: los modelos cargados quedan en
+una caché limitada por memoria, se pueden precargar al arrancar y se
+"calientan" con una inferencia sobre un frame vacío para que el primer
+predict() real no pague ese costo.
+"""
+import os
+import gc
+import glob
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from ultralytics import YOLO
+from src import backends
+
+
+def memoria_modelo(modelo, ruta):
+    """Bytes aproximados que ocupa el modelo (parámetros + buffers, o el .pt si no se puede medir)."""
+    try:
+        red = modelo.model
+        total = sum(p.numel() * p.element_size() for p in red.parameters())
+        total += sum(b.numel() * b.element_size() for b in red.buffers())
+        if total > 0:
+            return total
+    except Exception:
+        pass
+    return os.path.getsize(ruta)
+
+
+class RegistroModelos:
+    def __init__(self, carpeta, memoria_max_mb=300, calentar=True, imgsz=640,
+                 forma_calentamiento=(480, 640, 3), backend="pytorch"):
+        """
+        Args:
+            carpeta (str): Carpeta con los modelos `<especie>.pt`.
+            memoria_max_mb (float): Memoria máxima para modelos en caché.
+            calentar (bool): Correr una inferencia de prueba tras cargar.
+            imgsz (int): Resolución usada en el calentamiento.
+            forma_calentamiento (tuple): Forma del frame vacío de calentamiento.
+            backend (str): "pytorch", "onnx", "openvino", "ncnn" o "auto"
+                (mide los runtimes instalados y usa el más rápido).
+        """
+        self.carpeta = carpeta
+        self.memoria_max = memoria_max_mb * 1024 * 1024
+        self.calentar = calentar
+        self.imgsz = imgsz
+        self.forma_calentamiento = forma_calentamiento
+        self.backend = backend
+
+        self._cache = OrderedDict()   # especie -> (modelo, bytes)
+        self._cargas = {}             # especie -> [Event, modelo] de la carga en curso
+        # Solo protege la caché y las cargas en curso: la carga en sí (exportar,
+        # medir, calentar) corre afuera y no frena a quien pide otro modelo
+        self._lock = threading.RLock()
+
+        # Métricas
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.tiempos_carga = {}       # especie -> segundos de la última carga (incl. calentamiento)
+        self.backends_usados = {}     # especie -> backend con el que se cargó
+
+    def ruta(self, especie):
+        return os.path.join(self.carpeta, f"{especie}.pt")
+
+    def disponibles(self):
+        """Especies con un .pt en la carpeta de modelos."""
+        return sorted(os.path.splitext(os.path.basename(p))[0]
+                      for p in glob.glob(os.path.join(self.carpeta, "*.pt")))
+
+    def memoria_usada(self):
+        return sum(b for _, b in self._cache.values())
+
+    def obtener(self, especie):
+        """
+        Devuelve el modelo de la especie, desde la caché o cargándolo. Si otro
+        hilo ya la está cargando, espera esa misma carga en vez de repetirla.
+
+        Returns:
+            El modelo YOLO, o None si no existe el archivo.
+        """
+        with self._lock:
+            if especie in self._cache:
+                self._cache.move_to_end(especie)
+                self.aciertos += 1
+                return self._cache[especie][0]
+            carga = self._cargas.get(especie)
+            propia = carga is None
+            if propia:
+                self.fallos += 1
+                carga = self._cargas[especie] = [threading.Event(), None]
+        if not propia:
+            carga[0].wait()
+            return carga[1]
+
+        try:
+            carga[1] = self._cargar_y_calentar(especie)
+        finally:
+            with self._lock:
+                del self._cargas[especie]
+            carga[0].set()
+        return carga[1]
+
+    def _cargar_y_calentar(self, especie):
+        modelo_path = self.ruta(especie)
+        if not os.path.exists(modelo_path):
+            print(f"❌ Modelo no encontrado: {modelo_path}")
+            return None
+
+        print(f"📦 Cargando IA: {especie}...")
+        t0 = time.monotonic()
+        modelo = self._cargar(especie, modelo_path)
+        if self.calentar:
+            self._calentar(modelo)
+        self.tiempos_carga[especie] = time.monotonic() - t0
+        print(f"✅ IA {especie} lista en {self.tiempos_carga[especie]:.1f} s "
+              f"({self.backends_usados[especie]})")
+
+        bytes_modelo = memoria_modelo(modelo, modelo_path)
+        with self._lock:
+            self._cache[especie] = (modelo, bytes_modelo)
+            self._desalojar(conservar=especie)
+        return modelo
+
+    def _cargar(self, especie, modelo_path):
+        if self.backend == "auto":
+            nombre, modelo, _ = backends.elegir_backend(modelo_path, imgsz=self.imgsz)
+        elif self.backend != "pytorch" and backends.disponible(self.backend):
+            nombre, modelo = self.backend, backends.cargar(modelo_path, self.backend, self.imgsz)
+        else:
+            nombre, modelo = "pytorch", None
+        if modelo is None:
+            # Cualquier problema con un backend optimizado -> volvemos a PyTorch
+            nombre, modelo = "pytorch", YOLO(modelo_path)
+        self.backends_usados[especie] = nombre
+        return modelo
+
+    def imgsz_variable(self, especie):
+        """False si el modelo quedó exportado a una resolución fija (p.ej. NCNN)."""
+        return backends.admite_imgsz_variable(self.backends_usados.get(especie, "pytorch"))
+
+    def _calentar(self, modelo):
+        frame = np.zeros(self.forma_calentamiento, dtype=np.uint8)
+        try:
+            modelo.predict(source=frame, imgsz=self.imgsz, device="cpu", verbose=False)
+        except Exception as e:
+            print(f"⚠️ Calentamiento del modelo falló: {e}")
+
+    def _desalojar(self, conservar):
+        while self.memoria_usada() > self.memoria_max and len(self._cache) > 1:
+            especie, _ = next(iter(self._cache.items()))
+            if especie == conservar:
+                break
+            del self._cache[especie]
+            self.desalojos += 1
+            print(f"🧹 Modelo {especie} liberado de la caché (límite de memoria)")
+
+    def descargar(self):
+        """Saca todos los modelos de la caché (reposo de bajo consumo)."""
+        with self._lock:
+            if not self._cache:
+                return
+            especies = list(self._cache)
+            self._cache.clear()
+        gc.collect()
+        print(f"🧹 Modelos descargados para el reposo: {', '.join(especies)}")
+
+    def precargar(self, especies=None):
+        """Carga (y calienta) varias especies; por defecto todos los modelos/*.pt."""
+        for especie in especies or self.disponibles():
+            self.obtener(especie)
+
+    def precargar_en_segundo_plano(self, especies=None):
+        """Igual que precargar() pero sin bloquear el arranque de la cámara."""
+        hilo = threading.Thread(target=self.precargar, args=(especies,),
+                                name="precarga", daemon=True)
+        hilo.start()
+        return hilo
+
+    def metricas(self):
+        with self._lock:
+            en_cache, memoria = list(self._cache.keys()), self.memoria_usada()
+        return {
+            "en_cache": en_cache,
+            "memoria_mb": round(memoria / (1024 * 1024), 1),
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "desalojos": self.desalojos,
+            "carga_s": {k: round(v, 2) for k, v in self.tiempos_carga.items()},
+            "backends": dict(self.backends_usados),
+        }
@@ -0,0 +1,174 @@
+"""
+Consulta del modo del servidor en segundo plano - Ñawi Apu
+
+Un hilo pregunta a Railway qué modo está activo (tortugas, gaviotines,
+invasores o detenido) y qué ajustes en caliente rigen (src/ajustes.py), carga
+el modelo cuando cambia y publica todo como una foto inmutable. El bucle de visión solo lee esa foto: cambiar de modo o
+quedarse sin internet no le cuesta nada.
+"""
+import random
+import threading
+from collections import namedtuple
+import requests
+from src.ajustes import SIN_AJUSTES, leer_bloque
+from utils.transporte import TRANSPORTE
+
+# Foto del estado que lee el hilo de visión. Se reemplaza entera (nunca se
+# modifica), así que leerla es atómico.
+EstadoModo = namedtuple("EstadoModo", ["modo", "especie", "modelo", "version", "ajustes"])
+
+
+def consultar_config(url_base, timeout=3.0, sitio=None):
+    """
+    Pide el modo actual (y los ajustes del sitio) a Railway.
+
+    Returns:
+        tuple: (modo informado por el servidor, "detenido" si no viene;
+                Ajustes o None si el servidor no manda bloque de ajustes)
+
+    Raises:
+        requests.RequestException: Si no hay conexión o el servidor responde con error.
+        ValueError: Si la respuesta no es JSON válido o no es un objeto.
+    """
+    r = TRANSPORTE.get(f"{url_base}/config", ruta="config", params={"site": sitio} if sitio else None,
+                       timeout=timeout)
+    r.raise_for_status()
+    datos = r.json()
+    if not isinstance(datos, dict):
+        # Un proxy o una página de error pueden devolver una lista o un texto JSON
+        raise ValueError(f"respuesta de /config inesperada: {type(datos).__name__}")
+    return datos.get("mode", "detenido"), leer_bloque(datos)
+
+
+class PollerModo(threading.Thread):
+    def __init__(self, url_base, cargar_modelo, intervalo=3.0, jitter=0.2,
+                 backoff_max=60.0, timeout=3.0, liberar_modelos=None, sitio=None):
+        """
+        Hilo dueño del modo del sistema.
+
+        Args:
+            url_base (str): URL de Railway.
+            cargar_modelo (callable): Recibe la especie y devuelve el modelo (o None).
+            intervalo (float): Segundos entre consultas cuando hay conexión.
+            jitter (float): Variación aleatoria relativa del intervalo (0.2 = ±20%).
+            backoff_max (float): Tope de espera cuando el servidor no responde.
+            timeout (float): Timeout HTTP (no afecta a la inferencia).
+            liberar_modelos (callable, optional): Si se pasa, al entrar en "detenido"
+                se suelta el modelo y se llama para liberar la RAM. Al reanudar
+                el modelo se vuelve a cargar (más lento, pero ahorra memoria).
+            sitio (str, optional): Se manda como ?site= para recibir los ajustes de este sitio.
+        """
+        super().__init__(name="modo", daemon=True)
+        self.url_base = url_base
+        self.cargar_modelo = cargar_modelo
+        self.intervalo = intervalo
+        self.intervalo_base = intervalo
+        self.jitter = jitter
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.liberar_modelos = liberar_modelos
+        self.sitio = sitio
+
+        self._estado = EstadoModo("detenido", None, None, 0, SIN_AJUSTES)
+        self._cambio = threading.Condition()
+        self._detener = threading.Event()
+
+        self.en_linea = False
+        self.fallos_seguidos = 0
+        self.consultas = 0
+        self.errores = 0
+
+    def snapshot(self):
+        """Estado actual (inmutable). Seguro de llamar desde cualquier hilo."""
+        return self._estado
+
+    def esperar_cambio(self, version, timeout=None):
+        """Bloquea hasta que la versión del estado sea distinta a `version`."""
+        with self._cambio:
+            self._cambio.wait_for(lambda: self._estado.version != version or self._detener.is_set(),
+                                  timeout)
+        return self._estado
+
+    def _publicar(self, modo, especie, modelo, ajustes=None):
+        with self._cambio:
+            actual = self._estado
+            self._estado = EstadoModo(modo, especie, modelo, actual.version + 1,
+                                      actual.ajustes if ajustes is None else ajustes)
+            self._cambio.notify_all()
+
+    def _aplicar(self, nuevo_modo):
+        actual = self._estado
+        # Mismo modo: nada que hacer, salvo que la carga del modelo haya fallado
+        reintento = nuevo_modo == actual.modo and nuevo_modo != "detenido" and actual.modelo is None
+        if nuevo_modo == actual.modo and not reintento:
+            return
+        print(f"🔁 Reintentando cargar el modelo de {nuevo_modo}" if reintento else f"🔄 Cambio de modo: {nuevo_modo}")
+        especie, modelo = actual.especie, actual.modelo
+        if nuevo_modo != "detenido" and (nuevo_modo != especie or modelo is None):
+            # La carga ocurre aquí, fuera del bucle de visión. Mientras tanto
+            # se sigue usando el estado anterior.
+            try:
+                modelo = self.cargar_modelo(nuevo_modo)
+            except Exception as e:
+                print(f"❌ Error cargando modelo {nuevo_modo}: {e}")
+                modelo = None
+            especie = nuevo_modo
+        if nuevo_modo == "detenido" and self.liberar_modelos is not None:
+            # Primero dejamos de publicar el modelo y después se libera
+            self._publicar(nuevo_modo, None, None)
+            self.liberar_modelos()
+            return
+        self._publicar(nuevo_modo, especie, modelo)
+
+    def _aplicar_ajustes(self, ajustes):
+        actual = self._estado
+        if ajustes is None or ajustes.version == actual.ajustes.version:
+            return
+        valores = dict(ajustes.valores)
+        print(f"🎛️ Ajustes v{ajustes.version} recibidos: {valores or 'valores por defecto'}")
+        # El intervalo de consulta es lo único que aplica el propio poller
+        self.intervalo = valores.get("check_server_every", self.intervalo_base)
+        self._publicar(actual.modo, actual.especie, actual.modelo, ajustes)
+
+    def _espera(self):
+        if self.fallos_seguidos == 0:
+            base = self.intervalo
+        else:
+            base = min(self.backoff_max, self.intervalo * (2 ** self.fallos_seguidos))
+        return base * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def run(self):
+        while not self._detener.is_set():
+            self.consultas += 1
+            try:
+                nuevo_modo, ajustes = consultar_config(self.url_base, timeout=self.timeout, sitio=self.sitio)
+            except (requests.RequestException, ValueError) as e:
+                self.errores += 1
+                self.fallos_seguidos += 1
+                if self.en_linea or self.fallos_seguidos == 1:
+                    print(f"📡 Servidor sin respuesta ({type(e).__name__}). Se mantiene modo '{self._estado.modo}'.")
+                self.en_linea = False
+            else:
+                if not self.en_linea and self.fallos_seguidos:
+                    print("📡 Conexión con el servidor recuperada.")
+                self.en_linea = True
+                self.fallos_seguidos = 0
+                self._aplicar(nuevo_modo)
+                self._aplicar_ajustes(ajustes)
+
+            self._detener.wait(self._espera())
+
+    def detener(self):
+        self._detener.set()
+        with self._cambio:
+            self._cambio.notify_all()
+
+    def metricas(self):
+        return {
+            "modo": self._estado.modo,
+            "ajustes_version": self._estado.ajustes.version,
+            "en_linea": self.en_linea,
+            "consultas": self.consultas,
+            "errores": self.errores,
+            "fallos_seguidos": self.fallos_seguidos,
+        }
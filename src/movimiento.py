@@ -0,0 +1,141 @@
+"""
+Compuerta de movimiento para la inferencia - Ñawi Apu
+
+Casi toda la noche la playa frente a los nidos no cambia. Antes de gastar
+un predict() de YOLO comparamos el frame (muy reducido y en grises) contra un
+fondo promedio: si nada se movió, no inferimos. Cada cierto tiempo se fuerza
+una inferencia igual, por si un animal quieto quedó en escena.
+"""
+import time
+import cv2
+import numpy as np
+
+
+class DetectorMovimiento:
+    def __init__(self, ancho=160, umbral=25, area_minima=0.002, aprendizaje=0.05,
+                 forzar_cada=10.0, mantener=3.0, mascara=None):
+        """
+        Args:
+            ancho (int): Ancho al que se reduce el frame para compararlo.
+            umbral (int): Diferencia de gris (0-255) para contar un pixel como
+                cambiado. Más bajo = más sensible.
+            area_minima (float): Fracción de la zona vigilada que debe cambiar
+                para considerar que hay movimiento.
+            aprendizaje (float): Velocidad con la que el fondo absorbe cambios
+                lentos (luz, marea).
+            forzar_cada (float): Segundos máximos sin inferir aunque no haya movimiento.
+            mantener (float): Segundos que se sigue infiriendo después del
+                último movimiento o detección.
+            mascara (list, optional): Polígonos con coordenadas normalizadas
+                (0-1), p.ej. [[(0.1, 0.5), (0.6, 0.5), (0.6, 1.0), (0.1, 1.0)]].
+                Solo se vigila el movimiento dentro de ellos.
+        """
+        self.ancho = ancho
+        self.umbral = umbral
+        self.area_minima = area_minima
+        self.aprendizaje = aprendizaje
+        self.forzar_cada = forzar_cada
+        self.mantener = mantener
+        self.poligonos = mascara
+
+        self._fondo = None
+        self._mascara = None
+        self._area = 0
+        self._ultima_inferencia = 0.0
+        self._activo_hasta = 0.0
+        self._pendiente_reinicio = False
+
+        # Métricas
+        self.evaluados = 0
+        self.saltados = 0
+        self.por_movimiento = 0
+        self.forzados = 0
+        self.ultima_fraccion = 0.0
+
+    def reiniciar(self):
+        """Olvida el fondo (p.ej. al cambiar de modo). El próximo frame se infiere.
+
+        Puede llamarse desde otro hilo: solo marca el pedido y el hilo de
+        inferencia lo aplica en su próxima evaluación.
+        """
+        self._pendiente_reinicio = True
+
+    def marcar_deteccion(self, ahora=None):
+        """Tras una detección seguimos infiriendo aunque el animal se quede quieto."""
+        ahora = time.monotonic() if ahora is None else ahora
+        self._activo_hasta = ahora + self.mantener
+
+    def _reducir(self, imagen):
+        alto = max(1, int(imagen.shape[0] * self.ancho / imagen.shape[1]))
+        pequeno = cv2.resize(imagen, (self.ancho, alto), interpolation=cv2.INTER_AREA)
+        if pequeno.ndim == 3:
+            codigo = cv2.COLOR_BGRA2GRAY if pequeno.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+            pequeno = cv2.cvtColor(pequeno, codigo)
+        return cv2.GaussianBlur(pequeno, (5, 5), 0)
+
+    def _preparar_mascara(self, forma):
+        alto, ancho = forma
+        if self.poligonos:
+            mascara = np.zeros((alto, ancho), dtype=np.uint8)
+            for poligono in self.poligonos:
+                puntos = np.array([[x * ancho, y * alto] for x, y in poligono], dtype=np.int32)
+                cv2.fillPoly(mascara, [puntos], 255)
+            self._mascara = mascara
+            self._area = max(1, cv2.countNonZero(mascara))
+        else:
+            self._mascara = None
+            self._area = alto * ancho
+
+    def hay_movimiento(self, imagen):
+        """Compara contra el fondo y lo actualiza. Devuelve True si algo cambió."""
+        gris = self._reducir(imagen)
+        if self._fondo is None or self._fondo.shape != gris.shape:
+            self._fondo = gris.astype(np.float32)
+            self._preparar_mascara(gris.shape)
+            return True
+
+        diferencia = cv2.absdiff(gris, cv2.convertScaleAbs(self._fondo))
+        _, binaria = cv2.threshold(diferencia, self.umbral, 255, cv2.THRESH_BINARY)
+        if self._mascara is not None:
+            binaria = cv2.bitwise_and(binaria, self._mascara)
+        self.ultima_fraccion = cv2.countNonZero(binaria) / self._area
+        cv2.accumulateWeighted(gris, self._fondo, self.aprendizaje)
+        return self.ultima_fraccion >= self.area_minima
+
+    def debe_inferir(self, imagen, ahora=None):
+        """
+        Decide si este frame merece un predict().
+
+        Returns:
+            bool: True si hubo movimiento, seguimos en ventana activa o toca
+            la inferencia forzada periódica.
+        """
+        ahora = time.monotonic() if ahora is None else ahora
+        self.evaluados += 1
+        if self._pendiente_reinicio:
+            self._pendiente_reinicio = False
+            self._fondo = None
+            self._ultima_inferencia = 0.0
+
+        if self.hay_movimiento(imagen):
+            self.por_movimiento += 1
+            self._activo_hasta = ahora + self.mantener
+        elif ahora >= self._activo_hasta:
+            if ahora - self._ultima_inferencia < self.forzar_cada:
+                self.saltados += 1
+                return False
+            self.forzados += 1
+
+        self._ultima_inferencia = ahora
+        return True
+
+    def metricas(self):
+        ratio = self.saltados / self.evaluados if self.evaluados else 0.0
+        return {
+            "evaluados": self.evaluados,
+            "saltados": self.saltados,
+            "por_movimiento": self.por_movimiento,
+            "forzados": self.forzados,
+            "ratio_salto": round(ratio, 3),
+            "ultima_fraccion": round(self.ultima_fraccion, 4),
+        }
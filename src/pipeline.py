@@ -0,0 +1,329 @@
+"""
+Pipeline concurrente de captura e inferencia - Ñawi Apu
+
+La cámara escribe en un buffer acotado donde siempre gana el frame más nuevo,
+y la inferencia corre en su propio hilo. Así un YOLO lento nunca frena la
+captura ni nos hace procesar frames viejos. El hilo de inferencia, compartido
+por todas las cámaras, está en src.camaras (InferenciaCamaras).
+
+Todo el pipeline trabaja en BGR (el "RGB888" de Picamera2 ya viene ordenado
+B, G, R en memoria, igual que OpenCV y ultralytics), así que no hay
+conversiones de color entre etapas.
+"""
+import time
+import threading
+from collections import deque
+import numpy as np
+from utils.perf_metrics import METRICAS
+
+
+class FinDeFuente(Exception):
+    """La fuente no tiene más frames (fin de video o de carpeta)."""
+
+
+def _retener(item):
+    if isinstance(item, FrameCapturado):
+        item.retener()
+
+
+def _liberar(item):
+    if isinstance(item, FrameCapturado):
+        item.liberar()
+
+
+class BufferUltimoFrame:
+    def __init__(self, nombre, capacidad=1, aviso=None):
+        """
+        Buffer acotado "el último gana" entre dos etapas del pipeline.
+
+        Con FrameCapturado el buffer retiene cada frame que guarda y libera los
+        que descarta; obtener() le pasa su referencia a quien lo llama, que
+        debe llamar a frame.liberar() al terminar.
+
+        Args:
+            nombre (str): Nombre de la etapa (para métricas).
+            capacidad (int): Máximo de elementos retenidos. Al llenarse se
+                descarta el más viejo.
+            aviso (threading.Event, optional): Se activa en cada publicación; sirve
+                para esperar a varios buffers a la vez (una cámara cualquiera).
+        """
+        self.nombre = nombre
+        self.aviso = aviso
+        self._cola = deque(maxlen=max(1, int(capacidad)))
+        self._cond = threading.Condition()
+        self._ultimo = None
+        self.escritos = 0
+        self.leidos = 0
+        self.descartados = 0
+
+    def publicar(self, item):
+        """Agrega un elemento; si el buffer está lleno descarta el más viejo."""
+        _retener(item)
+        with self._cond:
+            if len(self._cola) == self._cola.maxlen:
+                self.descartados += 1
+                _liberar(self._cola[0])
+            self._cola.append(item)
+            self._ultimo = item
+            self.escritos += 1
+            self._cond.notify_all()
+        if self.aviso is not None:
+            self.aviso.set()
+
+    def obtener(self, timeout=None):
+        """
+        Devuelve el elemento más nuevo y descarta los pendientes más viejos.
+
+        Returns:
+            El elemento, o None si venció el timeout sin datos.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._cola) > 0, timeout):
+                return None
+            item = self._cola.pop()
+            self.descartados += len(self._cola)
+            for viejo in self._cola:
+                _liberar(viejo)
+            self._cola.clear()
+            self.leidos += 1
+            return item
+
+    def ultimo(self):
+        """Último elemento publicado, sin consumirlo ni retenerlo (para dibujar en pantalla)."""
+        return self._ultimo
+
+    def limpiar(self):
+        with self._cond:
+            for viejo in self._cola:
+                _liberar(viejo)
+            self._cola.clear()
+            self._ultimo = None
+
+    def profundidad(self):
+        return len(self._cola)
+
+    def metricas(self):
+        return {
+            "profundidad": self.profundidad(),
+            "escritos": self.escritos,
+            "leidos": self.leidos,
+            "descartados": self.descartados,
+        }
+
+
+class FrameCapturado:
+    """
+    Frame junto con su número de secuencia y el instante de captura.
+
+    Si la imagen es de un PoolFrames, cada dueño (la captura, cada buffer,
+    quien lo obtiene de un buffer) lo retiene y lo libera; al llegar a cero el
+    arreglo vuelve al pool.
+    """
+    __slots__ = ("numero", "t_captura", "imagen", "pool")
+
+    def __init__(self, numero, t_captura, imagen, pool=None):
+        self.numero = numero
+        self.t_captura = t_captura
+        self.imagen = imagen
+        self.pool = pool
+
+    def retener(self):
+        if self.pool is not None:
+            self.pool.retener(self.imagen)
+        return self
+
+    def liberar(self):
+        if self.pool is not None:
+            self.pool.liberar(self.imagen)
+
+
+class PoolFrames:
+    def __init__(self, cantidad=6):
+        """
+        Arreglos de frame reservados una vez y reutilizados por la captura.
+
+        Cada arreglo lleva la cuenta de sus dueños: tomar() lo entrega con
+        uno, retener() suma y liberar() resta; con cero vuelve a estar libre.
+        Si todos están ocupados se reserva uno temporal (fuera del pool) y se
+        cuenta en `extra`.
+
+        Args:
+            cantidad (int): Arreglos en el pool. Debe cubrir los frames vivos
+                a la vez: el que se escribe, el de los buffers y el que se infiere.
+        """
+        self.cantidad = max(2, int(cantidad))
+        self._arreglos = []
+        self._duenos = []
+        self._lock = threading.Lock()
+        self._siguiente = 0
+        self.forma = None
+        self.reutilizados = 0
+        self.extra = 0
+
+    def _indice(self, arreglo):
+        # Por identidad: pocos arreglos, y los de afuera (extra, forma vieja) no cuentan
+        for i, propio in enumerate(self._arreglos):
+            if propio is arreglo:
+                return i
+        return None
+
+    def ajustar(self, forma):
+        """Fija la forma de los frames; si cambió, se descartan los arreglos viejos."""
+        with self._lock:
+            if forma != self.forma:
+                self._arreglos = []
+                self._duenos = []
+                self.forma = forma
+
+    def tomar(self, dtype=np.uint8):
+        """
+        Devuelve un arreglo libre (reservándolo si el pool todavía no está
+        lleno) con un dueño: quien lo toma debe liberarlo.
+        """
+        with self._lock:
+            for paso in range(len(self._arreglos)):
+                i = (self._siguiente + paso) % len(self._arreglos)
+                if self._duenos[i] == 0:
+                    self._duenos[i] = 1
+                    self._siguiente = i + 1
+                    self.reutilizados += 1
+                    return self._arreglos[i]
+            arreglo = np.empty(self.forma, dtype=dtype)
+            if len(self._arreglos) < self.cantidad:
+                self._arreglos.append(arreglo)
+                self._duenos.append(1)
+            else:
+                self.extra += 1
+            return arreglo
+
+    def retener(self, arreglo):
+        with self._lock:
+            i = self._indice(arreglo)
+            if i is not None:
+                self._duenos[i] += 1
+
+    def liberar(self, arreglo):
+        with self._lock:
+            i = self._indice(arreglo)
+            if i is not None and self._duenos[i] > 0:
+                self._duenos[i] -= 1
+
+    def ocupados(self):
+        with self._lock:
+            return sum(1 for d in self._duenos if d > 0)
+
+    def metricas(self):
+        return {
+            "arreglos": len(self._arreglos),
+            "ocupados": self.ocupados(),
+            "reutilizados": self.reutilizados,
+            "extra": self.extra,
+        }
+
+
+class HiloCaptura(threading.Thread):
+    def __init__(self, picam, salidas, pool=None):
+        """
+        Hilo que lee la cámara lo más rápido posible y publica cada frame.
+
+        Args:
+            picam: Objeto con método capture_array() (Picamera2 o una fuente de src.fuentes).
+                Si además tiene capturar_en(destino), se captura sobre arreglos del pool.
+            salidas (list): Buffers BufferUltimoFrame donde publicar (los None se ignoran).
+            pool (PoolFrames, optional): Arreglos reutilizables para no reservar memoria por frame.
+        """
+        super().__init__(name="captura", daemon=True)
+        self.picam = picam
+        self.salidas = [s for s in salidas if s is not None]
+        self.pool = pool if hasattr(picam, "capturar_en") else None
+        self.frames = 0
+        self.errores = 0
+        # Pausa mínima entre capturas (en standby se sube para ahorrar energía)
+        self.intervalo_minimo = 0.0
+        self.pausada = False
+        self._activa = threading.Event()
+        self._activa.set()
+        self._detener = threading.Event()
+
+    def _capturar(self):
+        # Sin pool (o sin forma conocida todavía) usamos la interfaz de Picamera2
+        if self.pool is None or self.pool.forma is None:
+            imagen = self.picam.capture_array()
+            if self.pool is not None:
+                self.pool.ajustar(imagen.shape)
+            return imagen
+        destino = self.pool.tomar()
+        try:
+            imagen = self.picam.capturar_en(destino)
+        except Exception:
+            self.pool.liberar(destino)
+            raise
+        if imagen is not destino:
+            # Una fuente que cambia de resolución devuelve su propio arreglo
+            self.pool.liberar(destino)
+            self.pool.ajustar(imagen.shape)
+        return imagen
+
+    def _dormir(self):
+        """Reposo: apaga el stream (si la fuente sabe) y bloquea hasta reanudar."""
+        if hasattr(self.picam, "pausar"):
+            self.picam.pausar()
+        self.pausada = True
+        self._activa.wait()
+        self.pausada = False
+        if not self._detener.is_set() and hasattr(self.picam, "reanudar"):
+            self.picam.reanudar()
+
+    def run(self):
+        while not self._detener.is_set():
+            if not self._activa.is_set():
+                self._dormir()
+                continue
+            t0 = time.monotonic()
+            try:
+                imagen = self._capturar()
+            except FinDeFuente:
+                print("🏁 Fuente de video terminada.")
+                break
+            except Exception:
+                self.errores += 1
+                time.sleep(0.01)
+                continue
+
+            ahora = time.monotonic()
+            METRICAS.registrar("captura", ahora - t0)
+            frame = FrameCapturado(self.frames, ahora, imagen, pool=self.pool)
+            for salida in self.salidas:
+                salida.publicar(frame)
+            # Cada buffer retuvo el suyo; el anillo de evidencia ya copió los píxeles
+            frame.liberar()
+            self.frames += 1
+
+            if self.intervalo_minimo > 0:
+                self._detener.wait(self.intervalo_minimo)
+
+    def pausar(self):
+        """Deja de capturar (el hilo queda bloqueado, sin consumir CPU)."""
+        self._activa.clear()
+
+    def reanudar(self):
+        self._activa.set()
+
+    def detener(self):
+        self._detener.set()
+        self._activa.set()
+
+
+def resumen_metricas(captura, buffers, inferencia, segundos):
+    """Texto corto con profundidad y descartes por etapa, para imprimir en consola."""
+    fps_captura = captura.frames / segundos if segundos > 0 else 0.0
+    fps_inferencia = inferencia.procesados / segundos if segundos > 0 else 0.0
+    partes = [f"captura {fps_captura:.1f} fps", f"inferencia {fps_inferencia:.1f} fps"]
+    for buffer in buffers:
+        if buffer is None:
+            continue
+        m = buffer.metricas()
+        partes.append(f"{buffer.nombre}: prof={m['profundidad']} desc={m['descartados']}")
+    m = inferencia.metricas()
+    partes.append(f"latencia {m['latencia_ms']} ms (max {m['latencia_max_ms']})")
+    return " | ".join(partes)
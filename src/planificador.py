@@ -0,0 +1,155 @@
+"""
+Planificador adaptativo de inferencia - Ñawi Apu
+
+En vez de fijar SKIP_FRAMES e IMG_SIZE a mano, medimos cuánto tarda cada
+predict() y a qué ritmo entrega frames la cámara, y elegimos cada cuántos
+frames inferir (y opcionalmente a qué resolución) para respetar un objetivo
+de inferencias por segundo sin pasarnos del presupuesto de CPU.
+Tras una detección se aprieta el ritmo; con la escena tranquila se relaja.
+"""
+import math
+import time
+
+
+class PlanificadorAdaptativo:
+    def __init__(self, skip_inicial=4, imgsz_inicial=640, objetivo_reposo=1.0,
+                 objetivo_alerta=5.0, presupuesto_cpu=0.6, skip_min=1, skip_max=30,
+                 resoluciones=(320, 480, 640), ajustar_resolucion=False,
+                 relajar_tras=30.0, suavizado=0.2, espera_resolucion=15.0):
+        """
+        Args:
+            skip_inicial (int): Valor de arranque del salto de frames.
+            imgsz_inicial (int): Resolución de arranque (y máxima si no se ajusta).
+            objetivo_reposo (float): Inferencias/s buscadas con la escena tranquila.
+            objetivo_alerta (float): Inferencias/s buscadas tras una detección.
+            presupuesto_cpu (float): Fracción del tiempo que puede ocupar predict() (0-1).
+            skip_min (int), skip_max (int): Límites del salto de frames.
+            resoluciones (tuple): Resoluciones permitidas si se ajusta imgsz.
+            ajustar_resolucion (bool): Si True también se baja/sube imgsz.
+            relajar_tras (float): Segundos sin detecciones para volver a reposo.
+            suavizado (float): Peso de cada medición nueva en los promedios.
+            espera_resolucion (float): Segundos mínimos entre cambios de imgsz.
+        """
+        self.objetivo_reposo = objetivo_reposo
+        self.objetivo_alerta = objetivo_alerta
+        self.presupuesto_cpu = presupuesto_cpu
+        self.skip_min = skip_min
+        self.skip_max = skip_max
+        self._limites_skip = (skip_min, skip_max)
+        self.skip_inicial = int(skip_inicial)
+        self.resoluciones = tuple(sorted(resoluciones))
+        self.ajustar_resolucion = ajustar_resolucion
+        self.relajar_tras = relajar_tras
+        self.suavizado = suavizado
+        self.espera_resolucion = espera_resolucion
+
+        self.skip = int(skip_inicial)
+        self.imgsz = int(imgsz_inicial)
+
+        self.latencia = None      # Segundos por predict() (promedio móvil)
+        self.fps_captura = None   # Frames/s entregados por la cámara
+        self._ultimo_frame = None  # (numero, t_captura) del último frame visto
+        self._ultima_deteccion = -math.inf
+        self._ultimo_cambio_res = 0.0
+
+    def _promediar(self, anterior, valor):
+        if anterior is None:
+            return valor
+        return anterior + self.suavizado * (valor - anterior)
+
+    def registrar_frame(self, numero, t_captura):
+        """
+        Llamar con cada frame que llega al worker. Como el buffer descarta
+        frames, el ritmo de la cámara se estima con los números de secuencia.
+        """
+        if self._ultimo_frame is not None:
+            numero_previo, t_previo = self._ultimo_frame
+            if numero > numero_previo and t_captura > t_previo:
+                fps = (numero - numero_previo) / (t_captura - t_previo)
+                self.fps_captura = self._promediar(self.fps_captura, fps)
+        self._ultimo_frame = (numero, t_captura)
+
+    def registrar_inferencia(self, segundos, hubo_deteccion, ahora=None):
+        """Llamar después de cada predict() con su duración."""
+        ahora = time.monotonic() if ahora is None else ahora
+        self.latencia = self._promediar(self.latencia, segundos)
+        if hubo_deteccion:
+            self._ultima_deteccion = ahora
+        self._recalcular(ahora)
+
+    def en_alerta(self, ahora=None):
+        ahora = time.monotonic() if ahora is None else ahora
+        return ahora - self._ultima_deteccion < self.relajar_tras
+
+    def _recalcular(self, ahora):
+        if not self.latencia or not self.fps_captura:
+            return
+
+        objetivo = self.objetivo_alerta if self.en_alerta(ahora) else self.objetivo_reposo
+        # Ritmo máximo que permite el presupuesto de CPU con la latencia actual
+        maximo_cpu = self.presupuesto_cpu / self.latencia
+        ritmo = min(objetivo, maximo_cpu)
+        skip = math.ceil(self.fps_captura / ritmo) if ritmo > 0 else self.skip_max
+        self.skip = max(self.skip_min, min(self.skip_max, skip))
+
+        if self.ajustar_resolucion and ahora - self._ultimo_cambio_res >= self.espera_resolucion:
+            self._ajustar_imgsz(objetivo, maximo_cpu, ahora)
+
+    def _ajustar_imgsz(self, objetivo, maximo_cpu, ahora):
+        if self.imgsz not in self.resoluciones:
+            return
+        i = self.resoluciones.index(self.imgsz)
+        if maximo_cpu < objetivo and i > 0:
+            # No llegamos al objetivo: bajar resolución
+            nuevo = self.resoluciones[i - 1]
+        elif maximo_cpu > 2 * objetivo and i < len(self.resoluciones) - 1:
+            # Sobra CPU de sobra: recuperar precisión
+            nuevo = self.resoluciones[i + 1]
+        else:
+            return
+        print(f"⚙️ Planificador: imgsz {self.imgsz} -> {nuevo}")
+        self.imgsz = nuevo
+        self.latencia = None  # La latencia medida ya no vale para la nueva resolución
+        self._ultimo_cambio_res = ahora
+
+    def limitar(self, skip=None, imgsz_max=None, resoluciones=(320, 480, 640)):
+        """
+        Ajustes en caliente: acota el salto de frames y/o la resolución máxima,
+        conservando lo medido de la cámara.
+
+        Ojo, `skip` (el skip_frames de los ajustes del servidor) no es un valor
+        fijo: el planificador lo recalcula en cada inferencia. Se toma como un
+        límite según de qué lado de skip_inicial quede:
+
+            skip > skip_inicial -> piso (skip_min): nunca infiere más seguido
+                                   que eso, para ahorrar CPU
+            skip < skip_inicial -> techo (skip_max): nunca infiere menos seguido
+                                   que eso, para no perder detecciones
+            skip == skip_inicial -> vuelven los límites originales
+
+        Ej. con SKIP_FRAMES=4, skip_frames=10 deja el salto entre 10 y 30, y
+        skip_frames=2 lo deja entre 1 y 2.
+        """
+        if skip is not None:
+            skip = int(skip)
+            self.skip_min, self.skip_max = self._limites_skip
+            if skip > self.skip_inicial:
+                self.skip_min, self.skip_max = skip, max(self.skip_max, skip)
+            elif skip < self.skip_inicial:
+                self.skip_min, self.skip_max = min(self.skip_min, skip), skip
+            self.skip = max(self.skip_min, min(self.skip_max, self.skip))
+        if imgsz_max is not None:
+            self.resoluciones = tuple(sorted({r for r in resoluciones if r < imgsz_max} | {imgsz_max}))
+            if self.imgsz not in self.resoluciones:
+                self.imgsz = self.resoluciones[-1]
+                self.latencia = None  # La latencia medida ya no vale para la nueva resolución
+
+    def decision(self):
+        """Decisiones actuales, para consola y monitoreo."""
+        return {
+            "skip": self.skip,
+            "imgsz": self.imgsz,
+            "estado": "alerta" if self.en_alerta() else "reposo",
+            "latencia_ms": round((self.latencia or 0.0) * 1000, 1),
+            "fps_captura": round(self.fps_captura or 0.0, 1),
+        }
@@ -0,0 +1,453 @@
+"""
+Inferencia en procesos aparte - Ñawi Apu
+
+Captura, poller de modo, subidas HTTP y YOLO compiten por el GIL dentro de
+un solo proceso. Con esto YOLO corre en uno o más procesos hijos:
+
+- Los frames viajan por un anillo de memoria compartida
+  (multiprocessing.shared_memory): el padre copia el frame a una ranura y
+  solo manda por la cola el número de ranura y la forma, nunca el frame
+  serializado. Las ranuras tienen el tamaño del frame más grande visto, así
+  que cámaras de distinta resolución conviven sin redimensionar.
+- Un proceso que no responde a tiempo se mata y se reemplaza: su ranura no
+  vuelve al pool hasta que nadie más puede estar leyéndola.
+- Cada proceso tiene su propio RegistroModelos y devuelve las cajas como
+  arreglos numpy chicos (xyxy, conf, cls).
+- Cada proceso puede quedar fijado a sus núcleos (os.sched_setaffinity) y
+  con python-prctl se le pone nombre (se ve en htop) y se asegura que muera
+  si el detector muere.
+
+    servidor = ServidorInferencia(MODELS_DIR, trabajadores=2, nucleos=[(2,), (3,)])
+    servidor.obtener("tortugas")
+    cajas, velocidad = servidor.predecir("tortugas", frame, 640, 0.6)
+"""
+import os
+import time
+import queue
+import signal
+import itertools
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+
+def fijar_nucleos(nucleos):
+    """Fija el hilo/proceso actual (y los hilos que cree después) a esos núcleos."""
+    if not nucleos or not hasattr(os, "sched_setaffinity"):
+        return False
+    try:
+        os.sched_setaffinity(0, set(nucleos))
+        return True
+    except OSError as e:
+        print(f"⚠️ No se pudo fijar núcleos {nucleos}: {e}")
+        return False
+
+
+def _nombrar_proceso(nombre):
+    """Nombre visible en ps/htop y muerte junto con el padre (python-prctl, opcional)."""
+    try:
+        import prctl
+    except ImportError:
+        return
+    prctl.set_name(nombre[:15])
+    prctl.set_proctitle(nombre)
+    prctl.set_pdeathsig(signal.SIGTERM)
+
+
+class AnilloCompartido:
+    def __init__(self, ranuras, tamano_ranura, nombre=None):
+        """
+        Ranuras de frame en memoria compartida.
+
+        Args:
+            ranuras (int): Frames que caben a la vez.
+            tamano_ranura (int): Bytes de cada ranura (el frame más grande que entra).
+            nombre (str, optional): Si se pasa, se adjunta a un anillo existente
+                (proceso hijo); si no, se crea uno nuevo (proceso padre).
+        """
+        self.ranuras = ranuras
+        self.tamano_ranura = int(tamano_ranura)
+        self.creador = nombre is None
+        tamano = ranuras * self.tamano_ranura
+        if self.creador:
+            self.shm = shared_memory.SharedMemory(create=True, size=tamano)
+        else:
+            self.shm = shared_memory.SharedMemory(name=nombre)
+            # El hijo solo lo usa: el que lo libera es el padre
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+            except Exception:
+                pass
+        self.nombre = self.shm.name
+
+    def vista(self, ranura, forma):
+        """Arreglo uint8 con esa forma sobre la ranura (sin copiar)."""
+        return np.ndarray(forma, dtype=np.uint8, buffer=self.shm.buf, offset=ranura * self.tamano_ranura)
+
+    def cerrar(self):
+        self.shm.close()
+        if self.creador:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _trabajador(indice, pedidos, respuestas, carpeta, memoria_max_mb, backend, imgsz, nucleos):
+    """Bucle del proceso hijo: atiende pedidos hasta recibir None."""
+    nombre = f"nawi-inferencia-{indice}"
+    if nucleos:
+        fijar_nucleos(nucleos)
+    _nombrar_proceso(nombre)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C lo maneja el padre
+
+    from src.modelos import RegistroModelos
+    from src.detecciones import predecir
+
+    if nucleos:
+        # Con spawn el hijo reimporta el __main__ del padre (y con él torch) antes
+        # de llegar aquí: OMP_NUM_THREADS ya no sirve, hay que achicar el pool de torch
+        try:
+            import torch
+            torch.set_num_threads(len(nucleos))
+        except ImportError:
+            pass
+
+    registro = RegistroModelos(carpeta, memoria_max_mb=memoria_max_mb, imgsz=imgsz, backend=backend)
+    anillo = None
+
+    while True:
+        mensaje = pedidos.get()
+        if mensaje is None:
+            break
+        tipo, id_pedido = mensaje[0], mensaje[1]
+        try:
+            if tipo == "predecir":
+                _, _, (nombre_anillo, ranuras, tamano_ranura), ranura, forma, especie, tamano, conf, zonas = mensaje
+                if anillo is None or anillo.nombre != nombre_anillo:
+                    # El padre agrandó el anillo (llegó un frame más grande): adjuntarse al nuevo
+                    if anillo is not None:
+                        anillo.cerrar()
+                    anillo = AnilloCompartido(ranuras, tamano_ranura, nombre=nombre_anillo)
+                imagen = anillo.vista(ranura, forma)
+                modelo = registro.obtener(especie)
+                if modelo is None:
+                    raise RuntimeError(f"sin modelo para {especie}")
+                recortes = [(imagen[y0:y1, x0:x1], (x0, y0)) for x0, y0, x1, y1 in zonas] or None
+                cajas, velocidad = predecir(modelo, imagen, tamano, conf, recortes,
+                                            por_imagen=not registro.imgsz_variable(especie))
+                datos = (cajas.xyxy, cajas.conf, cajas.cls, velocidad)
+            elif tipo == "cargar":
+                modelo = registro.obtener(mensaje[2])
+                datos = registro.backends_usados.get(mensaje[2]) if modelo is not None else None
+            elif tipo == "precargar":
+                registro.precargar()
+                datos = None
+            elif tipo == "descargar":
+                registro.descargar()
+                datos = None
+            elif tipo == "metricas":
+                datos = registro.metricas()
+            else:
+                raise ValueError(f"pedido desconocido: {tipo}")
+            respuestas.put((id_pedido, indice, True, datos))
+        except Exception as e:
+            respuestas.put((id_pedido, indice, False, f"{type(e).__name__}: {e}"))
+
+    if anillo is not None:
+        anillo.cerrar()
+
+
+# Pedidos que cargan modelos (pueden tardar minutos; ver ServidorInferencia._esperar)
+CARGAS = ("cargar", "precargar")
+
+
+class ServidorInferencia:
+    def __init__(self, carpeta, trabajadores=1, nucleos=None, memoria_max_mb=300,
+                 backend="pytorch", imgsz=640, precargar=False, timeout=60.0):
+        """
+        Procesos de inferencia con la misma interfaz que usa el detector con
+        RegistroModelos (obtener, imgsz_variable, descargar, metricas) más predecir().
+
+        Args:
+            carpeta (str): Carpeta de modelos.
+            trabajadores (int): Procesos hijos (cada uno con su copia del modelo en RAM).
+            nucleos (list, optional): Núcleos por proceso, ej. [(2,), (3,)].
+            timeout (float): Máximo a esperar una predicción. Cargar un modelo no
+                tiene plazo (con backend "auto" exporta y mide cada runtime: puede
+                llevar minutos) y el plazo de lo que espera detrás de una carga
+                recién corre cuando la carga termina.
+        """
+        self.trabajadores = max(1, int(trabajadores))
+        self.timeout = timeout
+        self._contexto = mp.get_context("spawn")  # fork con hilos y torch cargado no es seguro
+        self._argumentos = (carpeta, memoria_max_mb, backend, imgsz)
+        self._nucleos = nucleos
+        self._respuestas = self._contexto.Queue()
+        self._colas = [None] * self.trabajadores
+        self._procesos = [None] * self.trabajadores
+        self._esperas = {}
+        self._tipos = {}              # id de pedido -> (tipo, índice), para el lector
+        self._cargando = [0] * self.trabajadores   # cargas en curso o en cola por proceso
+        self._metricas = [None] * self.trabajadores  # últimas métricas que mandó cada proceso
+        self._pidiendo_metricas = [False] * self.trabajadores
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._cerrando = False
+        for i in range(self.trabajadores):
+            self._iniciar(i)
+
+        self._libres = queue.Queue()
+        self._ranuras = queue.Queue()
+        for i in range(self.trabajadores):
+            self._libres.put(i)
+            self._ranuras.put(i)
+        self._anillo = None
+        self._anillos_viejos = []
+        self.backends = {}
+
+        self.pedidos = 0
+        self.errores = 0
+        self.reemplazos = 0
+        self.espera_total = 0.0
+
+        self._lector = threading.Thread(target=self._leer_respuestas, name="respuestas-inferencia",
+                                        daemon=True)
+        self._lector.start()
+        if precargar:
+            # Sin esperar la respuesta: lo que llegue después (cargar, predecir) queda en la
+            # cola detrás de la precarga y espera lo que haga falta
+            for i in range(self.trabajadores):
+                self._enviar(i, "precargar")
+        print(f"🧠 Inferencia en {self.trabajadores} proceso(s) "
+              f"{'con núcleos ' + str(nucleos) if nucleos else 'sin fijar núcleos'}")
+
+    def _iniciar(self, indice):
+        """Arranca (o reemplaza) el proceso `indice` con una cola de pedidos nueva."""
+        carpeta, memoria_max_mb, backend, imgsz = self._argumentos
+        nucleos = self._nucleos
+        nucleos_i = tuple(nucleos[indice % len(nucleos)]) if nucleos else None
+        cola = self._contexto.Queue()
+        proceso = self._contexto.Process(
+            target=_trabajador, name=f"inferencia-{indice}", daemon=True,
+            args=(indice, cola, self._respuestas, carpeta, memoria_max_mb, backend, imgsz, nucleos_i))
+        proceso.start()
+        self._colas[indice] = cola
+        self._procesos[indice] = proceso
+
+    def _reemplazar(self, indice, ranura):
+        """
+        Mata un proceso que no respondió y arranca otro en su lugar. Hasta que
+        el viejo está muerto, ni su ranura ni su índice vuelven a los pools: el
+        hijo colgado podría seguir leyendo la ranura que otro pedido sobrescribiría.
+        """
+        print(f"⚠️ El proceso de inferencia {indice} no respondió: se reemplaza")
+        proceso = self._procesos[indice]
+        proceso.terminate()
+        proceso.join(5.0)
+        if proceso.is_alive():
+            proceso.kill()
+            proceso.join()
+        self._ranuras.put(ranura)
+        with self._lock:
+            # Lo que estaba en la cola del proceso muerto no va a responder nunca
+            for id_pedido, (_, i) in list(self._tipos.items()):
+                if i == indice:
+                    del self._tipos[id_pedido]
+            self._cargando[indice] = 0
+            self._pidiendo_metricas[indice] = False
+        if self._cerrando:
+            return
+        self._iniciar(indice)
+        self.reemplazos += 1
+        # El reemplazo arranca sin modelos: cargar los que ya usaba el detector
+        for especie in list(self.backends):
+            try:
+                self._esperar(*self._enviar(indice, "cargar", especie), sin_limite=True)
+            except Exception as e:
+                print(f"❌ Error cargando {especie} en el proceso de inferencia {indice}: {e}")
+        self._libres.put(indice)
+
+    # --- Comunicación ---
+    def _leer_respuestas(self):
+        while True:
+            respuesta = self._respuestas.get()
+            if respuesta is None:
+                return
+            id_pedido, indice, ok, datos = respuesta
+            with self._lock:
+                espera = self._esperas.pop(id_pedido, None)
+                tipo, _ = self._tipos.pop(id_pedido, (None, None))
+                if tipo in CARGAS:
+                    self._cargando[indice] = max(0, self._cargando[indice] - 1)
+                elif tipo == "metricas":
+                    self._pidiendo_metricas[indice] = False
+                    if ok:
+                        self._metricas[indice] = datos
+            if espera is not None:
+                espera[1] = respuesta
+                espera[0].set()
+
+    def _enviar(self, indice, tipo, *args):
+        id_pedido = next(self._ids)
+        espera = [threading.Event(), None]
+        with self._lock:
+            self._esperas[id_pedido] = espera
+            self._tipos[id_pedido] = (tipo, indice)
+            if tipo in CARGAS:
+                self._cargando[indice] += 1
+        self._colas[indice].put((tipo, id_pedido) + args)
+        return id_pedido, espera, indice
+
+    def _esperar(self, id_pedido, espera, indice, sin_limite=False):
+        """
+        Espera la respuesta. Sin límite (cargas) solo se corta si el proceso
+        muere; con límite, el plazo se reinicia mientras el proceso tenga una
+        carga delante: no está colgado, está exportando o calentando un modelo.
+        """
+        limite = time.monotonic() + self.timeout
+        while not espera[0].wait(1.0):
+            vivo = self._procesos[indice].is_alive()
+            if vivo and (sin_limite or self._cargando[indice]):
+                limite = time.monotonic() + self.timeout
+                continue
+            if vivo and time.monotonic() < limite:
+                continue
+            with self._lock:
+                self._esperas.pop(id_pedido, None)
+            if sin_limite:
+                raise RuntimeError(f"el proceso de inferencia {indice} terminó")
+            # TimeoutError también si murió: quien predice lo reemplaza
+            raise TimeoutError("el proceso de inferencia no respondió")
+        _, _, ok, datos = espera[1]
+        if not ok:
+            raise RuntimeError(datos)
+        return datos
+
+    def _difundir(self, tipo, *args, sin_limite=False):
+        """Manda el mismo pedido a todos los procesos y junta las respuestas."""
+        pendientes = [self._enviar(i, tipo, *args) for i in range(self.trabajadores)]
+        return [self._esperar(*p, sin_limite=sin_limite) for p in pendientes]
+
+    def _anillo_para(self, tamano):
+        """
+        Anillo con ranuras de al menos `tamano` bytes. Si llega un frame más
+        grande se crea uno nuevo (los hijos se adjuntan solos al ver el nombre);
+        el viejo se libera al detener, porque puede haber pedidos leyéndolo.
+        """
+        with self._lock:
+            if self._anillo is None or self._anillo.tamano_ranura < tamano:
+                if self._anillo is not None:
+                    self._anillos_viejos.append(self._anillo)
+                self._anillo = AnilloCompartido(self.trabajadores, tamano)
+            return self._anillo
+
+    # --- Interfaz del detector ---
+    def obtener(self, especie):
+        """
+        Carga el modelo en todos los procesos.
+
+        Returns:
+            str: La especie (sirve de "modelo" en el snapshot del poller), o None si falló.
+        """
+        try:
+            backends = self._difundir("cargar", especie, sin_limite=True)
+        except Exception as e:
+            print(f"❌ Error cargando {especie} en los procesos de inferencia: {e}")
+            return None
+        if any(b is None for b in backends):
+            return None
+        self.backends[especie] = backends[0]
+        return especie
+
+    def imgsz_variable(self, especie):
+        from src import backends
+        return backends.admite_imgsz_variable(self.backends.get(especie, "pytorch"))
+
+    def descargar(self):
+        self._difundir("descargar")
+
+    def predecir(self, especie, imagen, imgsz, conf, recortes=None):
+        """
+        Igual que src.detecciones.predecir, pero en un proceso libre.
+
+        El frame viaja tal cual (sin redimensionar), así que las zonas y las
+        cajas devueltas quedan en coordenadas del frame original.
+
+        Args:
+            recortes (list, optional): [(vista, (x0, y0)), ...] de src.roi; solo
+                viajan las coordenadas, el hijo recorta sobre la memoria compartida.
+        """
+        from src.detecciones import Detecciones
+
+        anillo = self._anillo_para(imagen.nbytes)
+        t0 = time.monotonic()
+        indice = self._libres.get()
+        ranura = self._ranuras.get()
+        self.espera_total += time.monotonic() - t0
+        colgado = False
+        try:
+            np.copyto(anillo.vista(ranura, imagen.shape), imagen)
+            zonas = [(x0, y0, x0 + r.shape[1], y0 + r.shape[0]) for r, (x0, y0) in (recortes or [])]
+            self.pedidos += 1
+            xyxy, confianzas, clases, velocidad = self._esperar(*self._enviar(
+                indice, "predecir", (anillo.nombre, anillo.ranuras, anillo.tamano_ranura),
+                ranura, imagen.shape, especie, imgsz, conf, zonas))
+        except TimeoutError:
+            self.errores += 1
+            colgado = True
+            threading.Thread(target=self._reemplazar, args=(indice, ranura),
+                             name=f"reemplazo-inferencia-{indice}", daemon=True).start()
+            raise
+        except Exception:
+            self.errores += 1
+            raise
+        finally:
+            if not colgado:
+                self._ranuras.put(ranura)
+                self._libres.put(indice)
+        return Detecciones(xyxy, confianzas, clases), velocidad
+
+    def metricas(self):
+        """
+        Métricas de los registros de modelos de cada proceso, sumadas, más las
+        propias. No espera a los procesos (pueden tener una carga o predicciones
+        en cola): usa lo último que mandó cada uno y pide una actualización.
+        """
+        for i in range(self.trabajadores):
+            with self._lock:
+                if self._pidiendo_metricas[i]:
+                    continue
+                self._pidiendo_metricas[i] = True
+            self._enviar(i, "metricas")
+        por_proceso = [m for m in self._metricas if m is not None]
+        en_cache = sorted({e for m in por_proceso for e in m["en_cache"]})
+        return {
+            "en_cache": en_cache,
+            "memoria_mb": round(sum(m["memoria_mb"] for m in por_proceso), 1),
+            "aciertos": sum(m["aciertos"] for m in por_proceso),
+            "fallos": sum(m["fallos"] for m in por_proceso),
+            "carga_s": {k: v for m in por_proceso for k, v in m["carga_s"].items()},
+            "backends": dict(self.backends),
+            "procesos_vivos": sum(p.is_alive() for p in self._procesos),
+            "reemplazos": self.reemplazos,
+            "pedidos": self.pedidos,
+            "errores": self.errores,
+            "espera_ms": round(self.espera_total / self.pedidos * 1000, 1) if self.pedidos else 0.0,
+        }
+
+    def detener(self, timeout=5.0):
+        self._cerrando = True
+        for cola in self._colas:
+            cola.put(None)
+        for proceso in self._procesos:
+            proceso.join(timeout)
+            if proceso.is_alive():
+                proceso.terminate()
+        self._respuestas.put(None)
+        for anillo in self._anillos_viejos + ([self._anillo] if self._anillo is not None else []):
+            anillo.cerrar()
+        self._anillo = None
+        self._anillos_viejos = []
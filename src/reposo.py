@@ -0,0 +1,118 @@
+"""
+Modo reposo de bajo consumo - Ñawi Apu
+
+Con el modo "detenido" la unidad no tiene nada que mirar: se apaga el stream
+de la cámara (o se baja a un frame por segundo), los modelos pueden salir de
+la RAM y el hilo principal se queda bloqueado esperando al poller de modo.
+Las unidades de playa van a batería/solar, así que medimos cuánto CPU gasta
+el reposo y cuánto tarda en volver a inferir al reanudar.
+"""
+import time
+from utils.perf_metrics import METRICAS
+
+POLITICAS_CAMARA = ("detener", "lento")
+
+
+class ControlReposo:
+    def __init__(self, capturas, camara="detener", intervalo_lento=1.0, al_reanudar=None):
+        """
+        Args:
+            capturas (HiloCaptura o list): Hilo(s) de captura a pausar o frenar (uno por cámara).
+            camara (str): "detener" apaga el stream; "lento" captura cada `intervalo_lento` s.
+            intervalo_lento (float): Pausa entre frames con la política "lento".
+            al_reanudar (callable, optional): Se llama al salir del reposo
+                (p.ej. para que la compuerta de movimiento olvide el fondo viejo).
+        """
+        if camara not in POLITICAS_CAMARA:
+            raise ValueError(f"Política de cámara desconocida: {camara} (usar {POLITICAS_CAMARA})")
+        self.capturas = capturas if isinstance(capturas, (list, tuple)) else [capturas]
+        self.camara = camara
+        self.intervalo_lento = intervalo_lento
+        self.al_reanudar = al_reanudar
+
+        self.en_reposo = False
+        self.entradas = 0
+        self.reanudaciones = 0
+        self.ultima_reanudacion = 0.0
+        self.reanudacion_max = 0.0
+        self._t_salida = None
+        self._procesados_salida = 0
+
+        # CPU del proceso (todos los hilos) acumulado por estado
+        self._cpu = {"activo": 0.0, "reposo": 0.0}
+        self._pared = {"activo": 0.0, "reposo": 0.0}
+        self._cpu_marca = time.process_time()
+        self._pared_marca = time.monotonic()
+
+    def _acumular(self):
+        estado = "reposo" if self.en_reposo else "activo"
+        cpu, pared = time.process_time(), time.monotonic()
+        self._cpu[estado] += cpu - self._cpu_marca
+        self._pared[estado] += pared - self._pared_marca
+        self._cpu_marca, self._pared_marca = cpu, pared
+
+    def entrar(self):
+        """Pasa a reposo (idempotente)."""
+        if self.en_reposo:
+            return
+        self._acumular()
+        self.en_reposo = True
+        self.entradas += 1
+        self._t_salida = None
+        for captura in self.capturas:
+            if self.camara == "detener":
+                captura.pausar()
+            else:
+                captura.intervalo_minimo = self.intervalo_lento
+        estado = "apagada" if self.camara == "detener" else "a ritmo lento"
+        if len(self.capturas) == 1:
+            print(f"💤 Reposo: cámara {estado}.")
+        else:
+            print(f"💤 Reposo: {len(self.capturas)} cámaras, cada una {estado}.")
+
+    def salir(self, procesados):
+        """
+        Vuelve a modo activo (idempotente).
+
+        Args:
+            procesados (int): Resultados de inferencia hasta ahora; la reanudación
+                se da por completa cuando aparece el siguiente.
+        """
+        if not self.en_reposo:
+            return
+        self._acumular()
+        self.en_reposo = False
+        self._t_salida = time.monotonic()
+        self._procesados_salida = procesados
+        for captura in self.capturas:
+            captura.intervalo_minimo = 0.0
+            captura.reanudar()
+        if self.al_reanudar is not None:
+            self.al_reanudar()
+        print("⏯️ Saliendo de reposo...")
+
+    def verificar_reanudacion(self, procesados):
+        """Llamar en el bucle principal: cierra la medición con el primer resultado nuevo."""
+        if self._t_salida is None or procesados <= self._procesados_salida:
+            return
+        self.ultima_reanudacion = time.monotonic() - self._t_salida
+        self.reanudacion_max = max(self.reanudacion_max, self.ultima_reanudacion)
+        self.reanudaciones += 1
+        self._t_salida = None
+        METRICAS.registrar("reanudacion", self.ultima_reanudacion)
+        print(f"⏯️ Inferencia reanudada en {self.ultima_reanudacion:.2f} s")
+
+    def metricas(self):
+        self._acumular()
+        return {
+            "en_reposo": self.en_reposo,
+            "entradas": self.entradas,
+            "segundos_reposo": round(self._pared["reposo"], 1),
+            "cpu_reposo_pct": round(100 * self._cpu["reposo"] / self._pared["reposo"], 1)
+            if self._pared["reposo"] > 0 else 0.0,
+            "cpu_activo_pct": round(100 * self._cpu["activo"] / self._pared["activo"], 1)
+            if self._pared["activo"] > 0 else 0.0,
+            "reanudaciones": self.reanudaciones,
+            "reanudacion_ms": round(self.ultima_reanudacion * 1000),
+            "reanudacion_max_ms": round(self.reanudacion_max * 1000),
+        }
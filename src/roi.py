@@ -0,0 +1,69 @@
+"""
+Regiones de interés (nidos) - Ñawi Apu
+
+Los nidos ocupan zonas chicas y conocidas del cuadro. Si se configuran ROIs,
+solo se infiere sobre esos recortes (todos juntos en un batch) y las cajas
+se devuelven en coordenadas del frame completo. Un animal chico dentro de
+un recorte se ve mucho más grande después del letterbox a IMG_SIZE.
+
+Formato de data/rois.json (coordenadas normalizadas 0-1, x1 y1 x2 y2):
+
+    {
+        "principal": {
+            "tortugas": [[0.05, 0.55, 0.45, 1.0], [0.55, 0.60, 0.95, 1.0]],
+            "*": []
+        }
+    }
+
+La clave "*" aplica a los modos sin ROIs propias; una lista vacía significa
+frame completo.
+"""
+import os
+import json
+
+
+def cargar_rois(ruta, camara="principal", por_defecto=None):
+    """
+    Lee las ROIs de una cámara.
+
+    Returns:
+        dict: modo -> lista de (x1, y1, x2, y2) normalizados.
+    """
+    rois = dict(por_defecto or {})
+    if ruta and os.path.exists(ruta):
+        try:
+            with open(ruta, "r") as f:
+                datos = json.load(f)
+            rois.update(datos.get(camara, {}))
+            print(f"🎯 ROIs cargadas para cámara '{camara}': {', '.join(rois) or 'ninguna'}")
+        except Exception as e:
+            print(f"⚠️ Error leyendo ROIs {ruta}: {e}")
+    return rois
+
+
+def rois_del_modo(rois, modo):
+    return rois.get(modo, rois.get("*", [])) or []
+
+
+def a_pixeles(roi, ancho, alto, margen=0.0):
+    """Convierte una ROI normalizada a pixeles, con un margen relativo opcional."""
+    x1, y1, x2, y2 = roi
+    mx, my = (x2 - x1) * margen, (y2 - y1) * margen
+    return (max(0, int((x1 - mx) * ancho)), max(0, int((y1 - my) * alto)),
+            min(ancho, int(round((x2 + mx) * ancho))), min(alto, int(round((y2 + my) * alto))))
+
+
+def recortar(imagen, rois, margen=0.0):
+    """
+    Recorta el frame en sus ROIs.
+
+    Returns:
+        list: [(recorte, (x0, y0)), ...] con vistas (sin copia) del frame.
+    """
+    alto, ancho = imagen.shape[:2]
+    recortes = []
+    for roi in rois:
+        x1, y1, x2, y2 = a_pixeles(roi, ancho, alto, margen)
+        if x2 - x1 >= 8 and y2 - y1 >= 8:
+            recortes.append((imagen[y1:y2, x1:x2], (x1, y1)))
+    return recortes
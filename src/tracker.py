@@ -0,0 +1,171 @@
+"""
+Seguimiento de animales entre frames - Ñawi Apu
+
+Tracker liviano al estilo ByteTrack: cada animal es una pista con un filtro
+de Kalman de velocidad constante, las cajas se asocian por IoU (primero las
+de confianza alta, luego las bajas para no perder pistas por un frame
+borroso) y cada pista confirmada recibe un ID.
+
+Así una tortuga que se queda 10 minutos frente a la cámara es UNA alerta y
+UN individuo, no una alerta cada vez que vence el cooldown.
+"""
+import itertools
+import numpy as np
+from src.detecciones import Detecciones, iou_matriz
+
+
+def _caja_a_estado(xyxy):
+    x1, y1, x2, y2 = xyxy
+    return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=np.float64)
+
+
+def _estado_a_caja(z):
+    cx, cy, w, h = z[:4]
+    w, h = max(w, 1.0), max(h, 1.0)
+    return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], dtype=np.float32)
+
+
+class Pista:
+    """Una pista: filtro de Kalman sobre [cx, cy, w, h, vx, vy, vw, vh]."""
+
+    # Ruido de proceso y de medición (pixeles), ajustados para 640x480
+    RUIDO_POSICION = 10.0
+    RUIDO_VELOCIDAD = 20.0
+    RUIDO_MEDICION = 5.0
+
+    def __init__(self, xyxy, conf, cls, t):
+        self.x = np.zeros(8)
+        self.x[:4] = _caja_a_estado(xyxy)
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 100.0, 100.0, 100.0, 100.0])
+        self.conf = conf
+        self.cls = cls
+        self.id = None
+        self.aciertos = 1
+        self.t_inicio = t
+        self.t_ultimo = t
+        self.t_prediccion = t
+
+    def predecir(self, t):
+        dt = max(0.0, t - self.t_prediccion)
+        self.t_prediccion = t
+        F = np.eye(8)
+        F[:4, 4:] = np.eye(4) * dt
+        Q = np.diag([self.RUIDO_POSICION] * 4 + [self.RUIDO_VELOCIDAD] * 4) * max(dt, 1e-3)
+        self.x = F @ self.x
+        self.P = F @ self.P @ F.T + Q
+        return self.caja()
+
+    def corregir(self, xyxy, conf, t):
+        H = np.zeros((4, 8))
+        H[:, :4] = np.eye(4)
+        R = np.eye(4) * self.RUIDO_MEDICION
+        y = _caja_a_estado(xyxy) - H @ self.x
+        S = H @ self.P @ H.T + R
+        K = self.P @ H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(8) - K @ H) @ self.P
+        self.conf = conf
+        self.aciertos += 1
+        self.t_ultimo = t
+
+    def caja(self):
+        return _estado_a_caja(self.x)
+
+
+def _asociar(pistas, cajas, iou_min):
+    """Asociación codiciosa por IoU. Devuelve (pares, pistas_libres, cajas_libres)."""
+    if not pistas or len(cajas) == 0:
+        return [], list(range(len(pistas))), list(range(len(cajas)))
+    ious = iou_matriz(np.stack([p.caja() for p in pistas]), cajas)
+    pares = []
+    libres_p, libres_c = set(range(len(pistas))), set(range(len(cajas)))
+    for indice in np.argsort(-ious, axis=None):
+        i, j = divmod(int(indice), len(cajas))
+        if ious[i, j] < iou_min:
+            break
+        if i in libres_p and j in libres_c:
+            pares.append((i, j))
+            libres_p.discard(i)
+            libres_c.discard(j)
+    return pares, sorted(libres_p), sorted(libres_c)
+
+
+class TrackerAnimales:
+    def __init__(self, conf_alta=0.6, iou_min=0.3, min_aciertos=2, max_perdida_s=5.0):
+        """
+        Args:
+            conf_alta (float): Confianza desde la que una caja puede crear pistas.
+                Las cajas más bajas solo sirven para mantener pistas existentes.
+            iou_min (float): IoU mínimo para asociar una caja a una pista.
+            min_aciertos (int): Detecciones necesarias para confirmar una pista.
+            max_perdida_s (float): Segundos sin ver una pista antes de cerrarla.
+        """
+        self.conf_alta = conf_alta
+        self.iou_min = iou_min
+        self.min_aciertos = min_aciertos
+        self.max_perdida_s = max_perdida_s
+        self._pistas = []
+        self._ids = itertools.count(1)
+        self.individuos_unicos = 0
+
+    def reiniciar(self):
+        self._pistas = []
+        self.individuos_unicos = 0
+
+    def actualizar(self, detecciones, t):
+        """
+        Incorpora las detecciones de un frame.
+
+        Returns:
+            tuple: (Detecciones de las pistas confirmadas con sus ids,
+                    lista de ids confirmados en este frame)
+        """
+        for pista in self._pistas:
+            pista.predecir(t)
+
+        altas = np.flatnonzero(detecciones.conf >= self.conf_alta)
+        bajas = np.flatnonzero(detecciones.conf < self.conf_alta)
+
+        # 1) Cajas de confianza alta contra todas las pistas
+        pares, libres_p, libres_c = _asociar(self._pistas, detecciones.xyxy[altas], self.iou_min)
+        for i, j in pares:
+            k = altas[j]
+            self._pistas[i].corregir(detecciones.xyxy[k], float(detecciones.conf[k]), t)
+        cajas_nuevas = [altas[j] for j in libres_c]
+
+        # 2) Cajas bajas solo para rescatar pistas que quedaron sin pareja
+        restantes = [self._pistas[i] for i in libres_p]
+        pares_bajos, _, _ = _asociar(restantes, detecciones.xyxy[bajas], self.iou_min)
+        for i, j in pares_bajos:
+            k = bajas[j]
+            restantes[i].corregir(detecciones.xyxy[k], float(detecciones.conf[k]), t)
+
+        # 3) Nuevas pistas y limpieza de las perdidas
+        for k in cajas_nuevas:
+            self._pistas.append(Pista(detecciones.xyxy[k], float(detecciones.conf[k]),
+                                      int(detecciones.cls[k]), t))
+        self._pistas = [p for p in self._pistas if t - p.t_ultimo <= self.max_perdida_s]
+
+        nuevas = []
+        for pista in self._pistas:
+            if pista.id is None and pista.aciertos >= self.min_aciertos:
+                pista.id = next(self._ids)
+                self.individuos_unicos += 1
+                nuevas.append(pista.id)
+
+        # Solo se informan las pistas confirmadas y vistas en este frame
+        visibles = [p for p in self._pistas if p.id is not None and p.t_ultimo == t]
+        salida = Detecciones([p.caja() for p in visibles], [p.conf for p in visibles],
+                             [p.cls for p in visibles], detecciones.nombres,
+                             ids=np.array([p.id for p in visibles], dtype=np.int32))
+        return salida, nuevas
+
+    def activas(self):
+        return sum(1 for p in self._pistas if p.id is not None)
+
+    def metricas(self):
+        return {
+            "pistas": len(self._pistas),
+            "activas": self.activas(),
+            "individuos_unicos": self.individuos_unicos,
+        }
@@ -0,0 +1,53 @@
+"""
+Reenvío desde la bandeja (DespachadorAlertas.reintentar) con un envío de mentira.
+
+Necesita requests y python-dotenv (los importa utils.send_alert); OpenCV no
+hace falta, no se codifica ninguna imagen.
+
+    python -m pytest tests/test_alert_queue.py
+"""
+import sys
+import types
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+
+from utils.bandeja_salida import Pendiente
+
+
+@pytest.fixture
+def alert_queue(monkeypatch):
+    try:
+        import cv2  # noqa: F401
+    except ImportError:
+        # Solo para poder importar utils.send_alert: estas pruebas no lo usan
+        monkeypatch.setitem(sys.modules, "cv2", types.ModuleType("cv2"))
+    from utils import alert_queue
+    return alert_queue
+
+
+def _fila(i):
+    datos = {"especie": "tortugas", "cantidad": 1, "es_amenaza": False, "mensaje_prefix": None,
+             "unicos": None, "nombre": f"deteccion_{i}.jpg", "detectada": 0.0}
+    return Pendiente(i, "alerta", datos, None, 0.0, 0)
+
+
+def test_reintentar_se_corta_en_el_primer_fallo(alert_queue):
+    enviadas = []
+
+    def enviar(**kwargs):
+        enviadas.append(kwargs["nombre_archivo"])
+        return len(enviadas) != 2
+
+    despachador = alert_queue.DespachadorAlertas(enviar=enviar)
+    try:
+        entregadas, sin_intentar = despachador.reintentar([_fila(i) for i in (1, 2, 3, 4)])
+    finally:
+        despachador.detener(timeout=1)
+
+    assert entregadas == [1]
+    # La 2 falló (el drenador le cuenta el intento); 3 y 4 no se probaron
+    assert sin_intentar == [3, 4]
+    assert enviadas == ["deteccion_1.jpg", "deteccion_2.jpg"]
+    assert despachador.reenviadas == 1
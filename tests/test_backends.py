@@ -0,0 +1,38 @@
+"""
+Paridad de cajas entre PyTorch y los backends optimizados (src.backends).
+
+Necesita ultralytics, OpenCV, al menos un runtime opcional (onnxruntime,
+openvino o ncnn), modelos .pt en modelos/ y capturas .jpg guardadas; si falta
+algo se salta en vez de pasar sin haber comparado nada.
+
+    python -m pytest tests/test_backends.py
+"""
+import os
+import glob
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("ultralytics")
+
+from src import backends
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+CARPETA_MODELOS = os.path.join(PROJECT_DIR, "modelos")
+CARPETAS_IMAGENES = [os.path.join(PROJECT_DIR, "images", "capturas"),
+                     os.path.join(PROJECT_DIR, "detecciones")]
+
+
+def test_sin_nada_que_comparar_falla(tmp_path):
+    assert backends.verificar_paridad(str(tmp_path), [str(tmp_path)]) is False
+
+
+def test_paridad_con_pytorch():
+    opcionales = [b for b in backends.BACKENDS if b != "pytorch" and backends.disponible(b)]
+    if not opcionales:
+        pytest.skip("no hay backends opcionales instalados")
+    if not glob.glob(os.path.join(CARPETA_MODELOS, "*.pt")):
+        pytest.skip("no hay modelos .pt en modelos/")
+    if not any(glob.glob(os.path.join(c, "*.jpg")) for c in CARPETAS_IMAGENES):
+        pytest.skip("no hay capturas guardadas para comparar")
+    assert backends.verificar_paridad(CARPETA_MODELOS, CARPETAS_IMAGENES, limite=20)
@@ -0,0 +1,50 @@
+"""
+Bandeja de salida (utils.bandeja_salida): solo usa sqlite3, corre en cualquier lado.
+
+    python -m pytest tests/test_bandeja_salida.py
+"""
+from utils.bandeja_salida import BandejaSalida, DrenadorBandeja, EN_VUELO
+
+
+def _proximo(bandeja, fila_id):
+    return bandeja._db.execute("SELECT proximo FROM pendientes WHERE id = ?", (fila_id,)).fetchone()[0]
+
+
+def _intentos(bandeja, fila_id):
+    return bandeja._db.execute("SELECT intentos FROM pendientes WHERE id = ?", (fila_id,)).fetchone()[0]
+
+
+def test_hacer_lugar_no_borra_filas_en_vuelo(tmp_path):
+    bandeja = BandejaSalida(str(tmp_path / "bandeja.db"), presupuesto_mb=0.01)  # ~10 KB
+    en_vuelo = bandeja.guardar("alerta", {"n": 0}, imagen=b"x" * 4000, prioridad=0, en_vuelo=True)
+    vieja = bandeja.guardar("alerta", {"n": 1}, imagen=b"x" * 4000, prioridad=0)
+    nueva = bandeja.guardar("alerta", {"n": 2}, imagen=b"x" * 4000, prioridad=0)
+
+    ids = {f[0] for f in bandeja._db.execute("SELECT id FROM pendientes")}
+    # Para hacer lugar se borra la más vieja que no está en vuelo
+    assert ids == {en_vuelo, nueva}
+    assert vieja not in ids
+    assert _proximo(bandeja, en_vuelo) == EN_VUELO
+    assert bandeja.descartados == 1
+    bandeja.cerrar()
+
+
+def test_drenador_suelta_las_no_intentadas_sin_contar_intento(tmp_path):
+    bandeja = BandejaSalida(str(tmp_path / "bandeja.db"))
+    ids = [bandeja.guardar("alerta", {"n": i}) for i in range(3)]
+
+    def enviar(filas):
+        # Entrega la primera, falla la segunda y se corta sin probar la tercera
+        return [filas[0].id], [filas[2].id]
+
+    drenador = DrenadorBandeja(bandeja, {"alerta": (enviar, 10, None)})
+    drenador._vuelta()
+
+    assert bandeja.contar() == 2
+    assert _intentos(bandeja, ids[1]) == 1
+    assert _intentos(bandeja, ids[2]) == 0
+    # La no intentada vuelve a estar lista enseguida; la fallida espera su backoff
+    listas = [f.id for f in bandeja.tomar("alerta")]
+    assert listas == [ids[2]]
+    assert bandeja.metricas()["reintentos"] == 1
+    bandeja.cerrar()
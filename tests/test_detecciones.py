@@ -0,0 +1,84 @@
+"""
+predecir_lote (src.detecciones) con un modelo de mentira: no necesita
+ultralytics ni OpenCV, solo numpy.
+
+    python -m pytest tests/test_detecciones.py
+"""
+import sys
+import types
+import pytest
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def detecciones(monkeypatch):
+    try:
+        import cv2  # noqa: F401
+    except ImportError:
+        # Solo dibujar() usa OpenCV
+        monkeypatch.setitem(sys.modules, "cv2", types.ModuleType("cv2"))
+    from src import detecciones
+    return detecciones
+
+
+class _Tensor:
+    """Lo mínimo de un tensor de torch: .cpu().numpy()."""
+
+    def __init__(self, arreglo):
+        self.arreglo = arreglo
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.arreglo
+
+
+class _Cajas:
+    def __init__(self):
+        self.xyxy = _Tensor(np.zeros((0, 4), np.float32))
+        self.conf = _Tensor(np.zeros(0, np.float32))
+        self.cls = _Tensor(np.zeros(0, np.float32))
+        self.id = None
+
+
+class _Resultado:
+    def __init__(self):
+        self.boxes = _Cajas()
+        self.names = {0: "tortuga"}
+        self.speed = {"inference": 1.0}
+
+
+class _Modelo:
+    """Devuelve a lo sumo `lote` resultados por predict(), como un export NCNN de batch 1."""
+
+    def __init__(self, lote=None):
+        self.lote = lote
+        self.llamadas = []
+
+    def predict(self, source, **kwargs):
+        fuentes = source if isinstance(source, list) else [source]
+        self.llamadas.append(len(fuentes))
+        return [_Resultado() for _ in fuentes[:self.lote]]
+
+
+def _entradas():
+    frame = np.zeros((48, 64, 3), np.uint8)
+    recortes = [(frame[:24], (0, 0)), (frame[24:], (0, 24))]
+    return [(frame, None), (frame, recortes)]
+
+
+def test_menos_resultados_que_imagenes_falla(detecciones):
+    with pytest.raises(RuntimeError):
+        detecciones.predecir_lote(_Modelo(lote=1), _entradas(), 320, 0.5)
+
+
+def test_por_imagen_un_predict_por_fuente(detecciones):
+    modelo = _Modelo(lote=1)
+    salida = detecciones.predecir_lote(modelo, _entradas(), 320, 0.5, por_imagen=True)
+
+    assert modelo.llamadas == [1, 1, 1]
+    assert len(salida) == 2
+    # Los dos recortes de la segunda cámara suman su velocidad
+    assert salida[1][1]["inference"] == 2.0
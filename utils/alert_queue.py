@@ -0,0 +1,416 @@
+"""
+Cola de alertas en segundo plano - Ñawi Apu
+
+El detector solo encola (frame + metadatos) y sigue mirando. Un worker se
+encarga de guardar la imagen, subirla a GitHub, avisar a Railway y registrar
+en InfluxDB, así un enlace lento en la costa nunca congela la cámara.
+
+Con un AgrupadorAlertas (utils.send_alert) la primera alerta de fauna sale
+al momento y el resto de la ráfaga se junta en un solo resumen por ventana.
+
+Las alertas van por dos carriles, cada uno con su worker: las amenazas
+(invasores) nunca esperan detrás de la subida de una foto de fauna. Además
+salen primero como texto y la foto llega después en un segundo mensaje.
+
+Con una bandeja de salida (utils.bandeja_salida) cada alerta queda en la SD
+antes del primer intento y solo se borra al confirmarse el envío: si no hay
+conexión, el drenador la reenvía más tarde con reintentar().
+"""
+import os
+import time
+import threading
+from collections import deque
+from utils.send_alert import enviar_alerta, enviar_evidencia, preparar_evidencia
+from utils.perf_metrics import METRICAS
+
+# Qué hacer cuando la cola está llena:
+#   "descartar_nuevo" -> se rechaza la alerta que llega
+#   "descartar_viejo" -> se descarta la alerta más antigua pendiente
+#   "coalescer"       -> si ya hay una alerta pendiente de la misma especie y
+#                        cámara se fusiona con ella (frame nuevo, cantidad
+#                        máxima); si no, se descarta la más antigua
+POLITICAS = ("descartar_nuevo", "descartar_viejo", "coalescer")
+
+# Carriles por prioridad; la capacidad y la política se aplican a cada uno por separado
+CARRILES = ("amenaza", "fauna")
+
+
+class AlertaPendiente:
+    __slots__ = ("especie", "cantidad", "frame", "es_amenaza", "mensaje_prefix",
+                 "confianza", "unicos", "camara", "resumen", "detectada", "t_origen", "t_encolada")
+
+    def __init__(self, especie, cantidad, frame, es_amenaza, mensaje_prefix, confianza, unicos=None,
+                 camara=None, t_origen=None):
+        self.especie = especie
+        self.cantidad = cantidad
+        self.frame = frame
+        self.es_amenaza = es_amenaza
+        self.mensaje_prefix = mensaje_prefix
+        self.confianza = confianza
+        self.unicos = unicos
+        self.camara = camara
+        self.resumen = None
+        self.detectada = time.time()
+        self.t_encolada = time.monotonic()
+        # Desde cuándo se mide la latencia de punta a punta (captura del frame)
+        self.t_origen = t_origen if t_origen is not None else self.t_encolada
+
+    @property
+    def carril(self):
+        return "amenaza" if self.es_amenaza else "fauna"
+
+
+def _promedio_p95(valores):
+    valores = sorted(valores)
+    if not valores:
+        return 0.0, 0.0
+    return sum(valores) / len(valores), valores[min(len(valores) - 1, int(len(valores) * 0.95))]
+
+
+class DespachadorAlertas:
+    def __init__(self, capacidad=8, politica="coalescer", influx=None, enviar=enviar_alerta, bandeja=None,
+                 agrupador=None, texto_primero=True, enviar_media=enviar_evidencia):
+        """
+        Workers con colas acotadas en memoria para despachar alertas (uno por carril).
+
+        Args:
+            capacidad (int): Máximo de alertas pendientes por carril.
+            politica (str): Una de POLITICAS (ver arriba).
+            influx (InfluxLogger, optional): Si se pasa, cada alerta enviada se
+                registra también en InfluxDB desde el worker.
+            enviar (callable): Función de envío (por defecto enviar_alerta).
+            bandeja (BandejaSalida, optional): Persistencia de las alertas no entregadas.
+            agrupador (AgrupadorAlertas, optional): Ventanas de agrupación por especie.
+            texto_primero (bool): Las amenazas salen sin foto y la foto va después.
+            enviar_media (callable): Envío de la foto de seguimiento (por defecto enviar_evidencia).
+        """
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de cola desconocida: {politica}")
+        self.capacidad = max(1, int(capacidad))
+        self.politica = politica
+        self.influx = influx
+        self.enviar = enviar
+        self.enviar_media = enviar_media
+        self.bandeja = bandeja
+        self.agrupador = agrupador
+        self.texto_primero = texto_primero
+
+        self._colas = {carril: deque() for carril in CARRILES}
+        self._cond = threading.Condition()
+        self._activo = True
+        self._hilos = [threading.Thread(target=self._run, args=(carril,), name=f"alertas-{carril}", daemon=True)
+                       for carril in CARRILES]
+
+        # Métricas
+        self.encoladas = 0
+        self.enviadas = 0
+        self.fallidas = 0
+        self.descartadas = 0
+        self.coalescidas = 0
+        self.reenviadas = 0
+        self.fotos_seguimiento = 0
+        self._latencias = deque(maxlen=100)  # segundos en cola de las últimas alertas
+        # Captura -> notificación entregada, por carril (incluye la ventana de agrupación)
+        self._extremo = {carril: deque(maxlen=100) for carril in CARRILES}
+
+        for hilo in self._hilos:
+            hilo.start()
+
+    def encolar(self, especie, cantidad, frame, es_amenaza=False, mensaje_prefix=None, confianza=None,
+                unicos=None, camara=None, t_origen=None):
+        """
+        Encola una alerta sin bloquear.
+
+        Args:
+            frame: Imagen BGR, o un callable sin argumentos que la genere
+                (se evalúa en el worker, útil para dibujar las cajas fuera
+                del hilo de visión).
+            confianza (float, optional): Confianza a registrar en InfluxDB.
+            unicos (int, optional): Individuos distintos vistos por el tracker.
+            camara (str, optional): Cámara de origen; solo se coalescen alertas de la misma.
+            t_origen (float, optional): time.monotonic() de la captura, para la
+                latencia de punta a punta (por defecto, el momento de encolar).
+
+        Returns:
+            bool: False si la alerta fue rechazada por la política de la cola.
+        """
+        alerta = AlertaPendiente(especie, cantidad, frame, es_amenaza, mensaje_prefix, confianza, unicos,
+                                 camara, t_origen)
+        with self._cond:
+            cola = self._colas[alerta.carril]
+            if not self._activo:
+                self.descartadas += 1
+                return False
+            if len(cola) >= self.capacidad:
+                if self.politica == "descartar_nuevo":
+                    self.descartadas += 1
+                    return False
+                if self.politica == "coalescer" and self._coalescer(cola, alerta):
+                    self.coalescidas += 1
+                    self._cond.notify_all()
+                    return True
+                cola.popleft()
+                self.descartadas += 1
+            cola.append(alerta)
+            self.encoladas += 1
+            self._cond.notify_all()
+        return True
+
+    def _coalescer(self, cola, alerta):
+        """Fusiona con una alerta pendiente de la misma especie y cámara (con el lock tomado)."""
+        for pendiente in reversed(cola):
+            if pendiente.especie == alerta.especie and pendiente.camara == alerta.camara:
+                pendiente.cantidad = max(pendiente.cantidad, alerta.cantidad)
+                pendiente.frame = alerta.frame
+                pendiente.mensaje_prefix = alerta.mensaje_prefix
+                if alerta.confianza is not None:
+                    pendiente.confianza = max(pendiente.confianza or 0.0, alerta.confianza)
+                if alerta.unicos is not None:
+                    pendiente.unicos = max(pendiente.unicos or 0, alerta.unicos)
+                return True
+        return False
+
+    def _espera(self, agrupador):
+        """Segundos hasta que vence la próxima ventana del agrupador (None = sin límite)."""
+        vence = agrupador.proximo_vencimiento() if agrupador is not None else None
+        return None if vence is None else max(0.0, vence - time.monotonic())
+
+    def _run(self, carril):
+        cola = self._colas[carril]
+        # Las amenazas nunca se agrupan
+        agrupador = self.agrupador if carril == "fauna" else None
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: cola or not self._activo, timeout=self._espera(agrupador))
+                if not self._activo and agrupador is not None and not agrupador.cerrado:
+                    # Al apagar no se esperan las ventanas: lo agrupado sale ya
+                    cola.extend(agrupador.cerrar())
+                if not cola and not self._activo:
+                    return
+                alerta = cola.popleft() if cola else None
+            if alerta is not None:
+                self._latencias.append(time.monotonic() - alerta.t_encolada)
+                if agrupador is None or not agrupador.agregar(alerta):
+                    self._despachar(alerta)
+            if agrupador is not None:
+                for resumen in agrupador.vencidos():
+                    self._despachar(resumen)
+
+    def _despachar(self, alerta):
+        fila = None
+        entregada = False   # el aviso (texto) llegó a Railway
+        pendiente = True    # queda algo por reenviar desde la bandeja
+        texto_primero = self.texto_primero and alerta.es_amenaza
+        try:
+            frame = alerta.frame() if callable(alerta.frame) else alerta.frame
+            jpeg, nombre = preparar_evidencia(frame)
+            datos = self._datos(alerta, nombre)
+            fila = self._guardar(datos, jpeg, alerta.es_amenaza)
+            entregada = self.enviar(
+                especie=alerta.especie,
+                cantidad=alerta.cantidad,
+                frame=None,
+                es_amenaza=alerta.es_amenaza,
+                mensaje_prefix=alerta.mensaje_prefix,
+                individuos_unicos=alerta.unicos,
+                jpeg=jpeg,
+                nombre_archivo=nombre,
+                resumen=alerta.resumen,
+                solo_texto=texto_primero
+            )
+            if entregada:
+                self._anotar_latencia(alerta.carril, alerta.t_origen)
+                pendiente = False
+                if texto_primero and jpeg is not None:
+                    # Si la foto no sale, en la bandeja queda solo la foto (el texto ya llegó)
+                    if fila is not None:
+                        datos["texto_enviado"] = True
+                        self.bandeja.actualizar(fila, datos)
+                    pendiente = not self._enviar_foto(datos, jpeg, alerta.t_origen)
+        except Exception as e:
+            print(f"❌ Error despachando alerta: {e}")
+
+        if entregada:
+            self.enviadas += 1
+        else:
+            self.fallidas += 1
+        if fila is not None:
+            if pendiente:
+                self.bandeja.fallo(fila)
+                print("📮 Alerta guardada en la bandeja de salida; se reenviará al volver la conexión.")
+            else:
+                self.bandeja.confirmar(fila)
+
+        if self.influx is not None:
+            self.influx.log_detection(
+                species=alerta.especie,
+                count=alerta.cantidad,
+                confidence=alerta.confianza if alerta.confianza is not None else 0.75,
+                image_path=None,
+                unique_count=alerta.unicos,
+                timestamp=alerta.detectada
+            )
+
+    def _enviar_foto(self, datos, jpeg, t_origen=None):
+        ok = self.enviar_media(
+            especie=datos["especie"],
+            jpeg=jpeg,
+            nombre_archivo=datos["nombre"],
+            es_amenaza=datos["es_amenaza"],
+            mensaje_prefix=datos["mensaje_prefix"],
+            detectada=datos["detectada"],
+            clip=datos.get("clip")
+        )
+        if ok:
+            self.fotos_seguimiento += 1
+            if t_origen is not None:
+                METRICAS.registrar("alerta_foto_amenaza", time.monotonic() - t_origen)
+        return ok
+
+    def _anotar_latencia(self, carril, t_origen):
+        segundos = time.monotonic() - t_origen
+        self._extremo[carril].append(segundos)
+        METRICAS.registrar(f"alerta_{carril}", segundos)
+
+    def _datos(self, alerta, nombre):
+        """Lo necesario para reenviar la alerta desde la bandeja de salida."""
+        return {
+            "especie": alerta.especie,
+            "cantidad": alerta.cantidad,
+            "es_amenaza": alerta.es_amenaza,
+            "mensaje_prefix": alerta.mensaje_prefix,
+            "resumen": alerta.resumen,
+            "unicos": alerta.unicos,
+            "camara": alerta.camara,
+            "nombre": nombre,
+            "detectada": alerta.detectada,
+        }
+
+    def _guardar(self, datos, jpeg, es_amenaza, en_vuelo=True):
+        if self.bandeja is None:
+            return None
+        try:
+            # Las amenazas son lo último que se descarta si la SD se llena
+            return self.bandeja.guardar("alerta", datos, imagen=jpeg, prioridad=3 if es_amenaza else 2,
+                                        en_vuelo=en_vuelo)
+        except Exception as e:
+            print(f"❌ Error guardando alerta en la bandeja de salida: {e}")
+            return None
+
+    def publicar_evidencia(self, especie, ruta_clip, ruta_hoja, es_amenaza=False, mensaje_prefix=None):
+        """
+        Entrega la hoja de contactos de un clip de evidencia (lo llama
+        GrabadorEvidencia al terminar). Con bandeja queda guardada como una
+        alerta a la que solo le falta la foto y la manda el drenador, así
+        sobrevive a cortes de red y reinicios; el clip no se sube (pesa
+        demasiado para el enlace) y su ruta viaja en el aviso.
+
+        Returns:
+            bool: True si quedó guardada o se envió.
+        """
+        with open(ruta_hoja, "rb") as f:
+            jpeg = f.read()
+        datos = {
+            "especie": especie,
+            "es_amenaza": es_amenaza,
+            "mensaje_prefix": mensaje_prefix,
+            "nombre": os.path.basename(ruta_hoja),
+            "detectada": time.time(),
+            "clip": ruta_clip,
+            "texto_enviado": True,
+        }
+        if self.bandeja is not None:
+            return self._guardar(datos, jpeg, es_amenaza, en_vuelo=False) is not None
+        return self._enviar_foto(datos, jpeg)
+
+    def reintentar(self, filas):
+        """
+        Reenvía alertas guardadas en la bandeja de salida (lo llama el drenador).
+        Se corta en el primer fallo: sin conexión no tiene sentido seguir.
+
+        Returns:
+            tuple: (ids entregados, ids que no se llegaron a intentar). A las
+                segundas el drenador no les cuenta un intento.
+        """
+        entregadas = []
+        for posicion, fila in enumerate(filas):
+            d = fila.datos
+            try:
+                if d.get("texto_enviado"):
+                    ok = self._enviar_foto(d, fila.imagen)
+                else:
+                    ok = self.enviar(
+                        especie=d["especie"],
+                        cantidad=d["cantidad"],
+                        frame=None,
+                        es_amenaza=d["es_amenaza"],
+                        mensaje_prefix=d["mensaje_prefix"],
+                        individuos_unicos=d["unicos"],
+                        jpeg=fila.imagen,
+                        nombre_archivo=d["nombre"],
+                        detectada=d["detectada"],
+                        resumen=d.get("resumen")
+                    )
+            except Exception as e:
+                print(f"❌ Error reenviando alerta: {e}")
+                ok = False
+            if not ok:
+                return entregadas, [f.id for f in filas[posicion + 1:]]
+            entregadas.append(fila.id)
+            self.reenviadas += 1
+        return entregadas, []
+
+    def profundidad(self, carril=None):
+        if carril is not None:
+            return len(self._colas[carril])
+        return sum(len(c) for c in self._colas.values())
+
+    def metricas(self):
+        promedio, p95 = _promedio_p95(self._latencias)
+        m = {
+            "profundidad": self.profundidad(),
+            "profundidad_amenaza": self.profundidad("amenaza"),
+            "encoladas": self.encoladas,
+            "enviadas": self.enviadas,
+            "fallidas": self.fallidas,
+            "descartadas": self.descartadas,
+            "coalescidas": self.coalescidas,
+            "reenviadas": self.reenviadas,
+            "fotos_seguimiento": self.fotos_seguimiento,
+            "agrupadas": self.agrupador.agrupadas if self.agrupador is not None else 0,
+            "ventanas_abiertas": self.agrupador.pendientes() if self.agrupador is not None else 0,
+            "latencia_cola_ms": round(promedio * 1000, 1),
+            "latencia_cola_p95_ms": round(p95 * 1000, 1),
+        }
+        for carril, latencias in self._extremo.items():
+            promedio, p95 = _promedio_p95(latencias)
+            m[f"latencia_{carril}_ms"] = round(promedio * 1000, 1)
+            m[f"latencia_{carril}_p95_ms"] = round(p95 * 1000, 1)
+        return m
+
+    def vivo(self):
+        """True mientras algún carril siga trabajando (puede tocar la bandeja)."""
+        return any(h.is_alive() for h in self._hilos)
+
+    def detener(self, timeout=10):
+        """Deja de aceptar trabajo y espera (hasta timeout) a vaciar lo pendiente."""
+        with self._cond:
+            self._activo = False
+            self._cond.notify_all()
+        limite = time.monotonic() + timeout
+        for hilo in self._hilos:
+            hilo.join(timeout=max(0.0, limite - time.monotonic()))
+        with self._cond:
+            pendientes = [a for carril in CARRILES for a in self._colas[carril]]
+            if self.bandeja is not None:
+                for cola in self._colas.values():
+                    cola.clear()
+        if pendientes and self.bandeja is not None:
+            # No se pierden: quedan en la SD y se envían en el próximo arranque
+            for alerta in pendientes:
+                frame = alerta.frame() if callable(alerta.frame) else alerta.frame
+                jpeg, nombre = preparar_evidencia(frame)
+                self._guardar(self._datos(alerta, nombre), jpeg, alerta.es_amenaza, en_vuelo=False)
+            print(f"📮 {len(pendientes)} alertas pendientes guardadas en la bandeja de salida.")
+        elif pendientes:
+            print(f"⚠️ {len(pendientes)} alertas pendientes sin enviar al apagar.")
@@ -0,0 +1,297 @@
+"""
+Bandeja de salida persistente - Ñawi Apu
+
+Si Railway, GitHub o InfluxDB no responden, la detección ya no se pierde:
+queda en una base SQLite en la SD (alerta + JPEG, o el registro de Influx) y
+un hilo la reintenta con backoff exponencial cuando vuelve la conexión.
+
+    alerta -> se guarda ANTES del primer intento (marcada "en vuelo" para que el
+              drenador no la mande en paralelo) y se borra al confirmarse; si el
+              proceso muere a mitad de envío, se reintenta en el próximo arranque
+    influx -> solo se guarda si la escritura falla; al volver la conexión se
+              reenvían en lotes (una escritura con muchos puntos)
+
+La base tiene un presupuesto de disco: al pasarse se borra primero lo menos
+importante (métricas, luego detecciones) y lo más viejo. Las alertas son lo
+último que se descarta.
+"""
+import json
+import time
+import random
+import sqlite3
+import threading
+from collections import namedtuple
+
+# Fila pendiente tal como la reciben los manejadores del drenador
+Pendiente = namedtuple("Pendiente", ["id", "tipo", "datos", "imagen", "creado", "intentos"])
+
+# "proximo" de una fila que alguien está enviando: nadie más la toma hasta que
+# se confirme o falle. Un plazo fijo no sirve: con reintentos y backoff, un
+# envío lento (GET+PUT a GitHub y POST a Railway) puede durar más que el plazo
+# y el drenador la mandaría dos veces.
+EN_VUELO = 1e18
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS pendientes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL,
+    prioridad INTEGER NOT NULL,
+    datos TEXT NOT NULL,
+    imagen BLOB,
+    bytes INTEGER NOT NULL,
+    creado REAL NOT NULL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    proximo REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pendientes_listos ON pendientes (tipo, proximo, id);
+"""
+
+
+class BandejaSalida:
+    def __init__(self, ruta, presupuesto_mb=200, backoff_base=5.0, backoff_max=600.0):
+        """
+        Args:
+            ruta (str): Archivo SQLite (se crea si no existe).
+            presupuesto_mb (float): Tamaño máximo de lo pendiente (datos + imágenes).
+            backoff_base (float), backoff_max (float): Espera entre reintentos de
+                una misma fila: base * 2^intentos, con tope.
+        """
+        self.ruta = ruta
+        self.presupuesto = presupuesto_mb * 1024 * 1024
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        # auto_vacuum solo aplica a bases nuevas: así la SD recupera lo borrado
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # FULL: las unidades a batería/solar se apagan de golpe
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(ESQUEMA)
+        # Lo que estaba en vuelo cuando el proceso murió no se va a confirmar nunca
+        self._db.execute("UPDATE pendientes SET proximo = ? WHERE proximo >= ?", (time.time(), EN_VUELO))
+
+        # Métricas
+        self.guardados = 0
+        self.entregados = 0
+        self.reintentos = 0
+        self.descartados = 0
+        pendientes = self.contar()
+        if pendientes:
+            print(f"📮 Bandeja de salida: {pendientes} envíos pendientes de antes del reinicio.")
+
+    def _espera(self, intentos):
+        base = min(self.backoff_max, self.backoff_base * (2 ** intentos))
+        return base * random.uniform(0.8, 1.2)
+
+    def guardar(self, tipo, datos, imagen=None, prioridad=1, en_vuelo=False):
+        """
+        Persiste un envío pendiente.
+
+        Args:
+            datos (dict): Serializable a JSON (los escalares de numpy pasan a float).
+            imagen (bytes | memoryview, optional): JPEG a conservar.
+            prioridad (int): Más alta = se descarta último al llenarse el presupuesto.
+            en_vuelo (bool): Quien la guardó la está enviando: el drenador no
+                la toma hasta que se llame a confirmar() o fallo().
+
+        Returns:
+            int: Id de la fila.
+        """
+        texto = json.dumps(datos, default=float)
+        tamano = len(texto) + (len(imagen) if imagen is not None else 0)
+        with self._lock:
+            self._hacer_lugar(tamano)
+            cursor = self._db.execute(
+                "INSERT INTO pendientes (tipo, prioridad, datos, imagen, bytes, creado, proximo) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (tipo, prioridad, texto, imagen, tamano, time.time(), EN_VUELO if en_vuelo else time.time()))
+            self.guardados += 1
+            return cursor.lastrowid
+
+    def _hacer_lugar(self, tamano):
+        """
+        Borra lo menos prioritario y más viejo hasta que entre `tamano` (con el
+        lock tomado). Las filas en vuelo no se tocan: quien las envía todavía va
+        a confirmarlas, fallarlas o actualizarlas.
+        """
+        usado = self._db.execute("SELECT COALESCE(SUM(bytes), 0) FROM pendientes").fetchone()[0]
+        if usado + tamano <= self.presupuesto:
+            return
+        borrados = 0
+        for fila_id, bytes_fila in self._db.execute(
+                "SELECT id, bytes FROM pendientes WHERE proximo < ? ORDER BY prioridad ASC, id ASC",
+                (EN_VUELO,)).fetchall():
+            if usado + tamano <= self.presupuesto:
+                break
+            self._db.execute("DELETE FROM pendientes WHERE id = ?", (fila_id,))
+            usado -= bytes_fila
+            borrados += 1
+        self.descartados += borrados
+        self._db.execute("PRAGMA incremental_vacuum")
+        print(f"⚠️ Bandeja de salida llena: {borrados} envíos viejos descartados.")
+
+    def tomar(self, tipo, limite=50):
+        """
+        Filas listas para reintentar (las más prioritarias y viejas primero). Quedan en
+        vuelo hasta confirmar() o fallo(), para que otro hilo no las tome a la vez.
+        """
+        ahora = time.time()
+        with self._lock:
+            filas = self._db.execute(
+                "SELECT id, tipo, datos, imagen, creado, intentos FROM pendientes "
+                "WHERE tipo = ? AND proximo <= ? ORDER BY prioridad DESC, id LIMIT ?", (tipo, ahora, limite)).fetchall()
+            if filas:
+                self._db.executemany("UPDATE pendientes SET proximo = ? WHERE id = ?",
+                                     [(EN_VUELO, f[0]) for f in filas])
+        return [Pendiente(f[0], f[1], json.loads(f[2]), f[3], f[4], f[5]) for f in filas]
+
+    def confirmar(self, ids):
+        """Borra las filas entregadas."""
+        ids = [ids] if isinstance(ids, int) else list(ids)
+        if not ids:
+            return
+        with self._lock:
+            self._db.executemany("DELETE FROM pendientes WHERE id = ?", [(i,) for i in ids])
+            self.entregados += len(ids)
+
+    def actualizar(self, fila_id, datos):
+        """Reemplaza los datos de una fila (ej. una alerta a la que solo le falta la foto)."""
+        with self._lock:
+            self._db.execute("UPDATE pendientes SET datos = ? WHERE id = ?",
+                             (json.dumps(datos, default=float), fila_id))
+
+    def soltar(self, ids):
+        """Devuelve filas en vuelo que no se llegaron a intentar, sin contarles un intento."""
+        ids = [ids] if isinstance(ids, int) else list(ids)
+        if not ids:
+            return
+        ahora = time.time()
+        with self._lock:
+            self._db.executemany("UPDATE pendientes SET proximo = ? WHERE id = ?", [(ahora, i) for i in ids])
+
+    def fallo(self, ids):
+        """Reprograma las filas con backoff exponencial según sus intentos."""
+        ids = [ids] if isinstance(ids, int) else list(ids)
+        if not ids:
+            return
+        ahora = time.time()
+        with self._lock:
+            for fila_id in ids:
+                fila = self._db.execute("SELECT intentos FROM pendientes WHERE id = ?", (fila_id,)).fetchone()
+                if fila is None:
+                    continue
+                self._db.execute("UPDATE pendientes SET intentos = ?, proximo = ? WHERE id = ?",
+                                 (fila[0] + 1, ahora + self._espera(fila[0]), fila_id))
+            self.reintentos += len(ids)
+
+    def contar(self, tipo=None):
+        with self._lock:
+            if tipo is None:
+                return self._db.execute("SELECT COUNT(*) FROM pendientes").fetchone()[0]
+            return self._db.execute("SELECT COUNT(*) FROM pendientes WHERE tipo = ?", (tipo,)).fetchone()[0]
+
+    def metricas(self):
+        with self._lock:
+            por_tipo = dict(self._db.execute("SELECT tipo, COUNT(*) FROM pendientes GROUP BY tipo").fetchall())
+            usado = self._db.execute("SELECT COALESCE(SUM(bytes), 0) FROM pendientes").fetchone()[0]
+        return {
+            "pendientes": sum(por_tipo.values()),
+            "alertas_pendientes": por_tipo.get("alerta", 0),
+            "influx_pendientes": por_tipo.get("influx", 0),
+            "mb": round(usado / (1024 * 1024), 2),
+            "guardados": self.guardados,
+            "entregados": self.entregados,
+            "reintentos": self.reintentos,
+            "descartados": self.descartados,
+        }
+
+    def cerrar(self):
+        with self._lock:
+            self._db.close()
+
+
+class DrenadorBandeja(threading.Thread):
+    def __init__(self, bandeja, manejadores, intervalo=5.0, backoff_max=600.0):
+        """
+        Hilo que vacía la bandeja cuando hay conexión.
+
+        Args:
+            bandeja (BandejaSalida): De dónde leer.
+            manejadores (dict): tipo -> (funcion, lote, por_minuto). `funcion`
+                recibe una lista de Pendiente y devuelve los ids entregados (o la
+                tupla (entregados, sin_intentar) si se cortó antes de probar todas);
+                `lote` es el máximo por llamada y `por_minuto` el límite de ritmo
+                (None = sin límite).
+            intervalo (float): Espera entre vueltas cuando no hay nada listo.
+            backoff_max (float): Tope de la pausa de un tipo tras fallos seguidos.
+        """
+        super().__init__(name="bandeja", daemon=True)
+        self.bandeja = bandeja
+        self.manejadores = manejadores
+        self.intervalo = intervalo
+        self.backoff_max = backoff_max
+        self._detener = threading.Event()
+        # Por tipo: fallos seguidos, pausa hasta, y cubeta de fichas para el ritmo
+        self._fallos = {tipo: 0 for tipo in manejadores}
+        self._pausa = {tipo: 0.0 for tipo in manejadores}
+        self._fichas = {tipo: float(m[2] or 0) for tipo, m in manejadores.items()}
+        self._t_fichas = time.monotonic()
+
+    def _recargar_fichas(self):
+        ahora = time.monotonic()
+        transcurrido = ahora - self._t_fichas
+        self._t_fichas = ahora
+        for tipo, (_, _, por_minuto) in self.manejadores.items():
+            if por_minuto:
+                self._fichas[tipo] = min(por_minuto, self._fichas[tipo] + transcurrido * por_minuto / 60.0)
+
+    def _vuelta(self):
+        """Una pasada por cada tipo. Devuelve True si entregó algo."""
+        self._recargar_fichas()
+        hubo = False
+        for tipo, (funcion, lote, por_minuto) in self.manejadores.items():
+            if time.monotonic() < self._pausa[tipo]:
+                continue
+            limite = lote if not por_minuto else min(lote, int(self._fichas[tipo]))
+            if limite <= 0:
+                continue
+            filas = self.bandeja.tomar(tipo, limite)
+            if not filas:
+                continue
+            try:
+                resultado = funcion(filas)
+            except Exception as e:
+                print(f"❌ Error reenviando {tipo}: {e}")
+                resultado = ()
+            entregados, sin_intentar = resultado if isinstance(resultado, tuple) else (resultado, ())
+            entregados, sin_intentar = set(entregados), set(sin_intentar) - set(entregados)
+            self.bandeja.confirmar([f.id for f in filas if f.id in entregados])
+            # Las que no se probaron vuelven tal cual: ni intento ni backoff
+            self.bandeja.soltar([f.id for f in filas if f.id in sin_intentar])
+            fallidos = [f.id for f in filas if f.id not in entregados and f.id not in sin_intentar]
+            self.bandeja.fallo(fallidos)
+            if por_minuto:
+                self._fichas[tipo] -= len(filas) - len(sin_intentar)
+            if entregados:
+                hubo = True
+                pendientes = len(fallidos) + len(sin_intentar)
+                print(f"📮 Bandeja: {len(entregados)} {tipo} reenviados"
+                      + (f", {pendientes} siguen pendientes" if pendientes else ""))
+            if fallidos:
+                # Lo más probable es que no haya red: no insistir con el resto del backlog
+                self._fallos[tipo] += 1
+                espera = min(self.backoff_max, self.intervalo * (2 ** self._fallos[tipo]))
+                self._pausa[tipo] = time.monotonic() + espera * random.uniform(0.8, 1.2)
+            else:
+                self._fallos[tipo] = 0
+        return hubo
+
+    def run(self):
+        while not self._detener.is_set():
+            # Con backlog y conexión se sigue de largo (limitado por el ritmo)
+            if not self._vuelta():
+                self._detener.wait(self.intervalo)
+
+    def detener(self):
+        self._detener.set()
@@ -3,6 +3,7 @@ import requests
 import datetime
 import os
 from dotenv import load_dotenv
+from utils.transporte import TRANSPORTE
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -17,12 +18,17 @@ REPO_NAME = os.getenv("GITHUB_REPO_NAME", "SISTEMA_MONITOREO")
 # Carpeta donde se guardarán las imágenes dentro del repo
 TARGET_FOLDER = "images/capturas"
 
-def subir_a_github(ruta_imagen):
+# API de GitHub (se puede apuntar a un servidor local para benchmarks)
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")
+
+def subir_a_github(imagen, nombre_archivo=None):
     """
     Sube una imagen al repositorio del proyecto y devuelve la URL RAW pública.
     
     Args:
-        ruta_imagen (str): Ruta local de la imagen
+        imagen (str | bytes | memoryview): Ruta local de la imagen, o el JPEG ya
+            codificado en memoria (cv2.imencode), que se sube sin pasar por disco
+        nombre_archivo (str, optional): Nombre en el repo (por defecto deteccion_<fecha>.jpg)
     
     Returns:
         str: URL pública de la imagen o None si falla
@@ -31,27 +37,31 @@ def subir_a_github(ruta_imagen):
         print("❌ ERROR: No se encontró la variable de entorno GITHUB_TOKEN.")
         return None
 
-    # Leer la imagen en binario
-    try:
-        with open(ruta_imagen, "rb") as f:
-            contenido = f.read()
-    except FileNotFoundError:
-        print(f"❌ Error: Archivo no encontrado '{ruta_imagen}'")
-        return None
-    except Exception as e:
-        print(f"❌ Error leyendo imagen '{ruta_imagen}': {e}")
-        return None
+    if isinstance(imagen, str):
+        # Leer la imagen en binario
+        try:
+            with open(imagen, "rb") as f:
+                contenido = f.read()
+        except FileNotFoundError:
+            print(f"❌ Error: Archivo no encontrado '{imagen}'")
+            return None
+        except Exception as e:
+            print(f"❌ Error leyendo imagen '{imagen}': {e}")
+            return None
+    else:
+        contenido = imagen
 
-    # Codificar la imagen a base64
+    # Codificar la imagen a base64 (acepta bytes o un memoryview sin copiarlo antes)
     b64 = base64.b64encode(contenido).decode("utf-8")
 
     # Crear nombre único basado en timestamp
-    fecha = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    nombre_archivo = f"deteccion_{fecha}.jpg"
+    if nombre_archivo is None:
+        fecha = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        nombre_archivo = f"deteccion_{fecha}.jpg"
 
     # URL de la API de GitHub para crear archivo
     url = (
-        f"https://api.github.com/repos/{REPO_OWNER}/"
+        f"{GITHUB_API_URL}/repos/{REPO_OWNER}/"
         f"{REPO_NAME}/contents/{TARGET_FOLDER}/{nombre_archivo}"
     )
 
@@ -70,7 +80,7 @@ def subir_a_github(ruta_imagen):
 
     # Intentar subir archivo
     try:
-        r = requests.put(url, json=data, headers=headers, timeout=30)
+        r = TRANSPORTE.put(url, ruta="subida", json=data, headers=headers)
 
         if r.status_code in (200, 201):
             print(f"✅ Imagen subida a GitHub correctamente: {nombre_archivo}")
@@ -86,7 +96,7 @@ def subir_a_github(ruta_imagen):
         elif r.status_code == 422:
             # El archivo ya existe, intentar actualizarlo
             print("⚠️ El archivo ya existe, intentando actualizar...")
-            return actualizar_imagen_github(ruta_imagen, url, headers, b64, nombre_archivo)
+            return actualizar_imagen_github(url, headers, b64, nombre_archivo)
         
         else:
             print(f"❌ Error subiendo imagen a GitHub:")
@@ -104,12 +114,11 @@ def subir_a_github(ruta_imagen):
         print(f"❌ Error inesperado subiendo a GitHub: {e}")
         return None
 
-def actualizar_imagen_github(ruta_imagen, url, headers, b64, nombre_archivo):
+def actualizar_imagen_github(url, headers, b64, nombre_archivo):
     """
     Actualiza una imagen existente en GitHub
     
     Args:
-        ruta_imagen (str): Ruta local
         url (str): URL de la API
         headers (dict): Headers de la petición
         b64 (str): Contenido en base64
@@ -120,7 +129,7 @@ def actualizar_imagen_github(ruta_imagen, url, headers, b64, nombre_archivo):
     """
     try:
         # Obtener SHA del archivo existente
-        r_get = requests.get(url, headers=headers, timeout=10)
+        r_get = TRANSPORTE.get(url, ruta="github", headers=headers)
         
         if r_get.status_code == 200:
             sha = r_get.json().get("sha")
@@ -133,7 +142,7 @@ def actualizar_imagen_github(ruta_imagen, url, headers, b64, nombre_archivo):
                 "branch": "main"
             }
             
-            r_put = requests.put(url, json=data, headers=headers, timeout=30)
+            r_put = TRANSPORTE.put(url, ruta="subida", json=data, headers=headers)
             
             if r_put.status_code in (200, 201):
                 print(f"✅ Imagen actualizada en GitHub: {nombre_archivo}")
@@ -195,13 +204,13 @@ def test_conexion():
         return False
     
     try:
-        url = f"https://api.github.com/repos/{REPO_OWNER}/{REPO_NAME}"
+        url = f"{GITHUB_API_URL}/repos/{REPO_OWNER}/{REPO_NAME}"
         headers = {
             "Authorization": f"Bearer {GITHUB_TOKEN}",
             "Accept": "application/vnd.github+json"
         }
         
-        r = requests.get(url, headers=headers, timeout=10)
+        r = TRANSPORTE.get(url, ruta="github", headers=headers)
         
         if r.status_code == 200:
             repo_data = r.json()
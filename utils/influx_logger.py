@@ -2,6 +2,7 @@
 InfluxDB Logger para enviar métricas de detecciones - Ñawi Apu
 """
 import os
+import time
 from datetime import datetime
 from dotenv import load_dotenv
 from influxdb_client import InfluxDBClient, Point, WritePrecision
@@ -14,10 +15,20 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_DIR = os.path.abspath(os.path.join(BASE_DIR, ".."))
 load_dotenv(os.path.join(PROJECT_DIR, ".env"))
 
+# Prioridad en la bandeja de salida si la escritura falla (más alta = se descarta último)
+PRIORIDADES = {"log_detection": 1, "log_suppressed": 0, "log_pipeline_perf": 0}
+
+def _fecha(timestamp):
+    return datetime.utcfromtimestamp(timestamp)
+
 class InfluxLogger:
-    def __init__(self):
+    def __init__(self, bandeja=None):
         """
         Inicializa el cliente de InfluxDB usando variables de entorno
+
+        Args:
+            bandeja (BandejaSalida, optional): Donde guardar lo que no se pudo
+                escribir, para reintentarlo con reintentar().
         """
         self.config = {
             'url': os.getenv('INFLUXDB_URL'),
@@ -27,6 +38,7 @@ class InfluxLogger:
         }
         self.client = None
         self.write_api = None
+        self.bandeja = bandeja
         self._connect()
     
     def _connect(self):
@@ -47,14 +59,47 @@ class InfluxLogger:
             print(f"❌ Error conectando a InfluxDB: {e}")
             self.client = None
     
-    def log_detection(self, species, count, confidence, location="costa_norte", image_path=None):
+    def _pendiente(self, metodo, argumentos):
+        """Guarda en la bandeja de salida una escritura que no se pudo hacer."""
+        if self.bandeja is None:
+            return
+        try:
+            self.bandeja.guardar("influx", {"metodo": metodo, "argumentos": argumentos},
+                                 prioridad=PRIORIDADES.get(metodo, 0))
+            print(f"📮 {metodo} guardado en la bandeja de salida para reintentar.")
+        except Exception as e:
+            print(f"❌ Error guardando en la bandeja de salida: {e}")
+
+    def _escribir(self, registros):
+        self.write_api.write(
+            bucket=self.config['bucket'],
+            org=self.config['org'],
+            record=registros
+        )
+
+    def _conectado(self):
+        if not self.client:
+            self._connect()
+        return self.client is not None
+
+    def log_detection(self, species, count, confidence, location="costa_norte", image_path=None,
+                      unique_count=None, timestamp=None):
         """
         Registra una detección en InfluxDB con logs detallados
         """
+        argumentos = {
+            "species": species,
+            "count": int(count),
+            "confidence": float(confidence),
+            "location": location,
+            "image_path": str(image_path) if image_path else None,
+            "unique_count": int(unique_count) if unique_count is not None else None,
+            "timestamp": timestamp or time.time(),
+        }
         if not self.client:
             print("⚠️ InfluxDB no está conectado. Intentando reconectar...")
-            self._connect()
-            if not self.client:
+            if not self._conectado():
+                self._pendiente("log_detection", argumentos)
                 return False
         
         # --- Lógica extra para Grafana (Agrupación) ---
@@ -68,38 +113,177 @@ class InfluxLogger:
         print(f"   Species: '{species}' (Type: {tipo_evento})")
         print(f"   Count: {count}")
         print(f"   Conf: {confidence:.2f}")
-        print(f"   Time: {datetime.utcnow()}")
+        print(f"   Time: {_fecha(argumentos['timestamp'])}")
         print(f"================================\n")
         
         try:
-            point = (
-                Point("wildlife_detection")
-                .tag("species", species)
-                .tag("type", tipo_evento)  # Importante para tus filtros de Grafana
-                .tag("location", location)
-                .tag("device", "raspberry_pi_5")
-                .field("count", int(count))
-                .field("confidence", float(confidence))
-                .field("detected", 1)
-                .time(datetime.utcnow(), WritePrecision.NS)
-            )
-            
-            if image_path:
-                point.field("image_path", str(image_path))
-            
-            self.write_api.write(
-                bucket=self.config['bucket'],
-                org=self.config['org'],
-                record=point
-            )
-            
+            self._escribir(self._punto_deteccion(**argumentos))
             print(f"✅ Dato registrado correctamente en la nube.")
             return True
             
         except Exception as e:
             print(f"❌ Error escribiendo a InfluxDB: {e}")
+            self._pendiente("log_detection", argumentos)
             return False
+
+    def _punto_deteccion(self, species, count, confidence, location, image_path, unique_count, timestamp):
+        tipo_evento = "amenaza" if species in ["invasores", "amenaza_generica"] else "fauna"
+        point = (
+            Point("wildlife_detection")
+            .tag("species", species)
+            .tag("type", tipo_evento)  # Importante para tus filtros de Grafana
+            .tag("location", location)
+            .tag("device", "raspberry_pi_5")
+            .field("count", int(count))
+            .field("confidence", float(confidence))
+            .field("detected", 1)
+            .time(_fecha(timestamp), WritePrecision.NS)
+        )
+        if image_path:
+            point.field("image_path", str(image_path))
+        if unique_count is not None:
+            point.field("unique_count", int(unique_count))
+        return point
     
+    def log_suppressed(self, species, count, confidence, positives, duration_s, camera=None,
+                       location="costa_norte", timestamp=None):
+        """
+        Registra un episodio que no pasó la confirmación temporal
+        (measurement suppressed_detection): falsos positivos que no se alertaron.
+        """
+        argumentos = {
+            "species": species,
+            "count": int(count),
+            "confidence": float(confidence),
+            "positives": int(positives),
+            "duration_s": float(duration_s),
+            "camera": camera,
+            "location": location,
+            "timestamp": timestamp or time.time(),
+        }
+        if not self._conectado():
+            self._pendiente("log_suppressed", argumentos)
+            return False
+
+        try:
+            self._escribir(self._punto_suprimido(**argumentos))
+            return True
+        except Exception as e:
+            print(f"❌ Error escribiendo suprimidos a InfluxDB: {e}")
+            self._pendiente("log_suppressed", argumentos)
+            return False
+
+    def _punto_suprimido(self, species, count, confidence, positives, duration_s, camera, location,
+                         timestamp):
+        point = (
+            Point("suppressed_detection")
+            .tag("species", species or "desconocida")
+            .tag("location", location)
+            .tag("device", "raspberry_pi_5")
+            .field("count", int(count))
+            .field("confidence", float(confidence))
+            .field("positives", int(positives))
+            .field("duration_s", float(duration_s))
+            .field("suppressed", 1)
+            .time(_fecha(timestamp), WritePrecision.NS)
+        )
+        if camera:
+            point.tag("camera", camera)
+        return point
+
+    def log_pipeline_perf(self, metricas, location="costa_norte", timestamp=None):
+        """
+        Registra las métricas de rendimiento del pipeline (measurement pipeline_perf).
+
+        Args:
+            metricas (dict): Salida de MetricasRendimiento.extraer() con
+                "etapas", "contadores", "medidores" e "intervalo_s".
+        """
+        argumentos = {"metricas": metricas, "location": location, "timestamp": timestamp or time.time()}
+        puntos = self._puntos_rendimiento(**argumentos)
+        if not puntos:
+            return True
+        if not self._conectado():
+            self._pendiente("log_pipeline_perf", argumentos)
+            return False
+
+        try:
+            self._escribir(puntos)
+            print(f"📈 Métricas de rendimiento enviadas ({len(puntos)} puntos).")
+            return True
+        except Exception as e:
+            print(f"❌ Error escribiendo métricas a InfluxDB: {e}")
+            self._pendiente("log_pipeline_perf", argumentos)
+            return False
+
+    def _puntos_rendimiento(self, metricas, location, timestamp):
+        ahora = _fecha(timestamp)
+        puntos = []
+        # Un punto por etapa con su distribución de tiempos
+        for etapa, resumen in metricas.get("etapas", {}).items():
+            point = (
+                Point("pipeline_perf")
+                .tag("stage", etapa)
+                .tag("location", location)
+                .tag("device", "raspberry_pi_5")
+                .time(ahora, WritePrecision.NS)
+            )
+            for campo, valor in resumen.items():
+                point.field(campo, int(valor) if campo == "count" else float(valor))
+            puntos.append(point)
+
+        # Contadores del intervalo y medidores (último valor) en un punto aparte
+        for tipo in ("contadores", "medidores"):
+            valores = metricas.get(tipo, {})
+            if not valores:
+                continue
+            point = (
+                Point("pipeline_perf")
+                .tag("stage", tipo)
+                .tag("location", location)
+                .tag("device", "raspberry_pi_5")
+                .time(ahora, WritePrecision.NS)
+            )
+            for campo, valor in valores.items():
+                point.field(campo, float(valor))
+            puntos.append(point)
+        return puntos
+
+    def reintentar(self, filas):
+        """
+        Reescribe de una vez (una sola escritura) lo guardado en la bandeja de
+        salida, con la hora original de cada registro.
+
+        Args:
+            filas (list): Pendiente de tipo "influx".
+
+        Returns:
+            list: Ids entregados (todos o ninguno).
+        """
+        if not self._conectado():
+            return []
+        constructores = {
+            "log_detection": self._punto_deteccion,
+            "log_suppressed": self._punto_suprimido,
+            "log_pipeline_perf": self._puntos_rendimiento,
+        }
+        puntos, ids = [], []
+        for fila in filas:
+            ids.append(fila.id)
+            constructor = constructores.get(fila.datos.get("metodo"))
+            if constructor is None:
+                continue  # de una versión vieja: se confirma para no arrastrarla para siempre
+            salida = constructor(**fila.datos["argumentos"])
+            puntos.extend(salida if isinstance(salida, list) else [salida])
+        if puntos:
+            try:
+                self._escribir(puntos)
+            except Exception as e:
+                print(f"❌ Error reenviando a InfluxDB: {e}")
+                return []
+        print(f"📈 {len(ids)} registros atrasados enviados a InfluxDB ({len(puntos)} puntos).")
+        return ids
+
     def close(self):
         """Cierra la conexión con InfluxDB"""
         if self.client:
@@ -0,0 +1,170 @@
+"""
+Métricas de rendimiento del pipeline - Ñawi Apu
+
+Contadores e histogramas en memoria, baratos de actualizar desde cualquier
+hilo (un lock corto y un bisect por medición). Cada cierto tiempo se vuelcan
+a InfluxDB como measurement `pipeline_perf`, para ver en Grafana en qué se
+va el tiempo en cada Raspberry del campo.
+
+    from utils.perf_metrics import METRICAS
+
+    with METRICAS.medir("subida"):
+        subir_a_github(...)
+    METRICAS.registrar("inferencia", segundos)
+    METRICAS.contar("alertas_descartadas")
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# Etapas del camino caliente, en orden (se usan para ordenar los reportes)
+ETAPAS = ("captura", "preprocesado", "inferencia", "postprocesado",
+          "anotacion", "codificacion", "subida", "notificacion")
+
+# Límites superiores de los buckets en segundos: 0.1 ms ... ~80 s, creciendo x1.25
+LIMITES = [0.0001 * (1.25 ** i) for i in range(62)]
+
+
+class Histograma:
+    __slots__ = ("cuentas", "n", "suma", "maximo")
+
+    def __init__(self):
+        self.cuentas = [0] * (len(LIMITES) + 1)
+        self.n = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def agregar(self, segundos):
+        self.cuentas[bisect.bisect_left(LIMITES, segundos)] += 1
+        self.n += 1
+        self.suma += segundos
+        if segundos > self.maximo:
+            self.maximo = segundos
+
+    def percentil(self, p):
+        """Aproximación por el límite superior del bucket (segundos)."""
+        if self.n == 0:
+            return 0.0
+        objetivo = p / 100 * self.n
+        acumulado = 0
+        for i, cuenta in enumerate(self.cuentas):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return min(LIMITES[i], self.maximo) if i < len(LIMITES) else self.maximo
+        return self.maximo
+
+    def resumen(self):
+        return {
+            "count": self.n,
+            "mean_ms": round(self.suma / self.n * 1000, 2) if self.n else 0.0,
+            "p50_ms": round(self.percentil(50) * 1000, 2),
+            "p95_ms": round(self.percentil(95) * 1000, 2),
+            "p99_ms": round(self.percentil(99) * 1000, 2),
+            "max_ms": round(self.maximo * 1000, 2),
+        }
+
+
+class MetricasRendimiento:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}
+        self._contadores = {}
+        self._medidores = {}
+
+    def registrar(self, etapa, segundos):
+        with self._lock:
+            histograma = self._histogramas.get(etapa)
+            if histograma is None:
+                histograma = self._histogramas[etapa] = Histograma()
+            histograma.agregar(segundos)
+
+    @contextmanager
+    def medir(self, etapa):
+        inicio = time.monotonic()
+        try:
+            yield
+        finally:
+            self.registrar(etapa, time.monotonic() - inicio)
+
+    def contar(self, nombre, cantidad=1):
+        with self._lock:
+            self._contadores[nombre] = self._contadores.get(nombre, 0) + cantidad
+
+    def fijar(self, nombre, valor):
+        """Medidor: guarda el último valor (profundidad de cola, skip actual, etc.)."""
+        with self._lock:
+            self._medidores[nombre] = valor
+
+    def fijar_varios(self, prefijo, valores):
+        """Fija como medidores todos los valores numéricos de un dict de métricas."""
+        with self._lock:
+            for clave, valor in valores.items():
+                if isinstance(valor, bool):
+                    valor = int(valor)
+                if isinstance(valor, (int, float)):
+                    self._medidores[f"{prefijo}_{clave}"] = valor
+
+    def extraer(self, reiniciar=True):
+        """
+        Foto de todas las métricas.
+
+        Args:
+            reiniciar (bool): Vaciar histogramas y contadores (los medidores se conservan).
+
+        Returns:
+            dict: {"etapas": {etapa: resumen}, "contadores": {...}, "medidores": {...}}
+        """
+        with self._lock:
+            histogramas = self._histogramas
+            contadores = dict(self._contadores)
+            medidores = dict(self._medidores)
+            if reiniciar:
+                self._histogramas = {}
+                self._contadores = {}
+        orden = {etapa: i for i, etapa in enumerate(ETAPAS)}
+        etapas = {etapa: histogramas[etapa].resumen()
+                  for etapa in sorted(histogramas, key=lambda e: (orden.get(e, len(orden)), e))}
+        return {"etapas": etapas, "contadores": contadores, "medidores": medidores}
+
+
+# Instancia compartida por todo el proceso
+METRICAS = MetricasRendimiento()
+
+
+class ReportePeriodico(threading.Thread):
+    def __init__(self, influx, intervalo=60.0, metricas=METRICAS, extras=()):
+        """
+        Hilo que vuelca las métricas a InfluxDB cada `intervalo` segundos.
+
+        Args:
+            influx (InfluxLogger): Cliente con log_pipeline_perf().
+            extras (iterable): Callables (influx) -> None que se corren en cada
+                volcado, para otros registros que no deben bloquear la visión.
+        """
+        super().__init__(name="reporte-perf", daemon=True)
+        self.influx = influx
+        self.intervalo = intervalo
+        self.metricas = metricas
+        self.extras = list(extras)
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.wait(self.intervalo):
+            self.volcar()
+
+    def volcar(self):
+        foto = self.metricas.extraer()
+        foto["intervalo_s"] = self.intervalo
+        try:
+            self.influx.log_pipeline_perf(foto)
+        except Exception as e:
+            print(f"⚠️ No se pudieron enviar métricas de rendimiento: {e}")
+        for extra in self.extras:
+            try:
+                extra(self.influx)
+            except Exception as e:
+                print(f"⚠️ Error en volcado extra a InfluxDB: {e}")
+
+    def detener(self):
+        self._detener.set()
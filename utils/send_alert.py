@@ -1,8 +1,13 @@
 import os
 import cv2
+import time
 import requests
 import datetime
+import threading
+from collections import deque
 from utils.github_upload import subir_a_github
+from utils.perf_metrics import METRICAS
+from utils.transporte import TRANSPORTE
 
 # Configuración
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -15,19 +20,235 @@ os.makedirs(IMAGES_DIR, exist_ok=True)
 RAILWAY_URL = os.environ.get("RAILWAY_URL")
 ALERTA_KEY = os.environ.get("ALERTA_KEY", "tu_clave_secreta_123")
 
-def guardar_imagen(frame):
-    fecha = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    nombre = f"deteccion_{fecha}.jpg"
+# El JPEG se codifica en memoria y va directo a GitHub; la copia local en la SD
+# es opcional y se escribe en segundo plano (ARCHIVAR_CAPTURAS=0 la desactiva)
+JPEG_CALIDAD = 90
+ARCHIVAR_LOCAL = os.environ.get("ARCHIVAR_CAPTURAS", "1") != "0"
+
+def codificar_jpeg(frame, calidad=JPEG_CALIDAD):
+    """
+    Codifica el frame a JPEG en memoria, sin escribir a disco.
+
+    Returns:
+        memoryview: Bytes del JPEG (vista sobre el buffer de cv2.imencode), o None si falla.
+    """
+    try:
+        with METRICAS.medir("codificacion"):
+            ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, calidad])
+        return memoryview(buffer) if ok else None
+    except Exception as e:
+        print(f"❌ Error codificando imagen: {e}")
+        return None
+
+def guardar_jpeg(nombre, datos):
+    """Escribe un JPEG ya codificado en images/capturas (sin volver a codificar)."""
     ruta = os.path.join(IMAGES_DIR, nombre)
     try:
-        cv2.imwrite(ruta, frame)
+        with open(ruta, "wb") as f:
+            f.write(datos)
         print(f"💾 Imagen guardada localmente: {nombre}")
         return ruta
     except Exception as e:
         print(f"❌ Error guardando imagen local: {e}")
         return None
 
-def enviar_alerta(especie, cantidad, frame, es_amenaza=False, mensaje_prefix=None):
+class ArchivoLocal:
+    """Hilo que guarda los JPEG en la SD fuera del camino de la alerta (cola acotada)."""
+
+    def __init__(self, capacidad=16):
+        self._cola = deque(maxlen=capacidad)
+        self._cond = threading.Condition()
+        self._hilo = None
+        self._escribiendo = False
+        self.guardadas = 0
+        self.descartadas = 0
+
+    def archivar(self, nombre, datos):
+        with self._cond:
+            if len(self._cola) == self._cola.maxlen:
+                self.descartadas += 1  # SD lenta o llena: se pierde la copia local más vieja
+            self._cola.append((nombre, datos))
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._run, name="archivo-local", daemon=True)
+                self._hilo.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._cola)
+                nombre, datos = self._cola.popleft()
+                self._escribiendo = True
+            try:
+                if guardar_jpeg(nombre, datos):
+                    self.guardadas += 1
+            finally:
+                with self._cond:
+                    self._escribiendo = False
+                    self._cond.notify_all()
+
+    def vaciar(self, timeout=None):
+        """Espera a que se escriban los JPEG pendientes. Devuelve False si venció el timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._cola and not self._escribiendo, timeout)
+
+ARCHIVO = ArchivoLocal()
+
+# Ventana de agrupación por especie (segundos): la primera alerta de la especie y
+# cámara sale al momento; las que llegan dentro de la ventana salen al cerrarla
+# como un solo resumen con el mejor frame.
+# 0 = sin agrupar (las amenazas nunca esperan).
+VENTANAS_AGRUPACION = {"gaviotines": 120, "tortugas": 60, "invasores": 0}
+
+def _duracion(segundos):
+    segundos = int(round(segundos))
+    if segundos < 60:
+        return f"{segundos} s"
+    return f"{segundos // 60} min {segundos % 60:02d} s"
+
+class AgrupadorAlertas:
+    """
+    Junta ráfagas de alertas (una bandada que entra y sale de cuadro dispara una
+    alerta en cada vencimiento del cooldown). La primera alerta abre la ventana
+    y se envía enseguida; las siguientes se juntan en una sola (cantidad máxima
+    y, si tienen más confianza, el frame). Al vencer, si hubo seguimiento, sale
+    esa alerta con el resumen de la ráfaga.
+
+    Lo usa el worker de DespachadorAlertas (un solo hilo).
+    """
+
+    def __init__(self, ventanas=None, ventana_defecto=0):
+        """
+        Args:
+            ventanas (dict, optional): especie -> segundos (por defecto VENTANAS_AGRUPACION).
+            ventana_defecto (float): Para especies que no están en `ventanas`.
+        """
+        self.ventanas = dict(VENTANAS_AGRUPACION if ventanas is None else ventanas)
+        self.ventana_defecto = ventana_defecto
+        # (especie, camara) -> [seguimiento, t_inicio, t_ultima, alertas, maximo, confianza_max];
+        # maximo y confianza_max incluyen a la primera alerta, que ya salió
+        self._grupos = {}
+        self.cerrado = False
+
+        # Métricas
+        self.agrupadas = 0
+        self.resumenes = 0
+
+    def ventana(self, especie):
+        return self.ventanas.get(especie, self.ventana_defecto)
+
+    def agregar(self, alerta):
+        """
+        Suma una alerta a su ventana.
+
+        Args:
+            alerta (AlertaPendiente): La primera de cada ventana no se retiene; de
+                las siguientes se conserva la primera y se actualiza en el lugar
+                con lo mejor de las demás.
+
+        Returns:
+            bool: False si la alerta no se agrupa (hay que enviarla ya): sin
+                ventana, amenaza, o la primera de su ventana.
+        """
+        if self.cerrado or alerta.es_amenaza or self.ventana(alerta.especie) <= 0:
+            return False
+        ahora = time.monotonic()
+        clave = (alerta.especie, alerta.camara)
+        grupo = self._grupos.get(clave)
+        if grupo is None:
+            self._grupos[clave] = [None, ahora, ahora, 1, alerta.cantidad, alerta.confianza]
+            return False
+
+        grupo[2] = ahora
+        grupo[3] += 1
+        grupo[4] = max(grupo[4], alerta.cantidad)
+        if alerta.confianza is not None:
+            grupo[5] = max(grupo[5] or 0.0, alerta.confianza)
+        self.agrupadas += 1
+        base = grupo[0]
+        if base is None:
+            grupo[0] = alerta
+            return True
+        base.cantidad = max(base.cantidad, alerta.cantidad)
+        if alerta.unicos is not None:
+            base.unicos = max(base.unicos or 0, alerta.unicos)
+        if (alerta.confianza or 0.0) > (base.confianza or 0.0):
+            base.frame = alerta.frame
+            base.confianza = alerta.confianza
+        return True
+
+    def proximo_vencimiento(self):
+        """Instante (time.monotonic) en que vence la primera ventana, o None."""
+        if not self._grupos:
+            return None
+        return min(g[1] + self.ventana(especie) for (especie, _), g in self._grupos.items())
+
+    def vencidos(self, todos=False):
+        """
+        Cierra las ventanas vencidas (o todas).
+
+        Returns:
+            list: Resúmenes listos para enviar (texto en `resumen`), uno por
+                ventana que tuvo alertas después de la primera.
+        """
+        ahora = time.monotonic()
+        salida = []
+        for clave, (alerta, t_inicio, t_ultima, cantidad, maximo, confianza_max) in list(self._grupos.items()):
+            if not todos and ahora - t_inicio < self.ventana(clave[0]):
+                continue
+            del self._grupos[clave]
+            if alerta is None:
+                continue  # Solo la primera, que ya salió
+            # El frame es el mejor de las retenidas; cantidad y confianza, las de toda la ráfaga
+            alerta.cantidad = maximo
+            alerta.confianza = confianza_max
+            confianza = f", confianza máx. {confianza_max:.0%}" if confianza_max is not None else ""
+            alerta.resumen = (f"📊 _Resumen: {cantidad} detecciones en {_duracion(t_ultima - t_inicio)}, "
+                              f"máximo {maximo} a la vez{confianza}_")
+            self.resumenes += 1
+            salida.append(alerta)
+        return salida
+
+    def cerrar(self):
+        """Deja de agrupar (apagado) y devuelve lo pendiente sin esperar las ventanas."""
+        self.cerrado = True
+        return self.vencidos(todos=True)
+
+    def pendientes(self):
+        return len(self._grupos)
+
+    def metricas(self):
+        return {
+            "ventanas_abiertas": self.pendientes(),
+            "agrupadas": self.agrupadas,
+            "resumenes": self.resumenes,
+        }
+
+# Un reenvío desde la bandeja de salida con más de este atraso lleva la hora real en el mensaje
+AVISO_REENVIO_S = 60
+
+def preparar_evidencia(frame):
+    """
+    Codifica el frame y deja la copia local en cola.
+
+    Returns:
+        tuple: (jpeg, nombre) — jpeg es None si no hay frame o falla la codificación.
+    """
+    nombre = f"deteccion_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
+    if frame is None:
+        return None, nombre
+    # Convertir a 3 canales si llega en BGRA (Picamera a veces da 4 canales)
+    if frame.shape[2] == 4:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+
+    print(f"📸 Procesando evidencia visual...")
+    jpeg = codificar_jpeg(frame)
+    if jpeg is not None and ARCHIVAR_LOCAL:
+        ARCHIVO.archivar(nombre, jpeg)
+    return jpeg, nombre
+
+def enviar_alerta(especie, cantidad, frame, es_amenaza=False, mensaje_prefix=None, individuos_unicos=None,
+                  jpeg=None, nombre_archivo=None, detectada=None, resumen=None, solo_texto=False):
     """
     Envía alerta a Railway.
     
@@ -37,6 +258,12 @@ def enviar_alerta(especie, cantidad, frame, es_amenaza=False, mensaje_prefix=Non
         frame (numpy array): La imagen.
         es_amenaza (bool): Si es True, activa formato de emergencia.
         mensaje_prefix (str, optional): Título personalizado desde detector.py.
+        individuos_unicos (int, optional): Animales distintos seguidos por el tracker.
+        jpeg (bytes, optional): Evidencia ya codificada (reemplaza a `frame`).
+        nombre_archivo (str, optional): Nombre en GitHub; los reintentos reusan el mismo.
+        detectada (float, optional): time.time() de la detección original (reenvíos).
+        resumen (str, optional): Línea extra bajo el título (ráfaga agrupada).
+        solo_texto (bool): No subir la imagen (amenazas: la foto va después con enviar_evidencia).
     """
 
     if not RAILWAY_URL:
@@ -44,20 +271,21 @@ def enviar_alerta(especie, cantidad, frame, es_amenaza=False, mensaje_prefix=Non
         return False
 
     # 1. Preparar Imagen
-    # Convertir a 3 canales si llega en BGRA (Picamera a veces da 4 canales)
-    if frame is not None and frame.shape[2] == 4:
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)    
-    
-    print(f"📸 Procesando evidencia visual...")
-    ruta_img = guardar_imagen(frame)
+    if jpeg is None:
+        jpeg, nombre = preparar_evidencia(frame)
+    else:
+        nombre = nombre_archivo or f"deteccion_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
     
-    # 2. Subir a la Nube (Con manejo de error)
+    # 2. Subir a la Nube (Con manejo de error): los mismos bytes, sin leerlos de la SD
     url_imagen = None
-    if ruta_img:
+    if solo_texto:
+        print("⚡ Alerta urgente: primero el texto, la foto va después.")
+    elif jpeg is not None:
         print("⬆️ Intentando subir a GitHub...")
-        url_imagen = subir_a_github(ruta_img)
+        with METRICAS.medir("subida"):
+            url_imagen = subir_a_github(jpeg, nombre)
     
-    if not url_imagen:
+    if not url_imagen and not solo_texto:
         print("⚠️ ADVERTENCIA: La imagen no se pudo subir. Se enviará solo texto.")
     
     # 3. Definir el Mensaje (Título)
@@ -81,6 +309,14 @@ def enviar_alerta(especie, cantidad, frame, es_amenaza=False, mensaje_prefix=Non
         especie_final = "amenaza" if es_amenaza else especie
         tipo_alerta = "amenaza" if es_amenaza else "deteccion"
 
+    if resumen:
+        mensaje_prefix = f"{mensaje_prefix}\n{resumen}"
+
+    # Si la alerta viene de la bandeja de salida, que se note que no es de ahora
+    if detectada is not None and time.time() - detectada > AVISO_REENVIO_S:
+        hora = datetime.datetime.fromtimestamp(detectada).strftime('%d/%m %H:%M')
+        mensaje_prefix = f"{mensaje_prefix}\n⏱️ _Detectada el {hora} (reenvío tras corte de conexión)_"
+
     # 4. Preparar Payload para Railway
     payload = {
         "especie": especie_final,
@@ -89,20 +325,60 @@ def enviar_alerta(especie, cantidad, frame, es_amenaza=False, mensaje_prefix=Non
         "tipo": tipo_alerta,
         "mensaje_prefix": mensaje_prefix 
     }
+    if individuos_unicos is not None:
+        payload["individuos"] = int(individuos_unicos)
     
+    # 5. Enviar Request
+    return _notificar(payload)
+
+def enviar_evidencia(especie, jpeg, nombre_archivo, es_amenaza=True, mensaje_prefix=None, detectada=None,
+                     clip=None):
+    """
+    Segunda parte de una alerta enviada solo con texto: sube la foto y la
+    manda como mensaje aparte. También entrega la hoja de contactos de un clip
+    de evidencia (`clip` es el archivo de video que quedó en la SD).
+
+    Returns:
+        bool: False si no se pudo subir o avisar (se reintenta desde la bandeja).
+    """
+    if not RAILWAY_URL:
+        print("❌ Error: RAILWAY_URL no configurada")
+        return False
+
+    print("⬆️ Subiendo evidencia de la alerta urgente...")
+    with METRICAS.medir("subida"):
+        url_imagen = subir_a_github(jpeg, nombre_archivo)
+    if not url_imagen:
+        print("⚠️ La evidencia no se pudo subir; se reintentará.")
+        return False
+
+    hora = datetime.datetime.fromtimestamp(detectada or time.time()).strftime('%H:%M:%S')
+    payload = {
+        "especie": "amenaza" if es_amenaza else especie,
+        "imagen": url_imagen,
+        "tipo": "evidencia",
+        "mensaje_prefix": mensaje_prefix or "🚨 *ALERTA DE SEGURIDAD* ⚠️",
+        "hora": hora
+    }
+    if clip:
+        payload["clip"] = clip
+    return _notificar(payload)
+
+def _notificar(payload):
+    """POST a Railway /alerta. True si el servidor avisó a los operadores."""
     headers = {
         "X-ALERTA-KEY": ALERTA_KEY,
         "Content-Type": "application/json"
     }
     
-    # 5. Enviar Request
     try:
-        response = requests.post(
-            f"{RAILWAY_URL}/alerta",
-            json=payload,
-            headers=headers,
-            timeout=10
-        )
+        with METRICAS.medir("notificacion"):
+            response = TRANSPORTE.post(
+                f"{RAILWAY_URL}/alerta",
+                ruta="alerta",
+                json=payload,
+                headers=headers
+            )
         
         if response.status_code == 200:
             data = response.json()
@@ -125,7 +401,6 @@ def enviar_alerta(especie, cantidad, frame, es_amenaza=False, mensaje_prefix=Non
 # Limpieza de imágenes antiguas
 def limpiar_imagenes_antiguas(dias=7):
     try:
-        import time
         limite = time.time() - (dias * 86400)
         eliminadas = 0
         
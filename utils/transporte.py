@@ -0,0 +1,179 @@
+"""
+Transporte HTTP compartido - Ñawi Apu
+
+Cada llamada con requests.get/put/post suelto abre una conexión nueva: en el
+enlace rural de la costa eso es un handshake TCP + TLS (varios cientos de ms)
+por consulta de modo, por subida a GitHub y por aviso a Railway. Aquí hay una
+sola sesión para todo el proceso, que mantiene las conexiones vivas en un pool
+por host, con timeouts y reintentos según la clase de ruta y contadores de
+solicitudes y bytes.
+
+    config -> consulta de modo a Railway (corta; el poller ya tiene su backoff)
+    alerta -> POST de alertas y evidencias a Railway
+    subida -> PUT de la foto a GitHub
+    github -> el resto de la API de GitHub (sha, prueba de conexión)
+
+Los errores son los de requests (requests.RequestException y compañía), así
+que el manejo de errores de quien llama no cambia.
+"""
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from utils.perf_metrics import METRICAS
+
+# Clase de ruta -> (timeout de conexión, timeout de lectura) en segundos
+TIMEOUTS = {
+    "config": (3.0, 3.0),
+    "alerta": (5.0, 10.0),
+    "subida": (5.0, 30.0),
+    "github": (5.0, 10.0),
+}
+TIMEOUT_POR_DEFECTO = (5.0, 10.0)
+
+# Clase de ruta -> reintentos dentro de la misma llamada
+REINTENTOS = {"config": 0, "alerta": 2, "subida": 2, "github": 2}
+
+# Respuestas que vale la pena reintentar (el servidor o el proxy no atendió)
+ESTADOS_REINTENTABLES = (429, 502, 503, 504)
+IDEMPOTENTES = ("GET", "HEAD", "PUT", "DELETE")
+
+
+def _largo(cuerpo):
+    if cuerpo is None:
+        return 0
+    if isinstance(cuerpo, str):
+        return len(cuerpo.encode("utf-8"))
+    try:
+        return len(cuerpo)
+    except TypeError:
+        return 0  # generador/archivo: no se cuenta
+
+
+def _sin_enviar(error):
+    """
+    True si la solicitud seguro no llegó al servidor: no se pudo abrir la
+    conexión (timeout de conexión, conexión rechazada, DNS). Un reset de una
+    conexión viva (RemoteDisconnected, ProtocolError) no entra: el servidor
+    pudo haber recibido y atendido el cuerpo antes de cortar.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError) or not error.args:
+        return False
+    causa = getattr(error.args[0], "reason", error.args[0])  # MaxRetryError -> causa real
+    return isinstance(causa, NewConnectionError)
+
+
+class Transporte:
+    def __init__(self, timeouts=None, reintentos=None, backoff=0.5, conexiones_por_host=4):
+        """
+        Args:
+            timeouts (dict, optional): Clase de ruta -> (conexión, lectura). Se mezcla con TIMEOUTS.
+            reintentos (dict, optional): Clase de ruta -> reintentos. Se mezcla con REINTENTOS.
+            backoff (float): Espera antes del primer reintento; se duplica en cada uno.
+            conexiones_por_host (int): Conexiones vivas por host (los hilos que
+                hablan con el mismo servidor a la vez: poller, alertas, bandeja).
+        """
+        self.timeouts = dict(TIMEOUTS)
+        self.timeouts.update(timeouts or {})
+        self.reintentos = dict(REINTENTOS)
+        self.reintentos.update(reintentos or {})
+        self.backoff = backoff
+
+        self.sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=conexiones_por_host)
+        self.sesion.mount("https://", adaptador)
+        self.sesion.mount("http://", adaptador)
+
+        # Métricas por clase de ruta
+        self._lock = threading.Lock()
+        self._contadores = {}
+
+    def _contar(self, ruta, **valores):
+        with self._lock:
+            contador = self._contadores.setdefault(ruta, {
+                "solicitudes": 0, "errores": 0, "reintentos": 0, "bytes_enviados": 0, "bytes_recibidos": 0})
+            for clave, valor in valores.items():
+                contador[clave] += valor
+
+    def solicitar(self, metodo, url, ruta="general", **kwargs):
+        """
+        Hace la solicitud con la sesión compartida.
+
+        Si no se pudo conectar se reintenta siempre: la solicitud no salió. El
+        resto de los errores de conexión (como una conexión viva que el servidor
+        cerró a mitad de camino), los timeouts de lectura y los 429/502/503/504
+        solo en métodos idempotentes, para no duplicar un POST /alerta que el
+        servidor sí atendió.
+
+        Args:
+            metodo (str): GET, POST, PUT...
+            ruta (str): Clase de ruta (timeouts, reintentos y contadores).
+            **kwargs: Lo mismo que requests (json, headers, params, timeout...).
+
+        Returns:
+            requests.Response: La última respuesta (puede ser un error HTTP).
+
+        Raises:
+            requests.RequestException: Si no hubo respuesta tras los reintentos.
+        """
+        metodo = metodo.upper()
+        kwargs.setdefault("timeout", self.timeouts.get(ruta, TIMEOUT_POR_DEFECTO))
+        reintentos = self.reintentos.get(ruta, 0)
+        idempotente = metodo in IDEMPOTENTES
+
+        intento = 0
+        while True:
+            t0 = time.monotonic()
+            try:
+                r = self.sesion.request(metodo, url, **kwargs)
+            except requests.RequestException as e:
+                reintentable = (_sin_enviar(e)
+                                or (idempotente and isinstance(e, (requests.ConnectionError, requests.Timeout))))
+                self._contar(ruta, solicitudes=1, errores=1)
+                if not reintentable or intento >= reintentos:
+                    raise
+            else:
+                METRICAS.registrar(f"http_{ruta}", time.monotonic() - t0)
+                self._contar(ruta, solicitudes=1, bytes_enviados=_largo(r.request.body),
+                             bytes_recibidos=len(r.content))
+                if r.status_code not in ESTADOS_REINTENTABLES or not idempotente or intento >= reintentos:
+                    return r
+                self._contar(ruta, errores=1)
+
+            intento += 1
+            self._contar(ruta, reintentos=1)
+            time.sleep(self.backoff * (2 ** (intento - 1)))
+
+    def get(self, url, ruta="general", **kwargs):
+        return self.solicitar("GET", url, ruta, **kwargs)
+
+    def post(self, url, ruta="general", **kwargs):
+        return self.solicitar("POST", url, ruta, **kwargs)
+
+    def put(self, url, ruta="general", **kwargs):
+        return self.solicitar("PUT", url, ruta, **kwargs)
+
+    def metricas(self):
+        """Contadores acumulados como {"<ruta>_<contador>": valor} (para METRICAS.fijar_varios)."""
+        with self._lock:
+            return {f"{ruta}_{clave}": valor
+                    for ruta, contador in sorted(self._contadores.items())
+                    for clave, valor in contador.items()}
+
+    def totales(self):
+        with self._lock:
+            totales = {"solicitudes": 0, "errores": 0, "reintentos": 0, "bytes_enviados": 0, "bytes_recibidos": 0}
+            for contador in self._contadores.values():
+                for clave, valor in contador.items():
+                    totales[clave] += valor
+            return totales
+
+    def cerrar(self):
+        self.sesion.close()
+
+
+# Instancia compartida por todo el proceso
+TRANSPORTE = Transporte()